@@ -0,0 +1,447 @@
+"""
+Benchmarks of the Project Version Manager.
+
+Generates synthetic projects in a temporary folder and times the core
+operations on them, without the GUI: a full save, an incremental save, a
+restore, an archive and an extraction. Each operation runs in a fresh
+interpreter, so the peak memory reported is its own, and each scenario
+runs several times, its median run being reported.
+
+    python concatcode_bench.py                      # the 1k scenarios
+    python concatcode_bench.py flat-10k deep-100k   # chosen scenarios
+    python concatcode_bench.py --save-baseline      # record the baseline
+
+Results are compared with the baseline JSON when one exists: an operation
+slower or bigger than its baseline by more than the tolerance is reported
+as a regression, and the exit code is 1. Differences under 50 ms or 8 MB
+are never reported.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+
+try:
+    import resource  # Peak memory, on Unix
+except ImportError:
+    resource = None
+
+import concatcode_core as core
+
+BASELINE_FILE = os.path.join(core.SCRIPT_DIR, core.BENCH_BASELINE_NAME)
+
+# Allowed slowdown or memory growth over the baseline before reporting a regression
+DEFAULT_TOLERANCE = 0.25
+# Differences below these are noise, whatever their share of the baseline
+MIN_REGRESSION_SECONDS = 0.05
+MIN_REGRESSION_BYTES = 8 * 1024 * 1024
+
+# Each scenario runs this many times; the median of the runs is reported
+DEFAULT_REPEAT = 3
+
+# Each scenario describes a synthetic project: its number of files, how deep
+# its folders nest, and how often a large file comes up among small ones
+SCENARIOS = {}
+for label, count in (('1k', 1000), ('10k', 10000), ('100k', 100000)):
+    SCENARIOS[f'flat-{label}'] = {'files': count, 'depth': 0, 'large_every': 0}
+    SCENARIOS[f'deep-{label}'] = {'files': count, 'depth': 8, 'large_every': 0}
+    SCENARIOS[f'mixed-{label}'] = {'files': count, 'depth': 3, 'large_every': 250}
+DEFAULT_SCENARIOS = ('flat-1k', 'deep-1k', 'mixed-1k')
+
+SMALL_FILE_SIZES = (200, 8 * 1024)
+LARGE_FILE_SIZES = (256 * 1024, 2 * 1024 * 1024)
+EXTENSIONS = ('.py', '.py', '.js', '.ts', '.html', '.css', '.md', '.json', '.bin')
+
+# Operations in the order they run: each one builds on the previous ones
+OPERATIONS = ('save', 'save_incremental', 'restore', 'archive', 'extract')
+
+# Share of the files changed before the incremental save, and deleted before the restore
+CHANGED_SHARE = 0.01
+DELETED_SHARE = 0.1
+
+STORE_NAME = 'ConcatCode'
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of this process in bytes, or None where
+    it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts in KiB, macOS in bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def file_content(rng, extension, size):
+    """
+    Return size bytes of plausible content for a file of that type.
+    """
+    if extension == '.bin':
+        return rng.randbytes(size)
+    words = ('def', 'return', 'value', 'self', 'items', 'index', 'data', 'if', 'for', 'in', '=', '+', '(', ')')
+    lines = []
+    length = 0
+    while length < size:
+        line = "    " * rng.randrange(4) + " ".join(rng.choice(words) for _ in range(rng.randrange(3, 12)))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines).encode('utf-8')[:size]
+
+
+def project_file_paths(count, depth, seed=0):
+    """
+    Return the relative paths of a synthetic project's files.
+
+    Parameters:
+        count (int): The number of files.
+        depth (int): How deep the folders nest; 0 puts every file at the root.
+        seed (int, optional): Seeds the names, for reproducible trees.
+
+    Returns:
+        list: The relative paths, with '/' separators.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for number in range(count):
+        extension = rng.choice(EXTENSIONS)
+        folders = []
+        if depth:
+            # About twenty files per folder, spread over depth levels
+            folder_number = number // 20
+            for level in range(depth):
+                folders.append(f"dir{folder_number % 4}_{level}")
+                folder_number //= 4
+        paths.append("/".join(folders + [f"file{number}{extension}"]))
+    return paths
+
+
+def make_project(project_dir, scenario, seed=0):
+    """
+    Write a synthetic project.
+
+    Parameters:
+        project_dir (str): The folder to create it in.
+        scenario (dict): The scenario describing it.
+        seed (int, optional): Seeds the content, for reproducible projects.
+
+    Returns:
+        dict: The 'files' written, their 'bytes' and their relative 'paths'.
+    """
+    rng = random.Random(seed)
+    paths = project_file_paths(scenario['files'], scenario['depth'], seed)
+    total_bytes = 0
+    for number, path in enumerate(paths):
+        if scenario['large_every'] and number % scenario['large_every'] == 0:
+            size = rng.randrange(*LARGE_FILE_SIZES)
+        else:
+            size = rng.randrange(*SMALL_FILE_SIZES)
+        file_path = os.path.join(project_dir, *path.split('/'))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as outfile:
+            outfile.write(file_content(rng, os.path.splitext(path)[1], size))
+        total_bytes += size
+    return {'files': len(paths), 'bytes': total_bytes, 'paths': paths}
+
+
+def change_files(project_dir, paths, share, seed=0, delete=False):
+    """
+    Append to, or delete, a share of a project's files.
+
+    Returns:
+        int: The number of files changed.
+    """
+    rng = random.Random(seed)
+    chosen = rng.sample(paths, max(1, int(len(paths) * share)))
+    for path in chosen:
+        file_path = os.path.join(project_dir, *path.split('/'))
+        if delete:
+            os.remove(file_path)
+        else:
+            with open(file_path, 'ab') as outfile:
+                outfile.write(b"\n# changed\n")
+    return len(chosen)
+
+
+def run_operation(operation, store_dir, project_dir, target=None):
+    """
+    Run one core operation and measure it. This is what the child interpreter
+    of measure_operation runs.
+
+    Parameters:
+        operation (str): One of OPERATIONS.
+        store_dir (str): The directory holding the versions.
+        project_dir (str): The root of the project.
+        target (str, optional): The version or ZIP the operation works on.
+
+    Returns:
+        dict: The 'seconds' it took, the 'files' and 'bytes' it processed
+        when the operation reports them, its 'peak_rss' and its 'result'.
+    """
+    started = time.perf_counter()
+    if operation in ('save', 'save_incremental'):
+        result = core.save_version(store_dir, project_dir)
+    elif operation == 'restore':
+        result = core.restore_version(target, store_dir, project_dir)
+    elif operation == 'archive':
+        result = core.archive_version(target, store_dir)
+    elif operation == 'extract':
+        result = core.extract_version(target, store_dir)
+    else:
+        raise ValueError(f"Unknown operation {operation}")
+    seconds = time.perf_counter() - started
+    return {
+        'seconds': seconds,
+        'files': result.get('file_count'),
+        'bytes': result.get('bytes'),
+        'peak_rss': peak_rss(),
+        'result': result
+    }
+
+
+def measure_operation(operation, store_dir, project_dir, target=None):
+    """
+    Run one core operation in a fresh interpreter, so its peak memory is not
+    inflated by the operations before it.
+
+    Returns:
+        dict: What run_operation returned in the child.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--run-operation', operation, store_dir, project_dir]
+    if target is not None:
+        command.append(target)
+    completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(
+            f"Benchmark of {operation} failed: {completed.stderr.decode('utf-8', 'replace').strip()}"
+        )
+    return json.loads(completed.stdout.decode('utf-8'))
+
+
+def run_operations(project_dir, paths):
+    """
+    Time every operation once, in order, on a freshly generated project.
+
+    Parameters:
+        project_dir (str): The project, as written by make_project.
+        paths (list): The relative paths of its files.
+
+    Returns:
+        dict: What measure_operation returned for each operation, by name.
+    """
+    store_dir = os.path.join(project_dir, STORE_NAME)
+    os.makedirs(store_dir)
+    runs = {}
+
+    def measure(operation, target=None):
+        runs[operation] = measure_operation(operation, store_dir, project_dir, target)
+        return runs[operation]['result']
+
+    first = measure('save')
+    first_version = os.path.basename(first['version_folder'])
+    change_files(project_dir, paths, CHANGED_SHARE, seed=1)
+    second = measure('save_incremental')
+    change_files(project_dir, paths, DELETED_SHARE, seed=2, delete=True)
+    measure('restore', first_version)
+    measure('archive', first_version)
+    # The incremental backup needs its archived parent to be complete
+    measure('extract', second['zip_file'])
+    return runs
+
+
+def run_scenario(name, work_dir, report=None, repeat=DEFAULT_REPEAT):
+    """
+    Generate the project of a scenario and time every operation on it.
+
+    The operations change the project and its versions, so each repetition
+    runs all of them on its own copy of the project. An operation is
+    reported by its median run, which a single slow run does not move.
+
+    Parameters:
+        name (str): The scenario, a key of SCENARIOS.
+        work_dir (str): The folder to generate the projects in.
+        report (callable, optional): Receives a line of text per operation.
+        repeat (int, optional): How many times to run the operations.
+
+    Returns:
+        dict: The measures of each operation, by operation name: 'seconds',
+        'files_per_s', 'mb_per_s', 'peak_rss' and the seconds spent in each
+        of its 'phases'.
+    """
+    scenario = SCENARIOS[name]
+    repetitions = []
+    for number in range(max(1, repeat)):
+        project_dir = os.path.join(work_dir, f"{name}-{number + 1}")
+        # The same seed every time, so each repetition works on the same project
+        project = make_project(project_dir, scenario)
+        repetitions.append(run_operations(project_dir, project['paths']))
+
+    results = {}
+    for operation in OPERATIONS:
+        runs = sorted((runs[operation] for runs in repetitions), key=lambda run: run['seconds'])
+        median = runs[len(runs) // 2]
+        # Operations that do not count their work are credited the whole project
+        files = median['files'] if median['files'] is not None else project['files']
+        nbytes = median['bytes'] if median['bytes'] is not None else project['bytes']
+        seconds = max(median['seconds'], 1e-9)
+        peaks = sorted(run['peak_rss'] for run in runs if run['peak_rss'] is not None)
+        results[operation] = {
+            'seconds': round(median['seconds'], 4),
+            'files_per_s': round(files / seconds, 1),
+            'mb_per_s': round(nbytes / seconds / 1048576, 2),
+            'peak_rss': peaks[len(peaks) // 2] if peaks else None,
+            'phases': median['result'].get('metrics', {}).get('phases', {})
+        }
+        if report is not None:
+            report(format_measures(name, operation, results[operation]))
+    return results
+
+
+def format_measures(scenario, operation, measures):
+    """
+    Describe the measures of an operation on one line.
+    """
+    peak = f"{measures['peak_rss'] / 1048576:.0f} MB" if measures['peak_rss'] is not None else "n/a"
+    return (
+        f"{scenario:<12} {operation:<17} {measures['seconds']:>9.3f} s {measures['files_per_s']:>11.1f} files/s "
+        f"{measures['mb_per_s']:>9.2f} MB/s  peak {peak}"
+    )
+
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Find the operations slower, or needing more memory, than their baseline.
+    A regression has to exceed both the tolerance and an absolute minimum,
+    so that noise on the fastest operations is not reported.
+
+    Parameters:
+        results (dict): Measures by scenario, then by operation.
+        baseline (dict): The baseline results, in the same form.
+        tolerance (float, optional): The growth allowed, 0.25 being 25%.
+
+    Returns:
+        list: A description of each regression.
+    """
+    regressions = []
+    for scenario, operations in results.items():
+        for operation, measures in operations.items():
+            reference = baseline.get(scenario, {}).get(operation)
+            if reference is None:
+                continue
+            for key, unit, minimum in (
+                ('seconds', 's', MIN_REGRESSION_SECONDS), ('peak_rss', 'bytes', MIN_REGRESSION_BYTES)
+            ):
+                if measures.get(key) is None or reference.get(key) is None:
+                    continue
+                growth = measures[key] - reference[key]
+                if growth > reference[key] * tolerance and growth > minimum:
+                    regressions.append(
+                        f"{scenario} {operation}: {key} {measures[key]} {unit}, baseline {reference[key]} {unit}"
+                    )
+    return regressions
+
+
+def load_baseline(baseline_file):
+    """
+    Load the baseline results, or None when there is none yet.
+    """
+    if not os.path.isfile(baseline_file):
+        return None
+    with open(baseline_file, 'r', encoding='utf-8') as infile:
+        return json.load(infile)['results']
+
+
+def save_baseline(baseline_file, results):
+    """
+    Record results as the baseline, merged with those of other scenarios.
+    """
+    baseline = load_baseline(baseline_file) or {}
+    baseline.update(results)
+    core.write_json_file(baseline_file, {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': baseline
+    })
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='concatcode_bench', description='Benchmark the Project Version Manager on synthetic projects'
+    )
+    parser.add_argument(
+        'scenarios', nargs='*', metavar='SCENARIO',
+        help=f"scenarios to run (default: {' '.join(DEFAULT_SCENARIOS)}; all: {' '.join(SCENARIOS)})"
+    )
+    parser.add_argument('--baseline', metavar='FILE', default=BASELINE_FILE, help='baseline JSON to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='record the results as the baseline')
+    parser.add_argument(
+        '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+        help=f"growth over the baseline reported as a regression (default: {DEFAULT_TOLERANCE})"
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=DEFAULT_REPEAT,
+        help=f"runs of each scenario, the median being reported (default: {DEFAULT_REPEAT})"
+    )
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--keep', action='store_true', help='keep the generated projects')
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    Parameters:
+        argv (list, optional): The arguments, without the program name.
+
+    Returns:
+        int: The exit code: 1 when a regression was found.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--run-operation']:
+        # Child interpreter started by measure_operation
+        print(json.dumps(run_operation(*argv[1:])))
+        return 0
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios or list(DEFAULT_SCENARIOS)
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario {', '.join(unknown)}")
+
+    report = None if args.json else print
+    work_dir = tempfile.mkdtemp(prefix='concatcode_bench_')
+    results = {}
+    try:
+        for name in scenarios:
+            results[name] = run_scenario(name, work_dir, report, args.repeat)
+    finally:
+        if args.keep:
+            print(f"Projects kept in {work_dir}", file=sys.stderr)
+        else:
+            core.remove_tree(work_dir)
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare_with_baseline(results, baseline, args.tolerance) if baseline else []
+    if args.json:
+        print(json.dumps({'results': results, 'regressions': regressions}))
+    else:
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if baseline is None and not args.save_baseline:
+            print(f"No baseline in {args.baseline}; record one with --save-baseline")
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Command line interface of the Project Version Manager.
+
+Runs the core operations without Qt, for cron jobs, CI hooks and headless
+machines:
+
+    concatcode save
+    concatcode --json list
+    concatcode restore version_0.03_2024-10-19_17-38-36
+    concatcode verify --all
+    concatcode search -i "def load_settings"
+
+Saves, restores, archives, extractions, compactions and verifications
+append the time spent in each of their phases to concatcode_metrics.jsonl;
+--profile FILE also writes cProfile stats of the command.
+
+Exit codes: 0 on success, 1 when the operation fails or a verification
+finds damaged copies, 2 on invalid usage and 130 when interrupted.
+"""
+import os
+import sys
+import json
+import signal
+import argparse
+import threading
+
+import concatcode_core as core
+import concatcode_search
+import concatcode_watch
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+
+def print_progress(progress):
+    """
+    Show a progress line on stderr.
+
+    Parameters:
+        progress (dict): A progress report from the core.
+    """
+    files_total = progress['files_total'] if progress['totals_final'] else f"{progress['files_total'] or 0}+"
+    line = (
+        f"{progress['files_done']}/{files_total} files, "
+        f"{progress['bytes_done'] / 1048576:.1f} MB at {progress['throughput'] / 1048576:.1f} MB/s"
+    )
+    if progress['eta'] is not None:
+        line += f", {int(progress['eta'])} s left"
+    sys.stderr.write("\r" + line.ljust(70))
+    sys.stderr.flush()
+
+
+def format_result(command, result):
+    """
+    Describe the result of a command for humans.
+
+    Parameters:
+        command (str): The command that ran.
+        result: What the core operation returned.
+
+    Returns:
+        str: The text to print.
+    """
+    if command == 'save' and 'ignored' in result:
+        lines = [
+            f"{rule['files']:>8} files {rule['bytes']:>14} bytes  {rule['pattern']}  ({rule['source']})"
+            for rule in result['ignored']
+        ]
+        lines.append(f"Would save {result['file_count']} files ({result['bytes']} bytes) from {result['project_dir']}")
+        return "\n".join(lines)
+    if command == 'save':
+        text = (
+            f"Saved version {result['version']} ({result['file_count']} files, "
+            f"{result['changed_count']} changed) in {result['version_folder']}"
+        )
+        if result['concat_skipped']:
+            text += f"\n{len(result['concat_skipped'])} binary or too large files left out of the concat file"
+        if result['failed_count']:
+            text += f"\n{result['failed_count']} files could not be read and were left out (see error.log)"
+        return text
+    if command == 'restore':
+        if result['dry_run']:
+            lines = list(result['files'])
+            lines.append(
+                f"Would restore {result['file_count']} files ({result['bytes']} bytes) of {result['version']} "
+                f"to {result['project_dir']}, {result['unchanged_count']} already up to date"
+            )
+            return "\n".join(lines)
+        return (
+            f"Restored {result['file_count']} files ({result['bytes']} bytes) of {result['version']} "
+            f"to {result['project_dir']} at {result['throughput'] / 1048576:.1f} MB/s, "
+            f"{result['unchanged_count']} already up to date"
+        )
+    if command == 'archive':
+        return f"Archived {result['version']} to {result['archive_file']}"
+    if command == 'extract':
+        if isinstance(result, list):
+            return "\n".join(f"{member['size']:>12}  {member['path']}" for member in result)
+        return (
+            f"Extracted {result['file_count']} files of {result['zip_file']} to {result['extract_folder']} "
+            f"at {result['throughput'] / 1048576:.1f} MB/s"
+        )
+    if command == 'list':
+        return "\n".join(record['name'] for record in result)
+    if command == 'show':
+        return result
+    if command == 'diff':
+        lines = [f"A {path}" for path in result['added']]
+        lines += [f"D {path}" for path in result['removed']]
+        lines += [f"M {path}" for path in result['modified']]
+        lines.append(
+            f"{len(result['added'])} added, {len(result['removed'])} removed, "
+            f"{len(result['modified'])} modified, {result['unchanged_count']} unchanged"
+        )
+        return "\n".join(lines)
+    if command == 'gc':
+        return f"Removed {result['removed']} objects, freed {result['freed_bytes']} bytes"
+    if command == 'compact':
+        if result['dry_run']:
+            lines = list(result['packed'])
+            lines.append(f"Would pack {len(result['packed'])} versions, keeping {result['kept_count']}")
+            return "\n".join(lines)
+        if not result['packed']:
+            return f"Nothing to compact, keeping {result['kept_count']} versions"
+        return (
+            f"Packed {len(result['packed'])} versions into {result['pack_file']} "
+            f"({result['objects']} new contents, {result['bytes']} bytes), "
+            f"removed {result['removed']} objects, freed {result['freed_bytes']} bytes"
+        )
+    if command == 'verify':
+        lines = []
+        for version in result:
+            lines += [
+                f"{failure['kind']} copy of {failure['path']} in {failure['location']}: {failure['error']}"
+                for failure in version['failures']
+            ]
+            status = f"{len(version['failures'])} damaged copies" if version['failures'] else "intact"
+            lines.append(
+                f"{version['version']}: {status} ({version['file_count']} files, "
+                f"{version['copies']} copies, {version['bytes']} bytes read)"
+            )
+        return "\n".join(lines)
+    if command == 'search':
+        lines = []
+        for match in result:
+            older = len(match['versions']) - 1
+            lines.append(
+                f"{match['path']} in {match['versions'][0]}" + (f" and {older} older versions" if older else "")
+            )
+            lines += [f"{number:>6}: {text}" for number, text in match['lines']]
+        lines.append(f"{len(result)} matches")
+        return "\n".join(lines)
+    if command == 'watch':
+        return f"Stopped watching after {result['saves']} automatic saves"
+    if command == 'reindex':
+        return f"Cataloged {result['versions']} versions"
+    return str(result)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='concatcode', description='Project Version Manager')
+    parser.add_argument('--store', metavar='DIR', help='directory holding the versions (default: the script directory)')
+    parser.add_argument('--project', metavar='DIR', help='project root (default: the parent of the store)')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not show progress')
+    parser.add_argument(
+        '--profile', metavar='FILE', help='profile the command with cProfile and write the stats to FILE'
+    )
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    save = commands.add_parser('save', help='save a new version of the project')
+    save.add_argument(
+        '--dry-run', action='store_true', help='report what would be saved and what each ignore rule excludes'
+    )
+    list_parser = commands.add_parser('list', help='list the saved versions')
+    list_parser.add_argument('--newest-first', action='store_true', help='list the most recent versions first')
+    list_parser.add_argument('--offset', type=int, default=0, help='number of versions to skip')
+    list_parser.add_argument('--limit', type=int, help='maximum number of versions to list')
+    restore = commands.add_parser('restore', help='restore a saved version into the project')
+    restore.add_argument('version', help='version folder name')
+    restore.add_argument('--dry-run', action='store_true', help='only list the files the restore would write')
+    archive = commands.add_parser('archive', help='move a saved version into Archived_Versions')
+    archive.add_argument('version', help='version folder name')
+    extract = commands.add_parser('extract', help='extract a backup or archive ZIP')
+    extract.add_argument('zip_file', help='ZIP file to extract')
+    extract.add_argument('patterns', nargs='*', metavar='PATTERN', help="only extract the files matching these globs")
+    extract.add_argument('--list', action='store_true', help='list the files instead of extracting them')
+    extract.add_argument('--into-project', action='store_true', help='write the files straight into the project')
+    show = commands.add_parser('show', help="print one file of a version's concat snapshot")
+    show.add_argument('version', help='version folder name')
+    show.add_argument('path', help='relative path of the file in the project')
+    diff = commands.add_parser('diff', help='show what changed between two versions, live or archived')
+    diff.add_argument('old', help='older version folder name')
+    diff.add_argument('new', help='newer version folder name')
+    diff.add_argument('patterns', nargs='*', metavar='PATTERN', help='only compare the files matching these globs')
+    diff.add_argument('--stat', action='store_true', help='only list the added, removed and modified files')
+    diff.add_argument('-U', '--unified', type=int, default=3, metavar='N', help='lines of context (default: 3)')
+    commands.add_parser('gc', help='delete stored objects no version uses any more')
+    compact = commands.add_parser('compact', help='pack the versions the retention policy does not keep')
+    compact.add_argument('--dry-run', action='store_true', help='only list the versions that would be packed')
+    commands.add_parser('reindex', help='rebuild the version catalog from the version folders')
+    verify = commands.add_parser('verify', help='read back every stored copy of versions and check their hashes')
+    verify.add_argument('versions', nargs='*', metavar='VERSION', help='version folder names, live or archived')
+    verify.add_argument('--all', action='store_true', help='verify every saved, packed and archived version')
+    search = commands.add_parser('search', help='find the lines containing a text in every version')
+    search.add_argument('query', help='the text to find')
+    search.add_argument('patterns', nargs='*', metavar='PATTERN', help='only search the files matching these globs')
+    search.add_argument('-i', '--ignore-case', action='store_true', help='match regardless of case')
+    search.add_argument('--limit', type=int, default=100, help='maximum number of matches to show (default: 100)')
+    watch = commands.add_parser('watch', help='save versions automatically as the project changes, until Ctrl+C')
+    watch.add_argument('--poll', action='store_true', help='poll the project tree instead of using inotify')
+    return parser
+
+
+def run_command(args, progress, cancel_event):
+    """
+    Call the core operation behind a command.
+
+    Returns:
+        The result of the operation.
+    """
+    if args.command == 'save':
+        if args.dry_run:
+            return core.plan_save(args.store, args.project)
+        return core.save_version(args.store, args.project, progress, cancel_event)
+    if args.command == 'list':
+        return core.list_versions(args.store, args.offset, args.limit, args.newest_first, details=True)
+    if args.command == 'restore':
+        return core.restore_version(args.version, args.store, args.project, progress, cancel_event, args.dry_run)
+    if args.command == 'archive':
+        return core.archive_version(args.version, args.store, progress, cancel_event)
+    if args.command == 'extract':
+        if args.list:
+            return core.list_zip_members(args.zip_file, args.patterns)
+        return core.extract_version(
+            args.zip_file, args.store, progress, cancel_event, args.patterns, args.into_project, args.project
+        )
+    if args.command == 'show':
+        with core.open_concat(args.version, args.store) as reader:
+            if args.path not in reader:
+                raise FileNotFoundError(f"{args.path} is not in the concat snapshot of {args.version}")
+            return reader.read_text(args.path)
+    if args.command == 'diff':
+        if args.stat or args.json:
+            return core.diff_versions(args.old, args.new, args.store, args.patterns)
+        # The diff is streamed as it is computed
+        for line in core.iter_version_diff(
+                args.old, args.new, args.store, args.patterns, cancel_event, args.unified):
+            sys.stdout.write(line)
+        return None
+    if args.command == 'gc':
+        return core.collect_garbage(args.store)
+    if args.command == 'compact':
+        return core.compact_versions(args.store, progress, cancel_event, args.dry_run)
+    if args.command == 'reindex':
+        return core.rebuild_catalog(args.store)
+    if args.command == 'verify':
+        versions = args.versions
+        if args.all:
+            versions = core.list_versions(args.store, archived=True)
+        elif not versions:
+            raise ValueError("Name the versions to verify, or use --all")
+        return [core.verify_version(version, args.store, progress, cancel_event) for version in versions]
+    if args.command == 'search':
+        return concatcode_search.search_versions(
+            args.query, args.store, args.ignore_case, args.patterns, args.limit, progress, cancel_event
+        )
+    if args.command == 'watch':
+        def on_save(result):
+            if args.json:
+                print(json.dumps({'command': 'save', 'result': result}), flush=True)
+            else:
+                print(format_result('save', result), flush=True)
+
+        # Ctrl+C stops watching: the command then ends normally
+        return concatcode_watch.watch_project(args.store, args.project, None, cancel_event, on_save, not args.poll)
+    raise ValueError(f"Unknown command {args.command}")
+
+
+def main(argv=None):
+    """
+    Run the command line interface.
+
+    Parameters:
+        argv (list, optional): The arguments, without the program name.
+
+    Returns:
+        int: The exit code.
+    """
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as exit_e:
+        return EXIT_USAGE if exit_e.code else EXIT_OK
+    core.configure_logging()
+
+    # A first Ctrl+C cancels the operation cleanly, a second one aborts
+    cancel_event = threading.Event()
+
+    def on_interrupt(signum, frame):
+        if cancel_event.is_set():
+            raise KeyboardInterrupt
+        cancel_event.set()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, on_interrupt)
+
+    show_progress = not args.quiet and sys.stderr.isatty()
+    try:
+        with core.profiling(args.profile):
+            result = run_command(args, print_progress if show_progress else None, cancel_event)
+    except (core.OperationCancelled, KeyboardInterrupt):
+        error, code = 'Operation cancelled', EXIT_CANCELLED
+    except Exception as e:
+        error, code = str(e), EXIT_ERROR
+    else:
+        error, code = None, EXIT_OK
+    if error is None and args.command == 'verify' and any(version['failures'] for version in result):
+        code = EXIT_ERROR
+
+    try:
+        if show_progress:
+            sys.stderr.write("\n")
+        if error is not None:
+            if args.json:
+                print(json.dumps({'command': args.command, 'error': error}))
+            else:
+                print(f"concatcode {args.command}: {error}", file=sys.stderr)
+        elif args.json:
+            print(json.dumps({'command': args.command, 'result': result}))
+        elif result is not None:
+            print(format_result(args.command, result))
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader stopped early, as in `concatcode list | head`: the rest
+        # of the output goes nowhere, and Python does not complain about it
+        # when flushing at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
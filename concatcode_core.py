@@ -0,0 +1,4721 @@
+"""
+Core operations of the Project Version Manager: saving, restoring,
+archiving, extracting and listing versions of a project.
+
+This module does not depend on Qt, so it can be imported by the command
+line interface, by scripts and by the GUI alike.
+"""
+import os
+import sys
+import io
+import json
+import sqlite3
+import codecs
+import cProfile
+import difflib
+import filecmp
+import fnmatch
+import gzip
+import queue
+import re
+import hashlib
+import tempfile
+import stat
+import shutil
+import zipfile
+import zlib
+import struct
+import logging
+import mmap
+import threading
+import time
+
+try:
+    import fcntl  # Reflink copies and file locks, on Linux and macOS
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt  # File locks, on Windows
+except ImportError:
+    msvcrt = None
+
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from functools import partial
+
+# Versions are kept next to the tool, whose own files are never saved
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOL_FILES = tuple(
+    os.path.join(SCRIPT_DIR, name)
+    for name in (
+        'Concatcode.py', 'concatcode_core.py', 'concatcode_gui.py', 'concatcode_cli.py', 'concatcode_bench.py',
+        'concatcode_watch.py', 'concatcode_search.py', 'concatcode'
+    )
+)
+
+# File extensions to process (common programming languages)
+SOURCE_EXTENSIONS = (
+    '.py', '.java', '.c', '.cpp', '.cs', '.js', '.ts',
+    '.html', '.css', '.php', '.rb', '.go', '.swift', '.kt', '.rs'
+)
+
+# Size of the chunks each source file is read in, and the number of scanned
+# entries the walker may queue ahead of the reader. Together they bound the
+# memory a save needs, whatever the size of the project.
+READ_CHUNK_SIZE = 1024 * 1024
+SCAN_QUEUE_SIZE = 1024
+
+SEPARATOR = "=" * 50
+
+# Every saved version records its files in this manifest
+MANIFEST_NAME = 'manifest.json'
+HASH_NAME = 'sha256'
+
+# Index written beside each concat file: where the text of each file lies
+CONCAT_INDEX_SUFFIX = '.index.json'
+# Suffix of concat files compressed as they are written
+CONCAT_GZIP_SUFFIX = '.gz'
+# Source files with a NUL byte in their first bytes are binary, as for git
+BINARY_SNIFF_SIZE = 8000
+
+# Content-addressed store the Source folders of all versions share
+OBJECTS_DIR_NAME = 'Version_Objects'
+# Locked in the object store by the processes using it (see StoreLock)
+STORE_LOCK_NAME = '.store.lock'
+# Delay between two attempts at a store lock held by another process
+STORE_LOCK_RETRY = 0.05
+
+# Compacted versions are kept in packs: ZIPs holding the manifests of the
+# versions they replace and, once across all packs, the file contents these
+# versions need
+PACKS_DIR_NAME = 'Version_Packs'
+PACK_OBJECTS_PREFIX = 'objects/'
+PACK_MANIFESTS_PREFIX = 'manifests/'
+
+# Comment stored in incremental backup ZIPs to name the version they build on
+PARENT_COMMENT_PREFIX = 'concatcode-parent:'
+
+# ZIP members are compressed in blocks of this size on a pool of workers;
+# each block is primed with the deflate window (32 KiB) that precedes it
+ZIP_BLOCK_SIZE = 1024 * 1024
+ZIP_WINDOW_SIZE = 32 * 1024
+ZIP64_LIMIT = (1 << 31) - 1
+DEFAULT_ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# Formats that are compressed already: ZIPs store them instead of deflating them again
+COMPRESSED_EXTENSIONS = (
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar', '.jar', '.whl',
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp3', '.mp4', '.mkv', '.webm', '.mov', '.ogg', '.flac',
+    '.woff', '.woff2', '.docx', '.xlsx', '.pptx'
+)
+
+# Optional settings file next to the script, overriding DEFAULT_SETTINGS
+SETTINGS_FILE_NAME = 'concatcode_settings.json'
+DEFAULT_SETTINGS = {
+    'zip_workers': None,  # Compression and extraction threads; None uses one per CPU
+    'zip_compresslevel': 6,
+    'copy_workers': None,  # Restore threads; None picks a count suited to I/O
+    'concat_max_file_bytes': 16 * 1024 * 1024,  # Larger files are left out of the concat file; None keeps all
+    'concat_shard_bytes': None,  # Split the concat file into parts of about this size; None writes one file
+    'concat_gzip': False,  # Compress the concat file as it is written
+    'watch_debounce': 2.0,  # Watch mode saves once the project has been quiet this many seconds,
+    'watch_min_interval': 60.0,  # and at most once per this many seconds
+    'watch_poll_interval': 10.0,  # Seconds between two walks where inotify is not available
+    'keep_last': 10,  # Compaction keeps this many most recent versions as they are,
+    'keep_daily': 7,  # plus the most recent version of each of the last days,
+    'keep_weekly': 4,  # and of each of the last weeks; the others are packed
+    'search_index': False,  # Index each saved version for search as it is saved, not at the next search
+}
+
+# Modified files larger than this are reported by diffs without a line diff
+DIFF_MAX_BYTES = 8 * 1024 * 1024
+
+# Files and folders left out of every snapshot use .gitignore syntax: the
+# project's .gitignore files, the tool's own ignore file at the project root
+# (which takes precedence), and these defaults
+GITIGNORE_NAME = '.gitignore'
+IGNORE_FILE_NAME = '.concatcodeignore'
+DEFAULT_IGNORE_RULES = ('.git/', '.hg/', '.svn/')
+
+# Marks a version folder whose save has not finished yet; the running save
+# keeps it locked, so a marker nobody holds was left by a crash
+IN_PROGRESS_MARKER = '.in_progress'
+
+# Journal of the files a save has completed, and where the outputs of an
+# interrupted attempt are moved when the next save resumes it
+JOURNAL_NAME = '.journal'
+RESUME_DIR_NAME = '.resume'
+# Seconds between two journal checkpoints, which wait for the outputs to reach the disk
+JOURNAL_INTERVAL = 5.0
+
+# Catalog of the saved versions, so listing them and allocating the next
+# number never has to scan the version folders
+CATALOG_NAME = 'version_catalog.sqlite'
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    number INTEGER NOT NULL,
+    datetime TEXT NOT NULL,
+    file_count INTEGER,
+    total_bytes INTEGER,
+    hash_root TEXT,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_by_number ON versions (number, datetime);
+"""
+# Trigram index of the text of the saved versions (see concatcode_search)
+SEARCH_INDEX_NAME = 'search_index.sqlite'
+
+# States of a catalog entry
+SAVING = 'saving'
+SAVED = 'saved'
+ARCHIVED = 'archived'
+PACKED = 'packed'
+
+# ioctl asking Linux to share a file's extents with another (a reflink)
+FICLONE = 0x40049409
+
+# Minimum delay between two progress reports
+PROGRESS_INTERVAL = 0.1
+
+# Each completed operation appends a JSON line with its metrics to this file
+METRICS_FILE_NAME = 'concatcode_metrics.jsonl'
+# Results concatcode_bench compares its runs with
+BENCH_BASELINE_NAME = 'bench_baseline.json'
+
+
+class OperationCancelled(Exception):
+    """
+    Raised inside an operation when the user cancels it.
+    """
+
+
+class OperationMetrics:
+    """
+    Times the phases of an operation and counts what it processed.
+
+    Phases can overlap (the walk runs beside the reads) and be timed in many
+    spans, from several threads: the duration of a phase is the sum of its
+    spans, so phases do not add up to the wall time.
+
+    Usage:
+        metrics = OperationMetrics('save')
+        with metrics.phase('manifest'):
+            write_manifest(version_folder, manifest)
+        metrics.count('files', len(entries))
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, **fields):
+        """
+        Return the metrics as a dictionary, for the metrics file and the
+        result of the operation.
+
+        Parameters:
+            **fields: Extra fields, such as the version or the compression ratio.
+        """
+        with self.lock:
+            record = {
+                'operation': self.operation,
+                'started': self.started_at,
+                'seconds': round(time.perf_counter() - self.started, 6),
+                'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                'counters': dict(self.counters)
+            }
+        record.update(fields)
+        return record
+
+
+def write_metrics(script_dir, record):
+    """
+    Append the metrics of an operation to the metrics file, as one JSON line.
+
+    Failing to write them is logged but does not fail the operation.
+    """
+    metrics_file = os.path.join(script_dir, METRICS_FILE_NAME)
+    try:
+        with open(metrics_file, 'a', encoding='utf-8') as outfile:
+            outfile.write(json.dumps(record) + "\n")
+    except OSError:
+        logging.error(f"Failed to write metrics to {metrics_file}.", exc_info=True)
+
+
+def compression_ratio(compressed_bytes, uncompressed_bytes):
+    """
+    Return the compressed size as a fraction of the original, or None when
+    nothing was compressed.
+    """
+    return round(compressed_bytes / uncompressed_bytes, 4) if uncompressed_bytes else None
+
+
+def format_metrics(record):
+    """
+    Describe the metrics of an operation for the details of a dialog.
+
+    Parameters:
+        record (dict): The metrics, as OperationMetrics.record returns them.
+
+    Returns:
+        str: A few lines of text.
+    """
+    phases = ", ".join(f"{name} {seconds:.2f} s" for name, seconds in record['phases'].items())
+    lines = [f"Time: {record['seconds']:.2f} s ({phases})"]
+    counters = ", ".join(f"{name.replace('_', ' ')} {value}" for name, value in record['counters'].items())
+    if counters:
+        lines.append(f"Counts: {counters}")
+    if record.get('compression_ratio') is not None:
+        lines.append(f"Compressed to {record['compression_ratio']:.0%} of the original size")
+    return "\n".join(lines)
+
+
+@contextmanager
+def profiling(profile_file=None):
+    """
+    Profile the code run inside the block with cProfile and write the stats
+    to profile_file, for pstats or snakeviz. Does nothing without a file.
+
+    Only the calling thread is profiled, not the worker pools it starts.
+    """
+    if not profile_file:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_file)
+
+
+class ProgressTracker:
+    """
+    Counts the files and bytes an operation has processed, reports throughput
+    and ETA to a callback, and checks for cancellation. Its metrics collect
+    the timing of the operation's phases.
+    """
+
+    def __init__(self, callback=None, cancel_event=None, metrics=None):
+        self.callback = callback
+        self.cancel_event = cancel_event
+        self.metrics = metrics or OperationMetrics(None)
+        self.files_done = 0
+        self.bytes_done = 0
+        self.files_total = None
+        self.bytes_total = None
+        # When set, the totals are read from the stats a background scan updates
+        self.scan_stats = None
+        self.started = time.monotonic()
+        self.last_report = 0.0
+
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise OperationCancelled()
+
+    def set_totals(self, files_total, bytes_total):
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+
+    def advance(self, files=0, nbytes=0):
+        self.files_done += files
+        self.bytes_done += nbytes
+        self.check_cancelled()
+        self.report()
+
+    def report(self, force=False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+
+        files_total, bytes_total, final = self.files_total, self.bytes_total, True
+        if self.scan_stats is not None:
+            files_total = self.scan_stats['files']
+            bytes_total = self.scan_stats['bytes']
+            final = self.scan_stats['done']
+
+        elapsed = now - self.started
+        throughput = self.bytes_done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if final and bytes_total is not None and throughput > 0:
+            eta = max(bytes_total - self.bytes_done, 0) / throughput
+
+        self.callback({
+            'files_done': self.files_done,
+            'files_total': files_total,
+            'bytes_done': self.bytes_done,
+            'bytes_total': bytes_total,
+            'totals_final': final,
+            'throughput': throughput,
+            'eta': eta,
+        })
+
+
+class StoreLock:
+    """
+    Lets any number of operations use the object store at the same time,
+    while garbage collection waits to have it to itself.
+
+    The threads of a process wait on each other through a condition. Between
+    processes (the GUI, a CLI command, a watch), the store's lock file is
+    locked shared while the process has users, and exclusively for garbage
+    collection. Where file locks are exclusive only (Windows), processes take
+    turns instead; without file locks, only the threads of a process are
+    kept apart.
+
+    Usage:
+        with STORE_LOCK.shared(script_dir):
+            restore_plan(script_dir, version_folder, manifest, packs)
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.users = 0
+        self.exclusive_held = False
+        # The open lock file of each store this process uses, and its users
+        self.lock_files = {}
+        self.lock_files_lock = threading.Lock()
+
+    def _lock_store(self, script_dir, shared):
+        lock_path = os.path.join(script_dir, OBJECTS_DIR_NAME, STORE_LOCK_NAME)
+        with self.lock_files_lock:
+            if lock_path in self.lock_files:
+                self.lock_files[lock_path][1] += 1
+                return
+            lock_file = None
+            if fcntl is not None or msvcrt is not None:
+                os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+                lock_file = open(lock_path, 'a+b')
+                while not try_lock_file(lock_file, shared):
+                    time.sleep(STORE_LOCK_RETRY)
+            self.lock_files[lock_path] = [lock_file, 1]
+
+    def _unlock_store(self, script_dir):
+        lock_path = os.path.join(script_dir, OBJECTS_DIR_NAME, STORE_LOCK_NAME)
+        with self.lock_files_lock:
+            held = self.lock_files[lock_path]
+            held[1] -= 1
+            if held[1] == 0:
+                del self.lock_files[lock_path]
+                if held[0] is not None:
+                    held[0].close()
+
+    @contextmanager
+    def shared(self, script_dir):
+        with self.condition:
+            while self.exclusive_held:
+                self.condition.wait()
+            self.users += 1
+        try:
+            self._lock_store(script_dir, shared=True)
+            try:
+                yield
+            finally:
+                self._unlock_store(script_dir)
+        finally:
+            with self.condition:
+                self.users -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self, script_dir):
+        with self.condition:
+            while self.exclusive_held or self.users:
+                self.condition.wait()
+            self.exclusive_held = True
+        try:
+            self._lock_store(script_dir, shared=False)
+            try:
+                yield
+            finally:
+                self._unlock_store(script_dir)
+        finally:
+            with self.condition:
+                self.exclusive_held = False
+                self.condition.notify_all()
+
+
+STORE_LOCK = StoreLock()
+
+# Serialises version number allocation between concurrent saves
+VERSION_LOCK = threading.Lock()
+
+
+# A file found by the scan stage
+ProjectFile = namedtuple('ProjectFile', ['path', 'relpath', 'name', 'stat'])
+
+# The stat data of a file as a manifest recorded it, standing in for os.stat
+EntryStat = namedtuple('EntryStat', ['st_size', 'st_mtime_ns'])
+
+# A file extract_version can write: the backup ZIP holding it (None for the
+# ZIP being extracted), its member name, size and modification time
+ExtractMember = namedtuple('ExtractMember', ['backup', 'name', 'size', 'mtime_ns'])
+
+# A complete member found in a ZIP that has no central directory, by its local header
+LocalMember = namedtuple('LocalMember', ['compress_type', 'crc', 'compress_size', 'file_size', 'data_offset'])
+
+# A problem verify_version found: the kind of copy (object, pack, zip,
+# concat, archive or catalog), the file, where the copy is stored, and the error
+VerifyResult = namedtuple('VerifyResult', ['kind', 'path', 'location', 'error'])
+
+
+def configure_logging():
+    """
+    Send errors to error.log next to the script, as the GUI and CLI expect.
+    """
+    logging.basicConfig(
+        filename=os.path.join(SCRIPT_DIR, 'error.log'),
+        level=logging.ERROR,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+
+def load_settings(script_dir):
+    """
+    Load the settings, falling back to DEFAULT_SETTINGS for missing keys.
+
+    Parameters:
+        script_dir (str): The directory holding the settings file.
+
+    Returns:
+        dict: The settings.
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    settings_file = os.path.join(script_dir, SETTINGS_FILE_NAME)
+    if os.path.isfile(settings_file):
+        try:
+            with open(settings_file, 'r', encoding='utf-8') as infile:
+                settings.update(json.load(infile))
+        except (OSError, ValueError):
+            logging.error(f"Failed to read settings from {settings_file}.", exc_info=True)
+    return settings
+
+
+def is_excluded_dir(name):
+    """
+    Check whether a directory must never be walked (saved versions, archives,
+    extractions, the object store and the packs).
+
+    Parameters:
+        name (str): The directory name.
+
+    Returns:
+        bool: True if the directory is excluded.
+    """
+    return name.startswith('version_') or name in (
+        'Archived_Versions', 'extracted_version', OBJECTS_DIR_NAME, PACKS_DIR_NAME
+    )
+
+
+# An ignore rule: the pattern as written, where it was read, whether it
+# re-includes (!) and whether it only matches directories (trailing /)
+IgnoreRule = namedtuple('IgnoreRule', ['pattern', 'source', 'negated', 'dir_only'])
+
+
+def translate_ignore_pattern(pattern):
+    """
+    Translate a .gitignore pattern (without its '!' and trailing '/') into a
+    regular expression matching '/'-separated paths relative to the folder
+    of the ignore file.
+
+    Parameters:
+        pattern (str): The pattern.
+
+    Returns:
+        str: The regular expression, without anchors.
+    """
+    # A pattern with a '/' before its end is relative to the ignore file's
+    # folder; otherwise it matches a name at any depth
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i) and i + 2 == len(pattern) and (i == 0 or pattern[i - 1] == '/'):
+            parts.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            parts.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    regex = ''.join(parts)
+    return regex if anchored else '(?:.*/)?' + regex
+
+
+def parse_ignore_lines(lines, source):
+    """
+    Parse the lines of a .gitignore-style file.
+
+    Parameters:
+        lines (iterable): The lines of the file.
+        source (str): Where the rules come from, for reports.
+
+    Returns:
+        list: (IgnoreRule, regular expression) tuples, in file order.
+    """
+    rules = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\n').rstrip('\r')
+        if not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated or line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        pattern = line.rstrip('/')
+        if not pattern:
+            continue
+        rule = IgnoreRule(line if not negated else '!' + line, f"{source}:{line_number}", negated, dir_only)
+        rules.append((rule, translate_ignore_pattern(pattern)))
+    return rules
+
+
+class IgnoreRuleSet:
+    """
+    The rules of one ignore file, compiled for matching paths relative to the
+    project root.
+
+    Consecutive rules of the same kind are joined into a single regular
+    expression, so a path is checked with a handful of matches however many
+    rules the file has.
+    """
+
+    def __init__(self, rules, base=''):
+        # Groups of (negated, dir_only, compiled alternation, rules), last
+        # rule first: the last matching rule of a file decides
+        self.groups = []
+        prefix = re.escape(base + '/') if base else ''
+        for rule, regex in reversed(rules):
+            key = (rule.negated, rule.dir_only)
+            if self.groups and self.groups[-1][0] == key:
+                self.groups[-1][1].append((rule, regex))
+            else:
+                self.groups.append((key, [(rule, regex)]))
+        self.groups = [
+            (negated, dir_only,
+             re.compile(prefix + '(?:' + '|'.join(f'({regex})' for _, regex in group) + r')\Z', re.DOTALL),
+             [rule for rule, _ in group])
+            for (negated, dir_only), group in self.groups
+        ]
+
+    def match(self, relpath, is_dir):
+        """
+        Return the rule deciding whether a path is ignored, or None.
+        """
+        for negated, dir_only, regex, rules in self.groups:
+            if dir_only and not is_dir:
+                continue
+            found = regex.match(relpath)
+            if found is not None:
+                return rules[found.lastindex - 1]
+        return None
+
+
+class IgnoreMatcher:
+    """
+    The ignore rules in force in one folder of the project.
+
+    The tool's own ignore file takes precedence over every .gitignore, a
+    .gitignore over those of the folders above it, and all of them over
+    DEFAULT_IGNORE_RULES.
+    """
+
+    def __init__(self, rule_sets):
+        self.rule_sets = rule_sets
+
+    def with_file(self, ignore_file, base):
+        """
+        Return the matcher for a folder that has its own .gitignore.
+
+        Parameters:
+            ignore_file (str): The .gitignore file.
+            base (str): Its folder, relative to the project root ('' for the root).
+
+        Returns:
+            IgnoreMatcher: The matcher for the folder and its subfolders.
+        """
+        try:
+            with open(ignore_file, 'r', encoding='utf-8', errors='replace') as infile:
+                rules = parse_ignore_lines(infile, (base + '/' if base else '') + os.path.basename(ignore_file))
+        except OSError:
+            logging.error(f"Failed to read ignore file {ignore_file}.", exc_info=True)
+            return self
+        if not rules:
+            return self
+        return IgnoreMatcher(self.rule_sets[:1] + [IgnoreRuleSet(rules, base)] + self.rule_sets[1:])
+
+    def match(self, relpath, is_dir):
+        """
+        Find the rule that decides whether a path is ignored.
+
+        Parameters:
+            relpath (str): The '/'-separated path, relative to the project root.
+            is_dir (bool): Whether the path is a directory.
+
+        Returns:
+            IgnoreRule: The deciding rule (a negated rule keeps the path), or None.
+        """
+        for rule_set in self.rule_sets:
+            rule = rule_set.match(relpath, is_dir)
+            if rule is not None:
+                return rule
+        return None
+
+
+def load_ignore_matcher(project_dir):
+    """
+    Build the ignore rules of the project root from the tool's ignore file
+    and DEFAULT_IGNORE_RULES. Each .gitignore is added by walk_project when
+    it reaches the folder holding it.
+
+    Parameters:
+        project_dir (str): The root of the project.
+
+    Returns:
+        IgnoreMatcher: The matcher for the project root.
+    """
+    ignore_file = os.path.join(project_dir, IGNORE_FILE_NAME)
+    tool_rules = []
+    if os.path.isfile(ignore_file):
+        try:
+            with open(ignore_file, 'r', encoding='utf-8', errors='replace') as infile:
+                tool_rules = parse_ignore_lines(infile, IGNORE_FILE_NAME)
+        except OSError:
+            logging.error(f"Failed to read ignore file {ignore_file}.", exc_info=True)
+    return IgnoreMatcher([
+        IgnoreRuleSet(tool_rules),
+        IgnoreRuleSet(parse_ignore_lines(DEFAULT_IGNORE_RULES, '<default>'))
+    ])
+
+
+def count_ignored(report, rule, path, is_dir, size=0):
+    """
+    Add what an ignore rule excluded to a dry-run report.
+
+    Parameters:
+        report (dict): The report, by rule source and pattern.
+        rule (IgnoreRule): The rule that excluded the path.
+        path (str): The excluded file or directory.
+        is_dir (bool): Whether the path is a directory, counted recursively.
+        size (int): The size of an excluded file.
+    """
+    counts = report.setdefault((rule.source, rule.pattern), {'files': 0, 'bytes': 0})
+    if not is_dir:
+        counts['files'] += 1
+        counts['bytes'] += size
+        return
+    for foldername, subfolders, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                counts['bytes'] += os.lstat(os.path.join(foldername, filename)).st_size
+                counts['files'] += 1
+            except OSError:
+                continue
+
+
+def walk_project(project_dir, skip_paths=(), ignore=None, report=None, folder=''):
+    """
+    Walk the project tree once, yielding every regular file that is not ignored.
+
+    Excluded and ignored directories are pruned before they are descended
+    into, and the files listed in skip_paths (absolute paths) are left out.
+    The .gitignore of each folder is read when the walk reaches it.
+
+    Parameters:
+        project_dir (str): The root of the project.
+        skip_paths (iterable): Absolute paths of files to leave out.
+        ignore (IgnoreMatcher, optional): The ignore rules of the project
+            root; load_ignore_matcher(project_dir) by default.
+        report (dict, optional): Filled with the files and bytes each
+            ignore rule excluded, by (source, pattern).
+        folder (str, optional): Only walk this folder, given '/'-separated
+            and relative to the root; ignore is then the matcher of its
+            parent folder (see ignore_matcher_for).
+
+    Yields:
+        ProjectFile: The files of the project, in os.walk order.
+    """
+    skip_paths = {os.path.normcase(os.path.abspath(p)) for p in skip_paths}
+    if ignore is None:
+        ignore = load_ignore_matcher(project_dir)
+    pending = [(os.path.join(project_dir, *folder.split('/')) if folder else project_dir, folder, ignore)]
+    while pending:
+        folder, folder_relpath, matcher = pending.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            logging.error(f"Failed to list directory {folder}.", exc_info=True)
+            continue
+        if any(entry.name == GITIGNORE_NAME for entry in entries):
+            matcher = matcher.with_file(os.path.join(folder, GITIGNORE_NAME), folder_relpath)
+        prefix = folder_relpath + '/' if folder_relpath else ''
+
+        subfolders = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if is_excluded_dir(entry.name):
+                        continue
+                    rule = matcher.match(prefix + entry.name, True)
+                    if rule is not None and not rule.negated:
+                        if report is not None:
+                            count_ignored(report, rule, entry.path, True)
+                        continue
+                    subfolders.append((entry.path, prefix + entry.name))
+                    continue
+                if not entry.is_file():
+                    continue
+                if os.path.normcase(os.path.abspath(entry.path)) in skip_paths:
+                    continue
+                file_stat = entry.stat()
+                rule = matcher.match(prefix + entry.name, False)
+                if rule is not None and not rule.negated:
+                    if report is not None:
+                        count_ignored(report, rule, entry.path, False, file_stat.st_size)
+                    continue
+                yield ProjectFile(
+                    entry.path,
+                    os.path.relpath(entry.path, project_dir),
+                    entry.name,
+                    file_stat
+                )
+            except OSError:
+                logging.error(f"Failed to stat {entry.path}.", exc_info=True)
+
+        # Depth-first, in name order, like a top-down os.walk
+        pending.extend((path, relpath, matcher) for path, relpath in reversed(subfolders))
+
+
+def walk_order_key(path):
+    """
+    Sort key putting '/'-separated paths in walk_project order: the files of
+    a folder, by name, before the content of its subfolders.
+    """
+    parts = path.split('/')
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+def ignore_matcher_for(project_dir, folder, cache):
+    """
+    Return the ignore rules in force for the entries of a folder, its own
+    .gitignore included, as walk_project has them once inside it; or None
+    when the folder itself is excluded or ignored.
+
+    Parameters:
+        project_dir (str): The root of the project.
+        folder (str): The '/'-separated folder, relative to the root ('' for the root).
+        cache (dict): Matchers already built, by folder.
+    """
+    if folder in cache:
+        return cache[folder]
+    if folder:
+        parent, _, name = folder.rpartition('/')
+        matcher = ignore_matcher_for(project_dir, parent, cache)
+        if matcher is not None:
+            rule = matcher.match(folder, True)
+            if is_excluded_dir(name) or (rule is not None and not rule.negated):
+                matcher = None
+    else:
+        matcher = load_ignore_matcher(project_dir)
+    if matcher is not None:
+        gitignore = os.path.join(project_dir, *folder.split('/'), GITIGNORE_NAME)
+        if os.path.isfile(gitignore):
+            matcher = matcher.with_file(gitignore, folder)
+    cache[folder] = matcher
+    return matcher
+
+
+def walk_changed_paths(project_dir, previous, changed_paths, skip_paths=(), racy_after_ns=None):
+    """
+    List the files of the project from the parent manifest and the paths
+    known to have changed since, without walking the whole tree.
+
+    Only the changed paths are looked at: a changed file is stat'ed, a
+    changed folder walked, and a path that no longer exists drops every file
+    the manifest has at or under it. Other files are taken from the manifest
+    as they were, except those modified while the parent was being saved,
+    which are stat'ed again.
+
+    Parameters:
+        project_dir (str): The root of the project.
+        previous (dict): Parent manifest entries by path.
+        changed_paths (iterable): '/'-separated paths, relative to the root,
+            of the files and folders created, modified or deleted.
+        skip_paths (iterable): Absolute paths of files to leave out.
+        racy_after_ns (int, optional): When the parent scan started.
+
+    Returns:
+        list: The ProjectFile entries, in walk_project order. Those taken
+        from the manifest carry an EntryStat.
+    """
+    changed = set()
+    for path in changed_paths:
+        path = path.replace(os.sep, '/').strip('/')
+        if path and not any(part in ('', '.', '..') for part in path.split('/')):
+            changed.add(path)
+    for path, entry in previous.items():
+        if racy_after_ns is not None and entry['mtime_ns'] >= racy_after_ns:
+            changed.add(path)
+    # A path below a changed folder is covered by the folder's walk
+    changed = {
+        path for path in changed
+        if not any('/'.join(path.split('/')[:depth]) in changed for depth in range(1, path.count('/') + 1))
+    }
+
+    def is_changed(path):
+        parts = path.split('/')
+        return any('/'.join(parts[:depth]) in changed for depth in range(1, len(parts) + 1))
+
+    files = {}
+    for path, entry in previous.items():
+        if not is_changed(path):
+            files[path] = ProjectFile(
+                os.path.join(project_dir, *path.split('/')), os.path.join(*path.split('/')),
+                path.rsplit('/', 1)[-1], EntryStat(entry['size'], entry['mtime_ns'])
+            )
+
+    skip_paths = {os.path.normcase(os.path.abspath(p)) for p in skip_paths}
+    matchers = {}
+    for path in sorted(changed):
+        parent, _, name = path.rpartition('/')
+        matcher = ignore_matcher_for(project_dir, parent, matchers)
+        if matcher is None:
+            continue  # In an excluded or ignored folder
+        full_path = os.path.join(project_dir, *path.split('/'))
+        try:
+            if os.path.isdir(full_path) and not os.path.islink(full_path):
+                if ignore_matcher_for(project_dir, path, matchers) is None:
+                    continue
+                for project_file in walk_project(project_dir, skip_paths, matcher, folder=path):
+                    files[manifest_path(project_file)] = project_file
+                continue
+            if not os.path.isfile(full_path) or os.path.normcase(os.path.abspath(full_path)) in skip_paths:
+                continue  # Deleted, or not a regular file
+            rule = matcher.match(path, False)
+            if rule is not None and not rule.negated:
+                continue
+            files[path] = ProjectFile(full_path, os.path.join(*path.split('/')), name, os.stat(full_path))
+        except OSError:
+            logging.error(f"Failed to stat {full_path}.", exc_info=True)
+    return [files[path] for path in sorted(files, key=walk_order_key)]
+
+
+def scan_project(project_dir, skip_paths=(), stats=None):
+    """
+    Run walk_project on a background thread and yield its results.
+
+    Walking (directory listing and stat calls) overlaps with the reads done by
+    the consumer, and the queue between the two is bounded so the walker never
+    runs more than SCAN_QUEUE_SIZE entries ahead.
+
+    Parameters:
+        project_dir (str): The root of the project.
+        skip_paths (iterable): Absolute paths of files to leave out.
+        stats (dict, optional): Updated with the number of files and bytes
+            found so far, whether the walk is done, and the seconds it took.
+
+    Yields:
+        ProjectFile: The files of the project.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(files=0, bytes=0, done=False, seconds=0.0)
+    results = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scanner():
+        try:
+            walk = walk_project(project_dir, skip_paths)
+            while True:
+                # Time spent waiting for the reader is not walk time
+                started = time.perf_counter()
+                project_file = next(walk, done)
+                stats['seconds'] += time.perf_counter() - started
+                if project_file is done:
+                    break
+                stats['files'] += 1
+                stats['bytes'] += project_file.stat.st_size
+                if not put(project_file):
+                    return
+            stats['done'] = True
+            put(done)
+        except BaseException as scan_e:
+            put(scan_e)
+
+    thread = threading.Thread(target=scanner, name='concatcode-scan', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def manifest_path(project_file):
+    """
+    Return the manifest key of a project file: its relative path with '/' separators.
+    """
+    return project_file.relpath.replace(os.sep, '/')
+
+
+def load_manifest(version_folder):
+    """
+    Load the manifest of a saved version.
+
+    Parameters:
+        version_folder (str): The version folder.
+
+    Returns:
+        dict: The manifest, or None for versions saved without one.
+    """
+    manifest_file = os.path.join(version_folder, MANIFEST_NAME)
+    if not os.path.isfile(manifest_file):
+        return None
+    with open(manifest_file, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def write_json_file(json_file, data):
+    """
+    Write a JSON file atomically, through a temporary file and a rename.
+
+    Parameters:
+        json_file (str): The file to write.
+        data: The data to serialise.
+    """
+    temp_file = json_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as outfile:
+        json.dump(data, outfile, separators=(',', ':'))
+    os.replace(temp_file, json_file)
+
+
+def write_manifest(version_folder, manifest):
+    """
+    Write the manifest of a version atomically, so a version folder either has
+    a complete manifest or none at all.
+
+    Parameters:
+        version_folder (str): The version folder.
+        manifest (dict): The manifest to write.
+    """
+    write_json_file(os.path.join(version_folder, MANIFEST_NAME), manifest)
+
+
+def parse_version_number(version):
+    """
+    Convert a version number such as '1.05' to an exact count of hundredths.
+
+    Parameters:
+        version (str): The version number.
+
+    Returns:
+        int: The version number in hundredths (105 for '1.05').
+
+    Raises:
+        ValueError: If the version number is malformed.
+    """
+    major, _, minor = version.partition('.')
+    if not major.isdigit() or not (minor.isdigit() or minor == '') or len(minor) > 2:
+        raise ValueError(f"Invalid version number {version!r}")
+    return int(major) * 100 + int(minor.ljust(2, '0'))
+
+
+def format_version_number(number):
+    """
+    Format a version number counted in hundredths, as in folder names.
+
+    Parameters:
+        number (int): The version number in hundredths.
+
+    Returns:
+        str: The version number, such as '1.05'.
+    """
+    return f"{number // 100}.{number % 100:02d}"
+
+
+def parse_version_name(name):
+    """
+    Split a version folder name (version_<number>_<datetime>) into its parts.
+
+    Parameters:
+        name (str): The version folder name, or the name of its archive.
+
+    Returns:
+        tuple: (number in hundredths, datetime string), or None if the name is
+        not a version name.
+    """
+    if name.endswith('.zip'):
+        name = name[:-len('.zip')]
+    parts = name.split('_', 2)
+    if len(parts) < 3 or parts[0] != 'version':
+        return None
+    try:
+        return parse_version_number(parts[1]), parts[2]
+    except ValueError:
+        return None
+
+
+def compute_hash_root(entries):
+    """
+    Compute a single hash identifying the content of a version.
+
+    Parameters:
+        entries (list): The manifest entries of the version.
+
+    Returns:
+        str: The hex digest over the sorted paths and hashes of the files.
+    """
+    digest = hashlib.new(HASH_NAME)
+    for entry in sorted(entries, key=lambda entry: entry['path']):
+        digest.update(f"{entry['path']}\0{entry['hash']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def catalog_files(script_dir, name=CATALOG_NAME):
+    """
+    Return the paths of the catalog database (or of another database of the
+    store) and its journals, which are never saved with the project.
+    """
+    catalog_file = os.path.join(script_dir, name)
+    return (catalog_file,) + tuple(catalog_file + suffix for suffix in ('-journal', '-wal', '-shm'))
+
+
+def store_files(script_dir):
+    """
+    Return the paths of the files the tool keeps beside the versions (its
+    catalog, search index, settings, metrics and benchmark baseline), which
+    are never saved with the project.
+    """
+    return (
+        catalog_files(script_dir) + catalog_files(script_dir, SEARCH_INDEX_NAME)
+        + tuple(
+            os.path.join(script_dir, name)
+            for name in (SETTINGS_FILE_NAME, METRICS_FILE_NAME, BENCH_BASELINE_NAME)
+        )
+    )
+
+
+@contextmanager
+def open_catalog(script_dir):
+    """
+    Open the version catalog of a store, rebuilding it from the version
+    folders and archives when it does not exist.
+
+    Each call opens its own connection, so the catalog can be used from any
+    thread; the with block runs as a single transaction.
+
+    Parameters:
+        script_dir (str): The directory holding the versions.
+
+    Yields:
+        sqlite3.Connection: The catalog.
+    """
+    catalog_file = os.path.join(script_dir, CATALOG_NAME)
+    missing = not os.path.exists(catalog_file)
+    connection = sqlite3.connect(catalog_file, timeout=30)
+    try:
+        connection.row_factory = sqlite3.Row
+        connection.executescript(CATALOG_SCHEMA)
+        with connection:
+            if missing:
+                _rebuild_catalog(connection, script_dir)
+            yield connection
+    finally:
+        connection.close()
+
+
+def _catalog_row(name, state, manifest=None, file_count=None, total_bytes=None):
+    """
+    Build the catalog row of a version, taking its statistics from the
+    manifest when there is one.
+    """
+    number, current_datetime = parse_version_name(name)
+    hash_root = None
+    if manifest is not None:
+        entries = manifest['files']
+        file_count = len(entries)
+        total_bytes = sum(entry['size'] for entry in entries)
+        hash_root = compute_hash_root(entries)
+    return name, number, current_datetime, file_count, total_bytes, hash_root, state
+
+
+def _rebuild_catalog(connection, script_dir):
+    """
+    Fill the catalog from the version folders, Archived_Versions and the packs.
+    """
+    rows = []
+    for folder in os.listdir(script_dir):
+        version_folder = os.path.join(script_dir, folder)
+        if parse_version_name(folder) is None or not os.path.isdir(version_folder):
+            continue
+        try:
+            # An interrupted save keeps its number reserved
+            if os.path.exists(os.path.join(version_folder, IN_PROGRESS_MARKER)):
+                rows.append(_catalog_row(folder, SAVING))
+                continue
+            manifest = load_manifest(version_folder)
+            if manifest is not None:
+                rows.append(_catalog_row(folder, SAVED, manifest))
+                continue
+            # Older versions only have a Source folder
+            source_copy_folder = os.path.join(version_folder, "Source")
+            if os.path.isdir(source_copy_folder):
+                sizes = [
+                    os.path.getsize(os.path.join(foldername, filename))
+                    for foldername, subfolders, filenames in os.walk(source_copy_folder)
+                    for filename in filenames
+                ]
+                rows.append(_catalog_row(folder, SAVED, file_count=len(sizes), total_bytes=sum(sizes)))
+        except (OSError, ValueError):
+            logging.error(f"Failed to catalog version {folder}.", exc_info=True)
+
+    archive_folder = os.path.join(script_dir, "Archived_Versions")
+    if os.path.isdir(archive_folder):
+        for archive_name in os.listdir(archive_folder):
+            if not archive_name.endswith('.zip') or parse_version_name(archive_name) is None:
+                continue
+            name = archive_name[:-len('.zip')]
+            try:
+                with zipfile.ZipFile(os.path.join(archive_folder, archive_name)) as archive:
+                    if MANIFEST_NAME in archive.namelist():
+                        manifest = json.loads(archive.read(MANIFEST_NAME).decode('utf-8'))
+                        rows.append(_catalog_row(name, ARCHIVED, manifest))
+                    else:
+                        members = [
+                            member for member in archive.infolist()
+                            if member.filename.startswith('Source/') and not member.is_dir()
+                        ]
+                        rows.append(_catalog_row(
+                            name, ARCHIVED,
+                            file_count=len(members), total_bytes=sum(member.file_size for member in members)
+                        ))
+            except (OSError, ValueError, zipfile.BadZipFile):
+                logging.error(f"Failed to catalog archive {archive_name}.", exc_info=True)
+
+    try:
+        with PackStore(script_dir) as packs:
+            for name in packs.version_names():
+                rows.append(_catalog_row(name, PACKED, packs.load_manifest(name)))
+    except (OSError, ValueError, zipfile.BadZipFile):
+        logging.error("Failed to catalog the version packs.", exc_info=True)
+
+    connection.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def rebuild_catalog(script_dir=None):
+    """
+    Recreate the version catalog from the version folders and archives, for
+    stores whose folders were changed by hand.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+
+    Returns:
+        dict: The number of versions cataloged.
+    """
+    script_dir, _ = resolve_dirs(script_dir)
+    with VERSION_LOCK:
+        for catalog_file in catalog_files(script_dir):
+            if os.path.exists(catalog_file):
+                os.remove(catalog_file)
+        with open_catalog(script_dir) as catalog:
+            count = catalog.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+    return {'versions': count}
+
+
+def allocate_version(script_dir, current_datetime):
+    """
+    Reserve the next version number in the catalog.
+
+    Parameters:
+        script_dir (str): The directory holding the versions.
+        current_datetime (str): The date and time of the new version.
+
+    Returns:
+        tuple: (version number, version folder name).
+    """
+    with open_catalog(script_dir) as catalog:
+        # Take the write lock first, so concurrent processes get distinct numbers
+        catalog.execute("BEGIN IMMEDIATE")
+        last = catalog.execute("SELECT MAX(number) FROM versions").fetchone()[0]
+        version = format_version_number((last or 0) + 1)
+        name = f"version_{version}_{current_datetime}"
+        catalog.execute(
+            "INSERT INTO versions (name, number, datetime, state) VALUES (?, ?, ?, ?)",
+            (name, (last or 0) + 1, current_datetime, SAVING)
+        )
+    return version, name
+
+
+def try_lock_file(lock_file, shared=False):
+    """
+    Take an exclusive lock on an open file without waiting. Two opens of the
+    file conflict even within a process; the lock is released when the file
+    is closed.
+
+    Parameters:
+        lock_file (file): The file, opened for writing.
+        shared (bool): Take a shared lock instead, which only conflicts with
+            exclusive ones. Windows has no shared locks: the lock taken
+            there is exclusive.
+
+    Returns:
+        bool: True if the lock was taken; False if it is held elsewhere, or
+        if the system has no file locks.
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            return True
+        if msvcrt is not None:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+    except OSError:
+        pass
+    return False
+
+
+def lock_marker(version_folder):
+    """
+    Create the in-progress marker of a version folder, locked for as long as
+    the save runs.
+
+    Parameters:
+        version_folder (str): The folder of the version being saved.
+
+    Returns:
+        file: The marker, to close once the save has finished or failed.
+    """
+    marker_file = os.path.join(version_folder, IN_PROGRESS_MARKER)
+    if fcntl is None:
+        marker = open(marker_file, 'a+b')
+        try_lock_file(marker)
+        return marker
+    # Locked before it appears, so no other process can take it for a crashed save
+    temp_file = temp_file_for(marker_file)
+    marker = open(temp_file, 'a+b')
+    try_lock_file(marker)
+    os.replace(temp_file, marker_file)
+    return marker
+
+
+def save_interrupted(version_folder):
+    """
+    Tell whether the save of a version folder was interrupted by a crash:
+    its in-progress marker is there, but no running save holds its lock.
+    """
+    marker_file = os.path.join(version_folder, IN_PROGRESS_MARKER)
+    if not os.path.isfile(marker_file):
+        return False
+    with open(marker_file, 'a+b') as marker:
+        return try_lock_file(marker)
+
+
+def remove_save_state(version_folder):
+    """
+    Remove what a save keeps in its version folder while it runs: the
+    journal, the outputs of an interrupted attempt and the in-progress marker.
+    """
+    journal_file = os.path.join(version_folder, JOURNAL_NAME)
+    if os.path.exists(journal_file):
+        os.remove(journal_file)
+    resume_folder = os.path.join(version_folder, RESUME_DIR_NAME)
+    if os.path.isdir(resume_folder):
+        remove_tree(resume_folder)
+    os.remove(os.path.join(version_folder, IN_PROGRESS_MARKER))
+
+
+def claim_interrupted_save(script_dir):
+    """
+    Deal with the saves a crash interrupted: version folders that still have
+    their in-progress marker, but no running save holding its lock.
+
+    The most recent one is claimed for the next save to resume, as long as
+    no version was saved since; the others are removed, with their catalog
+    entries, so no orphaned folder keeps its number. A save that had written
+    its manifest before it stopped is completed instead. Systems without file
+    locks never claim anything.
+
+    Parameters:
+        script_dir (str): The directory holding the versions.
+
+    Returns:
+        tuple: (version folder name, locked marker) of the save to resume,
+        or (None, None).
+    """
+    with open_catalog(script_dir) as catalog:
+        names = [row['name'] for row in catalog.execute(
+            "SELECT name FROM versions WHERE state = ? ORDER BY number DESC, datetime DESC", (SAVING,)
+        )]
+        last_saved = catalog.execute(
+            "SELECT MAX(number) FROM versions WHERE state IN (?, ?, ?)", (SAVED, PACKED, ARCHIVED)
+        ).fetchone()[0]
+
+    claimed, claimed_marker = None, None
+    for name in names:
+        version_folder = os.path.join(script_dir, name)
+        marker_file = os.path.join(version_folder, IN_PROGRESS_MARKER)
+        if not os.path.isfile(marker_file):
+            continue  # Being created, or finishing
+        marker = open(marker_file, 'a+b')
+        if not try_lock_file(marker):
+            marker.close()  # Still being saved
+            continue
+        try:
+            manifest = load_manifest(version_folder)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is not None:
+            marker.close()
+            remove_save_state(version_folder)
+            with open_catalog(script_dir) as catalog:
+                catalog.execute(
+                    "INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?)", _catalog_row(name, SAVED, manifest)
+                )
+            continue
+        if claimed is None and (last_saved is None or parse_version_name(name)[0] > last_saved):
+            claimed, claimed_marker = name, marker
+            continue
+        marker.close()
+        remove_tree(version_folder)
+        with open_catalog(script_dir) as catalog:
+            catalog.execute("DELETE FROM versions WHERE name = ?", (name,))
+    return claimed, claimed_marker
+
+
+class SaveJournal:
+    """
+    Records the files a save has completed, so that the next save can resume
+    it after a crash.
+
+    Entries are written in batches, at checkpoints where every sink has
+    first pushed its output to disk: the journal only refers to data that
+    is complete, which the resumed save copies instead of reading, hashing
+    and compressing the files again.
+    """
+
+    def __init__(self, journal_file, scan_started_ns, concat_file):
+        self.outfile = open(journal_file, 'w', encoding='utf-8')
+        self.concat_file = concat_file
+        self.pending = []
+        self.last_checkpoint = time.monotonic()
+        self.outfile.write(json.dumps({'scan_started_ns': scan_started_ns}) + "\n")
+
+    def add(self, entry):
+        record = dict(entry)
+        if 'concat' in record:
+            # Resumed sections are looked up by part name
+            record.setdefault('concat_file', self.concat_file)
+        self.pending.append(record)
+
+    def due(self):
+        return time.monotonic() - self.last_checkpoint >= JOURNAL_INTERVAL
+
+    def checkpoint(self, sinks):
+        for sink in sinks:
+            sink.flush()
+        for record in self.pending:
+            self.outfile.write(json.dumps(record) + "\n")
+        self.pending = []
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+        self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.outfile.close()
+
+
+def load_journal(journal_file):
+    """
+    Read the journal an interrupted save left.
+
+    Parameters:
+        journal_file (str): The journal.
+
+    Returns:
+        tuple: (when the interrupted scan started in ns, or None, entries
+        by path). A line cut short by the crash ends the journal.
+    """
+    scan_started_ns = None
+    entries = {}
+    if not os.path.isfile(journal_file):
+        return scan_started_ns, entries
+    with open(journal_file, 'r', encoding='utf-8') as infile:
+        for number, line in enumerate(infile):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if number == 0:
+                scan_started_ns = record['scan_started_ns']
+            else:
+                entries[record['path']] = record
+    return scan_started_ns, entries
+
+
+def find_parent_version(script_dir):
+    """
+    Find the most recent saved version that has a manifest.
+
+    Parameters:
+        script_dir (str): The directory holding the version folders.
+
+    Returns:
+        tuple: (version folder name, manifest), or (None, None) if there is none.
+    """
+    with open_catalog(script_dir) as catalog:
+        rows = catalog.execute(
+            "SELECT name FROM versions WHERE state = ? AND hash_root IS NOT NULL "
+            "ORDER BY number DESC, datetime DESC", (SAVED,)
+        ).fetchall()
+
+    for (folder,) in rows:
+        try:
+            manifest = load_manifest(os.path.join(script_dir, folder))
+        except (OSError, ValueError):
+            logging.error(f"Failed to load the manifest of {folder}.", exc_info=True)
+            continue
+        if manifest is not None:
+            return folder, manifest
+    return None, None
+
+
+def concat_header(name):
+    """
+    Return the line that opens the section of a file in the concat output.
+    """
+    return f"\n// File: {name}\n".encode('utf-8')
+
+
+# Closes the section of every file in the concat output
+CONCAT_TRAILER = ("\n" + SEPARATOR + "\n").encode('utf-8')
+
+
+def concat_index_file(concat_file):
+    """
+    Return the path of the index written beside a concat file.
+    """
+    if concat_file.endswith(CONCAT_GZIP_SUFFIX):
+        concat_file = concat_file[:-len(CONCAT_GZIP_SUFFIX)]
+    return os.path.splitext(concat_file)[0] + CONCAT_INDEX_SUFFIX
+
+
+def concat_part_file(output_file, part, compress=False):
+    """
+    Return the path of one part of a concat output split into shards.
+
+    The first part keeps the output's own name; the next ones are numbered,
+    e.g. concat_files_v0.03_<date>.part2.txt.
+    """
+    if part > 1:
+        base, extension = os.path.splitext(output_file)
+        output_file = f"{base}.part{part}{extension}"
+    return output_file + CONCAT_GZIP_SUFFIX if compress else output_file
+
+
+def open_concat_part(concat_file):
+    """
+    Open a concat file for reading, decompressing it if it was gzipped.
+    """
+    if concat_file.endswith(CONCAT_GZIP_SUFFIX):
+        return gzip.open(concat_file, 'rb')
+    return open(concat_file, 'rb')
+
+
+def is_binary_chunk(chunk):
+    """
+    Tell whether the start of a file looks binary: like git, any NUL byte
+    in its first BINARY_SNIFF_SIZE bytes.
+    """
+    return b'\0' in chunk[:BINARY_SNIFF_SIZE]
+
+
+class ConcatSink:
+    """
+    Appends source files to the concatenated text output.
+
+    The output stays open in a single buffered writer, optionally gzipped as
+    a stream, and each file is copied through it chunk by chunk. Files larger
+    than max_file_bytes or that look binary are left out and recorded in
+    skipped, by relative path. With shard_bytes, a new part is started when
+    the next section would take the current one past that size; a section
+    is never split.
+
+    Sections of files that did not change since the parent version are copied
+    from the parent's concat files instead of being rebuilt from the source
+    (unless the parent's are compressed, as they cannot be seeked in). A
+    resumed save copies the sections the interrupted attempt completed from
+    its concat files, moved to resume_folder, the same way.
+    The offset, length and hash of each file's text are collected in index,
+    by relative path.
+    """
+    phase = 'concat'
+
+    def __init__(self, output_file, parent_output_file=None, header=b'', max_file_bytes=None, shard_bytes=None,
+                 compress=False, compresslevel=6, resume_folder=None):
+        self.output_file = output_file
+        self.header = header
+        self.max_file_bytes = max_file_bytes
+        self.shard_bytes = shard_bytes
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self.parent_output_file = parent_output_file
+        self.resume_folder = resume_folder
+        self.parent_files = {}
+        self.files = []
+        self.entry = None
+        self.raw_file = None
+        self.outfile = None
+        self.decoder = None
+        self.digest = None
+        self.section_start = 0
+        self.content_start = 0
+        self.skipping = None
+        self.index = {}
+        self.skipped = {}
+        self._open_part()
+
+    @property
+    def concat_file(self):
+        """
+        The name of the part being written.
+        """
+        return self.files[-1]
+
+    def _open_part(self):
+        self.close_output()
+        part_file = concat_part_file(self.output_file, len(self.files) + 1, self.compress)
+        self.raw_file = open(part_file, 'wb')
+        if self.compress:
+            self.outfile = gzip.GzipFile(
+                filename='', mode='wb', fileobj=self.raw_file, compresslevel=self.compresslevel, mtime=0
+            )
+        else:
+            self.outfile = self.raw_file
+        self.files.append(os.path.basename(part_file))
+        self.outfile.write(self.header)
+
+    def _start_section(self, expected_length):
+        # Only start a new part once the current one holds a section
+        position = self.outfile.tell()
+        if (self.shard_bytes and position > len(self.header)
+                and position + expected_length > self.shard_bytes):
+            self._open_part()
+        return self.outfile.tell()
+
+    def _record(self, entry, offset, length, content_offset, content_length, content_hash):
+        entry['concat'] = [offset, length]
+        index_entry = {'offset': content_offset, 'length': content_length, 'hash': content_hash}
+        if len(self.files) > 1:
+            # Sections outside the first part say which part holds them
+            entry['concat_file'] = self.concat_file
+            index_entry['file'] = self.concat_file
+        self.index[entry['path']] = index_entry
+
+    def _skip(self, entry, reason):
+        entry['concat_skipped'] = reason
+        self.skipped[entry['path']] = reason
+
+    def _parent_file(self, name):
+        if name not in self.parent_files:
+            parent_file = None
+            folders = [self.resume_folder]
+            if self.parent_output_file:
+                folders.append(os.path.dirname(self.parent_output_file))
+            for folder in folders:
+                if folder is None or name.endswith(CONCAT_GZIP_SUFFIX):
+                    continue
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    parent_file = open(path, 'rb')
+                    break
+            self.parent_files[name] = parent_file
+        return self.parent_files[name]
+
+    def accepts(self, project_file):
+        return project_file.name.endswith(SOURCE_EXTENSIONS)
+
+    def reuse(self, project_file, entry, previous_entry):
+        if self.max_file_bytes is not None and entry['size'] > self.max_file_bytes:
+            self._skip(entry, 'size')
+            return True
+        if previous_entry.get('concat_skipped') == 'binary':
+            self._skip(entry, 'binary')
+            return True
+        if 'concat' not in previous_entry:
+            return False
+        name = previous_entry.get('concat_file')
+        if name is None and self.parent_output_file is not None:
+            name = os.path.basename(self.parent_output_file)
+        parent_file = self._parent_file(name) if name is not None else None
+        if parent_file is None:
+            return False
+        offset, length = previous_entry['concat']
+        header_length = len(concat_header(project_file.name))
+        content_end = length - len(CONCAT_TRAILER)
+        if content_end < header_length or offset + length > os.fstat(parent_file.fileno()).st_size:
+            # The parent concat file is shorter than its manifest says
+            return False
+        start = self._start_section(length)
+        parent_file.seek(offset)
+        digest = hashlib.new(HASH_NAME)
+        position = 0
+        while position < length:
+            chunk = parent_file.read(min(length - position, READ_CHUNK_SIZE))
+            self.outfile.write(chunk)
+            digest.update(chunk[max(header_length - position, 0):max(content_end - position, 0)])
+            position += len(chunk)
+        self._record(
+            entry, start, length, start + header_length, content_end - header_length, digest.hexdigest()
+        )
+        return True
+
+    def begin(self, project_file, entry):
+        self.entry = entry
+        self.name = project_file.name
+        self.skipping = None
+        if self.max_file_bytes is not None and entry['size'] > self.max_file_bytes:
+            self.skipping = 'size'
+        # The section is started on the first chunk, once it is known to be text
+        self.decoder = None
+
+    def _begin_section(self):
+        self.section_start = self._start_section(self.entry['size'])
+        # Decode like a text-mode read: undecodable bytes dropped, newlines translated
+        self.decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder('utf-8')(errors='ignore'), translate=True
+        )
+        self.digest = hashlib.new(HASH_NAME)
+        self.outfile.write(concat_header(self.name))
+        self.content_start = self.outfile.tell()
+
+    def feed(self, chunk):
+        if self.skipping is not None:
+            return
+        if self.decoder is None:
+            if is_binary_chunk(chunk):
+                self.skipping = 'binary'
+                return
+            self._begin_section()
+        text = self.decoder.decode(chunk).encode('utf-8')
+        self.digest.update(text)
+        self.outfile.write(text)
+
+    def end(self):
+        if self.skipping is not None:
+            self._skip(self.entry, self.skipping)
+            return
+        if self.decoder is None:
+            self._begin_section()  # Empty file
+        tail = self.decoder.decode(b'', final=True).encode('utf-8')
+        self.digest.update(tail)
+        self.outfile.write(tail)
+        content_end = self.outfile.tell()
+        self.outfile.write(CONCAT_TRAILER)
+        self._record(
+            self.entry, self.section_start, self.outfile.tell() - self.section_start,
+            self.content_start, content_end - self.content_start, self.digest.hexdigest()
+        )
+
+    def flush(self):
+        # A compressed stream cannot be resumed: only plain parts are flushed
+        if not self.compress:
+            self.outfile.flush()
+            os.fsync(self.outfile.fileno())
+
+    def abort(self):
+        if self.entry is not None:
+            self.index.pop(self.entry['path'], None)
+            self.skipped.pop(self.entry['path'], None)
+        if self.decoder is None or self.compress:
+            # Nothing written yet, or a compressed stream that cannot be cut:
+            # the partial section stays there, out of the index
+            return
+        # Drop the partial section
+        self.outfile.seek(self.section_start)
+        self.outfile.truncate()
+        self.decoder = None
+
+    def close_output(self):
+        if self.outfile is not None and self.outfile is not self.raw_file:
+            self.outfile.close()
+        if self.raw_file is not None:
+            self.raw_file.close()
+        self.outfile = self.raw_file = None
+
+    def close(self):
+        self.close_output()
+        for parent_file in self.parent_files.values():
+            if parent_file is not None:
+                parent_file.close()
+        self.parent_files = {}
+
+
+def object_path(objects_dir, content_hash):
+    """
+    Return where an object is kept in the content-addressed store.
+
+    Parameters:
+        objects_dir (str): The object store directory.
+        content_hash (str): The hex digest of the content.
+
+    Returns:
+        str: The path of the object file.
+    """
+    return os.path.join(objects_dir, content_hash[:2], content_hash[2:])
+
+
+class ObjectStoreSink:
+    """
+    Stores source files in the content-addressed object store, each distinct
+    content written once, and links them into the version's Source folder.
+
+    Where neither hardlinks nor reflinks are supported the Source folder
+    stays incomplete and the manifest alone references the objects.
+    """
+    phase = 'objects'
+
+    def __init__(self, objects_dir, source_copy_folder):
+        self.objects_dir = objects_dir
+        self.source_copy_folder = source_copy_folder
+        self.temp_dir = os.path.join(objects_dir, 'tmp')
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.outfile = None
+        self.temp_file = None
+        # The Source folder is flat: the last file with a given name wins
+        self.owners = {}
+
+    def accepts(self, project_file):
+        return project_file.name.endswith(SOURCE_EXTENSIONS)
+
+    def _link_source(self, project_file, entry):
+        destination_file = os.path.join(self.source_copy_folder, project_file.name)
+        # Never write through an existing file: it is an object shared with other versions
+        if os.path.lexists(destination_file):
+            if os.name == 'nt':
+                os.chmod(destination_file, stat.S_IWRITE)  # Windows refuses to delete read-only files
+            os.remove(destination_file)
+        object_file = object_path(self.objects_dir, entry['hash'])
+        try:
+            os.link(object_file, destination_file)
+        except OSError:
+            # A reflink costs no space either; otherwise the manifest alone references the object
+            try:
+                clone_file(object_file, destination_file)
+            except OSError:
+                pass
+
+        previous_owner = self.owners.get(project_file.name)
+        if previous_owner is not None:
+            previous_owner.pop('source', None)
+        self.owners[project_file.name] = entry
+        entry['source'] = True
+
+    def reuse(self, project_file, entry, previous_entry):
+        if not os.path.isfile(object_path(self.objects_dir, entry['hash'])):
+            return False
+        self._link_source(project_file, entry)
+        return True
+
+    def begin(self, project_file, entry):
+        self.project_file = project_file
+        self.entry = entry
+        fd, self.temp_file = tempfile.mkstemp(dir=self.temp_dir)
+        self.outfile = os.fdopen(fd, 'wb')
+
+    def feed(self, chunk):
+        self.outfile.write(chunk)
+
+    def end(self):
+        self.outfile.close()
+        self.outfile = None
+        destination = object_path(self.objects_dir, self.entry['hash'])
+        if os.path.isfile(destination):
+            os.remove(self.temp_file)
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Objects are shared between versions and must never change
+            os.chmod(self.temp_file, 0o444)
+            os.replace(self.temp_file, destination)
+        self.temp_file = None
+        self._link_source(self.project_file, self.entry)
+
+    def flush(self):
+        pass  # Each object is complete once renamed into the store
+
+    def abort(self):
+        if self.outfile is not None:
+            self.outfile.close()
+            self.outfile = None
+        if self.temp_file is not None:
+            os.remove(self.temp_file)
+            self.temp_file = None
+
+    def close(self):
+        self.abort()
+
+
+def zip_compress_type(name):
+    """
+    Choose how a file is stored in a ZIP: formats that are compressed already
+    are stored as they are, as deflating them again costs time for no gain.
+
+    Parameters:
+        name (str): The file name.
+
+    Returns:
+        int: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED.
+    """
+    return zipfile.ZIP_STORED if name.lower().endswith(COMPRESSED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+
+def deflate_block(data, zdict, last, compresslevel):
+    """
+    Compress one block of a ZIP member as raw deflate.
+
+    Blocks end on a byte boundary (sync flush) and only the last one carries
+    the final-block bit, so the compressed blocks of a member can simply be
+    written one after the other. Priming the compressor with the end of the
+    previous block keeps the ratio close to a single-stream deflate.
+
+    Parameters:
+        data (bytes): The uncompressed block.
+        zdict (bytes): The data preceding the block, or b'' for the first one.
+        last (bool): Whether this is the last block of the member.
+        compresslevel (int): The zlib compression level.
+
+    Returns:
+        bytes: The compressed block.
+    """
+    if zdict:
+        compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict
+        )
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ZipMemberWriter:
+    """
+    A member being written to a ParallelZipWriter.
+    """
+
+    def __init__(self, archive, zinfo, zip64):
+        self.archive = archive
+        self.zinfo = zinfo
+        self.zip64 = zip64
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = None
+        self.buffer = bytearray()
+        self.zdict = b''
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.file_size += len(data)
+        self.buffer += data
+        while len(self.buffer) >= ZIP_BLOCK_SIZE:
+            block = bytes(self.buffer[:ZIP_BLOCK_SIZE])
+            del self.buffer[:ZIP_BLOCK_SIZE]
+            self.archive._submit(self, block, last=False)
+
+    def close(self):
+        self.archive._submit(self, bytes(self.buffer), last=True)
+        self.buffer = bytearray()
+
+    def discard(self):
+        self.archive._discard(self)
+
+
+class ParallelZipWriter:
+    """
+    Writes a ZIP archive whose members are compressed on a thread pool.
+
+    Members are cut into blocks that are deflated independently and written
+    back in order, so both many small files and one large file keep all the
+    workers busy (zlib releases the GIL while compressing). At most a few
+    blocks per worker are in flight, which bounds memory. The archives are
+    plain ZIP files (with ZIP64 records where needed) readable by zipfile.
+    """
+
+    def __init__(self, zip_file_name, workers=None, compresslevel=6, comment=b''):
+        self.fp = open(zip_file_name, 'wb')
+        self.workers = workers or os.cpu_count() or 1
+        self.compresslevel = compresslevel
+        self.comment = comment
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='concatcode-zip')
+        self.max_pending = self.workers * 4
+        # (member, compressed block or future, last) in archive order
+        self.pending = deque()
+        self.finished = []
+
+    def compression_ratio(self):
+        """
+        Return the compressed size of the members written so far, as a
+        fraction of their original size.
+        """
+        return compression_ratio(
+            sum(member.compress_size for member in self.finished), sum(member.file_size for member in self.finished)
+        )
+
+    def open_member(self, zinfo, size_hint=0):
+        """
+        Start a new member. Its data is written through the returned object.
+
+        Parameters:
+            zinfo (zipfile.ZipInfo): Name, date, attributes and compression of the member.
+            size_hint (int): The expected size, to decide on ZIP64 headers up front.
+
+        Returns:
+            ZipMemberWriter: The member.
+        """
+        return ZipMemberWriter(self, zinfo, zip64=size_hint * 1.05 > ZIP64_LIMIT)
+
+    def write_file(self, file_path, arcname, compress_type=zipfile.ZIP_DEFLATED):
+        """
+        Add a file from disk.
+
+        Parameters:
+            file_path (str): The file to add.
+            arcname (str): Its name in the archive.
+            compress_type (int): zipfile.ZIP_DEFLATED or zipfile.ZIP_STORED.
+        """
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        zinfo.compress_type = compress_type
+        with open(file_path, 'rb') as infile:
+            self.write_fileobj(infile, zinfo, zinfo.file_size)
+
+    def write_fileobj(self, infile, zinfo, size_hint=0):
+        """
+        Add a member read from an open file.
+
+        Parameters:
+            infile (file): The data, opened for binary reading.
+            zinfo (zipfile.ZipInfo): Name, date, attributes and compression of the member.
+            size_hint (int): The expected size, to decide on ZIP64 headers up front.
+        """
+        member = self.open_member(zinfo, size_hint)
+        while True:
+            chunk = infile.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            member.write(chunk)
+        member.close()
+
+    def copy_member(self, zinfo, crc, file_size, infile, data_offset, compress_size):
+        """
+        Add a member whose compressed data is copied as it is from another
+        ZIP, without compressing it again.
+
+        Parameters:
+            zinfo (zipfile.ZipInfo): Name, date, attributes and compression of the member.
+            crc (int): The CRC-32 of the uncompressed data.
+            file_size (int): The size of the uncompressed data.
+            infile (file): The other ZIP, opened for binary reading.
+            data_offset (int): Where the compressed data starts in it.
+            compress_size (int): The size of the compressed data.
+        """
+        member = ZipMemberWriter(self, zinfo, zip64=max(file_size, compress_size) > ZIP64_LIMIT)
+        member.crc = crc
+        member.file_size = file_size
+        infile.seek(data_offset)
+        remaining = compress_size
+        while True:
+            chunk = infile.read(min(remaining, READ_CHUNK_SIZE))
+            remaining -= len(chunk)
+            if remaining > 0 and not chunk:
+                raise EOFError(f"{zinfo.filename} is cut short in {infile.name}")
+            # Ready blocks keep their place among the ones still being compressed
+            self.pending.append((member, chunk, remaining <= 0))
+            self._drain(self.max_pending)
+            if remaining <= 0:
+                break
+
+    def flush(self):
+        """
+        Write out every member submitted so far and push the file to disk, so
+        they survive a crash.
+        """
+        self._drain(0)
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+
+    def _submit(self, member, data, last):
+        if member.zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            block = self.executor.submit(deflate_block, data, member.zdict, last, self.compresslevel)
+            member.zdict = (member.zdict + data)[-ZIP_WINDOW_SIZE:]
+        else:
+            block = data
+        self.pending.append((member, block, last))
+        self._drain(self.max_pending)
+
+    def _drain(self, limit):
+        # Write out finished blocks in order, waiting only while more than limit are in flight
+        while self.pending:
+            member, block, last = self.pending[0]
+            if not isinstance(block, bytes):
+                if not block.done() and len(self.pending) <= limit:
+                    return
+                block = block.result()
+            self.pending.popleft()
+
+            if member.header_offset is None:
+                member.header_offset = self.fp.tell()
+                self.fp.write(self._local_header(member))
+            self.fp.write(block)
+            member.compress_size += len(block)
+            if last:
+                self._finish_member(member)
+
+    def _discard(self, member):
+        # Only the member being written can be discarded: it is the last one in the file
+        self._drain(0)
+        if member.header_offset is not None:
+            self.fp.seek(member.header_offset)
+            self.fp.truncate()
+        if member in self.finished:
+            self.finished.remove(member)
+
+    def _finish_member(self, member):
+        if not member.zip64 and (member.file_size > ZIP64_LIMIT or member.compress_size > ZIP64_LIMIT):
+            raise zipfile.LargeZipFile(f"{member.zinfo.filename} grew too large while being written")
+        # Sizes and CRC are only known now: rewrite the local header
+        end = self.fp.tell()
+        self.fp.seek(member.header_offset)
+        self.fp.write(self._local_header(member))
+        self.fp.seek(end)
+        self.finished.append(member)
+
+    def _dos_date_time(self, member):
+        year, month, day, hour, minute, second = member.zinfo.date_time
+        dosdate = (year - 1980) << 9 | month << 5 | day
+        dostime = hour << 11 | minute << 5 | (second // 2)
+        return dostime, dosdate
+
+    def _encoded_name(self, member):
+        try:
+            return member.zinfo.filename.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return member.zinfo.filename.encode('utf-8'), 0x800
+
+    def _local_header(self, member):
+        name, flags = self._encoded_name(member)
+        dostime, dosdate = self._dos_date_time(member)
+        if member.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, member.file_size, member.compress_size)
+            file_size = compress_size = 0xFFFFFFFF
+            version = ZIP64_VERSION
+        else:
+            extra = b''
+            file_size, compress_size = member.file_size, member.compress_size
+            version = DEFAULT_ZIP_VERSION
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, version, flags, member.zinfo.compress_type,
+            dostime, dosdate, member.crc, compress_size, file_size, len(name), len(extra)
+        ) + name + extra
+
+    def _central_header(self, member):
+        name, flags = self._encoded_name(member)
+        dostime, dosdate = self._dos_date_time(member)
+        zip64_fields = []
+        file_size, compress_size, header_offset = member.file_size, member.compress_size, member.header_offset
+        if file_size > ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = 0xFFFFFFFF
+        if compress_size > ZIP64_LIMIT:
+            zip64_fields.append(compress_size)
+            compress_size = 0xFFFFFFFF
+        if header_offset > ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = 0xFFFFFFFF
+        extra = b''
+        version = DEFAULT_ZIP_VERSION
+        if zip64_fields:
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields)
+            version = ZIP64_VERSION
+        return struct.pack(
+            '<IBBHHHHHIIIHHHHHII', 0x02014b50, version, member.zinfo.create_system, version, flags,
+            member.zinfo.compress_type, dostime, dosdate, member.crc, compress_size, file_size,
+            len(name), len(extra), 0, 0, 0, member.zinfo.external_attr, header_offset
+        ) + name + extra
+
+    def close(self):
+        """
+        Write the remaining members and the central directory.
+        """
+        try:
+            self._drain(0)
+            central_offset = self.fp.tell()
+            for member in self.finished:
+                self.fp.write(self._central_header(member))
+            central_size = self.fp.tell() - central_offset
+
+            count = len(self.finished)
+            if count > 0xFFFF or central_offset > ZIP64_LIMIT or central_size > ZIP64_LIMIT:
+                zip64_end_offset = self.fp.tell()
+                self.fp.write(struct.pack(
+                    '<IQHHIIQQQQ', 0x06064b50, 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                    count, count, central_size, central_offset
+                ))
+                self.fp.write(struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1))
+                count = min(count, 0xFFFF)
+                central_offset = min(central_offset, 0xFFFFFFFF)
+                central_size = min(central_size, 0xFFFFFFFF)
+            self.fp.write(struct.pack(
+                '<IHHHHIIH', 0x06054b50, 0, 0, count, count, central_size, central_offset, len(self.comment)
+            ) + self.comment)
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            self.fp.close()
+
+    def abort(self):
+        """
+        Stop writing; the archive is left incomplete.
+        """
+        self.executor.shutdown(cancel_futures=True)
+        self.fp.close()
+
+
+def read_local_members(infile, names):
+    """
+    Find members of a ZIP that has no central directory, such as the backup
+    of an interrupted save, by walking its local headers.
+
+    Only members known to be complete should be asked for: the local header
+    of the member being written when the save stopped may not hold its final
+    sizes. The walk stops once all of them are found, or at the first header
+    it cannot read.
+
+    Parameters:
+        infile (file): The ZIP, opened for binary reading.
+        names (set): The member names to find.
+
+    Returns:
+        dict: LocalMember entries by name.
+    """
+    members = {}
+    end = os.fstat(infile.fileno()).st_size
+    offset = 0
+    while len(members) < len(names) and offset + 30 <= end:
+        infile.seek(offset)
+        (signature, _, flags, compress_type, _, _, crc, compress_size, file_size,
+         name_length, extra_length) = struct.unpack('<IHHHHHIIIHH', infile.read(30))
+        if signature != 0x04034b50:
+            break
+        name = infile.read(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = infile.read(extra_length)
+        if compress_size == 0xFFFFFFFF and len(extra) >= 20 and struct.unpack('<H', extra[:2])[0] == 1:
+            file_size, compress_size = struct.unpack('<QQ', extra[4:20])
+        data_offset = offset + 30 + name_length + extra_length
+        if data_offset + compress_size > end:
+            break
+        if name in names:
+            members[name] = LocalMember(compress_type, crc, compress_size, file_size, data_offset)
+        offset = data_offset + compress_size
+    return members
+
+
+class ZipSink:
+    """
+    Streams project files into the backup ZIP.
+
+    Only files that changed since the parent version are stored; the manifest
+    records which version's ZIP holds the others, and the ZIP comment names
+    the parent so the chain can be followed from the archive alone.
+
+    A resumed save copies the members the interrupted attempt completed
+    (resume_names) from its partial ZIP, resume_file, without compressing
+    them again.
+    """
+    phase = 'zip'
+
+    def __init__(self, zip_file_name, version_name, parent_name=None, workers=None, compresslevel=6,
+                 resume_file=None, resume_names=()):
+        self.zip_file_name = zip_file_name
+        self.version_name = version_name
+        comment = (PARENT_COMMENT_PREFIX + parent_name).encode('utf-8') if parent_name else b''
+        self.backup_zip = ParallelZipWriter(zip_file_name, workers, compresslevel, comment)
+        self.member = None
+        self.resume_zip = None
+        self.resumed = {}
+        if resume_file is not None and resume_names and os.path.isfile(resume_file):
+            self.resume_zip = open(resume_file, 'rb')
+            self.resumed = read_local_members(self.resume_zip, set(resume_names))
+
+    def accepts(self, project_file):
+        return not project_file.name.endswith('.zip')  # Exclude existing zip files
+
+    def reuse(self, project_file, entry, previous_entry):
+        if previous_entry.get('zip') == self.version_name:
+            # Stored by the interrupted attempt at this save
+            member = self.resumed.get(entry['path'])
+            if member is None:
+                return False
+            zinfo = zipfile.ZipInfo.from_file(project_file.path, project_file.relpath)
+            zinfo.compress_type = member.compress_type
+            self.backup_zip.copy_member(
+                zinfo, member.crc, member.file_size, self.resume_zip, member.data_offset, member.compress_size
+            )
+            entry['zip'] = self.version_name
+            return True
+        if 'zip' not in previous_entry:
+            return False
+        entry['zip'] = previous_entry['zip']
+        return True
+
+    def begin(self, project_file, entry):
+        self.entry = entry
+        zinfo = zipfile.ZipInfo.from_file(project_file.path, project_file.relpath)
+        zinfo.compress_type = zip_compress_type(project_file.name)
+        self.member = self.backup_zip.open_member(zinfo, project_file.stat.st_size)
+
+    def feed(self, chunk):
+        self.member.write(chunk)
+
+    def end(self):
+        self.member.close()
+        self.member = None
+        self.entry['zip'] = self.version_name
+
+    def flush(self):
+        self.backup_zip.flush()
+
+    def abort(self):
+        if self.member is not None:
+            self.member.discard()
+            self.member = None
+
+    def close(self):
+        self.abort()
+        if self.resume_zip is not None:
+            self.resume_zip.close()
+            self.resume_zip = None
+        self.backup_zip.close()
+
+
+def run_snapshot_pipeline(project_files, sinks, previous=None, racy_after_ns=None, tracker=None, journal=None):
+    """
+    Read every project file once and feed its content to the sinks that want it.
+
+    Files whose size and mtime match the parent manifest are not read at all:
+    their hash is taken from the manifest and each sink reuses what the parent
+    version already holds. The files that are read are hashed on a thread of
+    their own, while the sinks process the same chunks. A file that cannot
+    be read is logged and left out.
+
+    Parameters:
+        project_files (iterable): The ProjectFile entries to process.
+        sinks (list): The sinks (concat, Source copy, ZIP) to feed.
+        previous (dict, optional): Parent manifest entries by path.
+        racy_after_ns (int, optional): When the parent scan started. Files
+            modified after that cannot be trusted from their stat data alone.
+        tracker (ProgressTracker, optional): Receives progress and carries
+            the cancellation request. Its metrics get the time spent reading,
+            hashing and in each sink, and the files read, reused and failed.
+        journal (SaveJournal, optional): Records the completed entries.
+
+    Returns:
+        list: The manifest entries of the processed files.
+    """
+    previous = previous or {}
+    tracker = tracker or ProgressTracker()
+    metrics = tracker.metrics
+    timer = time.perf_counter
+    entries = []
+
+    def hash_chunk(digest, chunk):
+        started_at = timer()
+        digest.update(chunk)  # hashlib releases the GIL on large chunks
+        metrics.add_time('hash', timer() - started_at)
+
+    def complete(entry):
+        entries.append(entry)
+        if journal is not None:
+            journal.add(entry)
+            if journal.due():
+                with metrics.phase('journal'):
+                    journal.checkpoint(sinks)
+
+    hasher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='concatcode-hash')
+    try:
+        _feed_sinks(project_files, sinks, previous, racy_after_ns, tracker, hasher, hash_chunk, complete)
+    finally:
+        hasher.shutdown()
+    tracker.report(force=True)
+    return entries
+
+
+def _feed_sinks(project_files, sinks, previous, racy_after_ns, tracker, hasher, hash_chunk, complete):
+    """Run the loop of run_snapshot_pipeline, handing each finished entry to complete."""
+    metrics = tracker.metrics
+    timer = time.perf_counter
+    for project_file in project_files:
+        tracker.check_cancelled()
+        targets = [sink for sink in sinks if sink.accepts(project_file)]
+        if not targets:
+            tracker.advance(files=1, nbytes=project_file.stat.st_size)
+            continue
+
+        path = manifest_path(project_file)
+        entry = {
+            'path': path,
+            'size': project_file.stat.st_size,
+            'mtime_ns': project_file.stat.st_mtime_ns,
+        }
+
+        previous_entry = previous.get(path)
+        if (previous_entry is not None
+                and previous_entry['size'] == entry['size']
+                and previous_entry['mtime_ns'] == entry['mtime_ns']
+                and (racy_after_ns is None or entry['mtime_ns'] < racy_after_ns)):
+            entry['hash'] = previous_entry['hash']
+            remaining = []
+            for sink in targets:
+                started_at = timer()
+                if not sink.reuse(project_file, entry, previous_entry):
+                    remaining.append(sink)
+                metrics.add_time(sink.phase, timer() - started_at)
+            targets = remaining
+        if not targets:
+            complete(entry)
+            metrics.count('files_reused')
+            tracker.advance(files=1, nbytes=entry['size'])
+            continue
+
+        started = []
+        try:
+            started_at = timer()
+            with open(project_file.path, 'rb') as infile:
+                metrics.add_time('read', timer() - started_at)
+                digest = hashlib.new(HASH_NAME)
+                hashing = None
+                for sink in targets:
+                    started_at = timer()
+                    sink.begin(project_file, entry)
+                    metrics.add_time(sink.phase, timer() - started_at)
+                    started.append(sink)
+                while True:
+                    started_at = timer()
+                    chunk = infile.read(READ_CHUNK_SIZE)
+                    metrics.add_time('read', timer() - started_at)
+                    if not chunk:
+                        break
+                    # The digest is updated in order: one chunk hashes while the sinks take it
+                    if hashing is not None:
+                        hashing.result()
+                    hashing = hasher.submit(hash_chunk, digest, chunk)
+                    for sink in targets:
+                        started_at = timer()
+                        sink.feed(chunk)
+                        metrics.add_time(sink.phase, timer() - started_at)
+                    tracker.advance(nbytes=len(chunk))
+                if hashing is not None:
+                    hashing.result()
+                entry['hash'] = digest.hexdigest()
+                for sink in targets:
+                    started_at = timer()
+                    sink.end()
+                    metrics.add_time(sink.phase, timer() - started_at)
+        except OperationCancelled:
+            for sink in started:
+                sink.abort()
+            raise
+        except Exception:
+            # An unreadable file, or one removed since the scan, is left out of the version
+            logging.error(f"Failed to process file {project_file.path}.", exc_info=True)
+            for sink in started:
+                sink.abort()
+            metrics.count('files_failed')
+            tracker.advance(files=1)
+            continue
+        complete(entry)
+        metrics.count('files_read')
+        metrics.count('bytes_read', entry['size'])
+        tracker.advance(files=1)
+
+
+class PackStore:
+    """
+    Reads the packs of compacted versions: the manifest of each packed
+    version, and file contents by hash.
+
+    The packs are only opened, and their central directories read, when
+    something is first looked up in them.
+    """
+
+    def __init__(self, script_dir):
+        self.packs_dir = os.path.join(script_dir, PACKS_DIR_NAME)
+        self.packs = None
+        self.objects = {}
+        self.versions = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _load(self):
+        if self.packs is not None:
+            return
+        self.packs = []
+        if not os.path.isdir(self.packs_dir):
+            return
+        try:
+            for pack_name in sorted(os.listdir(self.packs_dir)):
+                if not pack_name.endswith('.zip'):
+                    continue
+                pack = zipfile.ZipFile(os.path.join(self.packs_dir, pack_name), 'r')
+                self.packs.append(pack)
+                for member in pack.namelist():
+                    if member.startswith(PACK_OBJECTS_PREFIX):
+                        self.objects[member[len(PACK_OBJECTS_PREFIX):]] = pack
+                    elif member.startswith(PACK_MANIFESTS_PREFIX) and member.endswith('.json'):
+                        self.versions[member[len(PACK_MANIFESTS_PREFIX):-len('.json')]] = pack
+        except BaseException:
+            self.close()
+            raise
+
+    def version_names(self):
+        """
+        Return the names of the packed versions.
+        """
+        self._load()
+        return list(self.versions)
+
+    def load_manifest(self, version):
+        """
+        Return the manifest of a packed version, or None if no pack holds it.
+        """
+        self._load()
+        pack = self.versions.get(version)
+        if pack is None:
+            return None
+        return json.loads(pack.read(f"{PACK_MANIFESTS_PREFIX}{version}.json").decode('utf-8'))
+
+    def has_object(self, content_hash):
+        """
+        Check whether a pack holds a file content.
+        """
+        self._load()
+        return content_hash in self.objects
+
+    def pack_file(self, content_hash):
+        """
+        Return the path of the pack holding a file content.
+        """
+        self._load()
+        return self.objects[content_hash].filename
+
+    def open_object(self, content_hash):
+        """
+        Open a file content held by a pack.
+
+        Parameters:
+            content_hash (str): The hex digest of the content.
+
+        Returns:
+            file: The content, opened for binary reading.
+        """
+        self._load()
+        pack = self.objects.get(content_hash)
+        if pack is None:
+            raise FileNotFoundError(f"No pack holds the content {content_hash}")
+        # ZipFile supports concurrent reads of different members
+        return pack.open(PACK_OBJECTS_PREFIX + content_hash)
+
+    def close(self):
+        for pack in self.packs or ():
+            pack.close()
+        self.packs = None
+        self.objects = {}
+        self.versions = {}
+
+
+class PackedBackup:
+    """
+    Stands in for the backup ZIP of a packed version: its files are read by
+    path from the packs.
+    """
+
+    def __init__(self, packs, manifest):
+        self.packs = packs
+        self.hashes = {entry['path']: entry['hash'] for entry in manifest['files']}
+
+    def open(self, name):
+        return self.packs.open_object(self.hashes[name])
+
+    def read(self, name):
+        with self.open(name) as infile:
+            return infile.read()
+
+    def close(self):
+        self.packs.close()
+
+
+class FileSlice:
+    """
+    A read-only, seekable view of a range of an open file, such as a member
+    stored uncompressed in a ZIP, read as a file of its own. Closing the
+    view closes the file.
+    """
+
+    def __init__(self, infile, offset, length, name=None):
+        self.file = infile
+        self.offset = offset
+        self.length = length
+        self.name = name
+        self.position = 0
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.position
+        elif whence == os.SEEK_END:
+            position += self.length
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self.position = position
+        return position
+
+    def read(self, size=-1):
+        remaining = max(self.length - self.position, 0)
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self.file.seek(self.offset + self.position)
+        data = self.file.read(size)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class NestedZipFile(zipfile.ZipFile):
+    """
+    A ZIP read from a FileSlice, which it closes with itself.
+    """
+
+    def __init__(self, file_slice):
+        self.file_slice = file_slice
+        try:
+            super().__init__(file_slice, 'r')
+        except BaseException:
+            file_slice.close()
+            raise
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.file_slice.close()
+
+
+def open_nested_zip(archive, member):
+    """
+    Open a ZIP that is a member of another one.
+
+    A member stored uncompressed, as archives store the backup ZIP, is read
+    in place. One that was compressed cannot be seeked in, so it is first
+    unpacked to an anonymous temporary file.
+
+    Parameters:
+        archive (zipfile.ZipFile): The outer ZIP, opened from its path.
+        member (zipfile.ZipInfo): The member holding the nested ZIP.
+
+    Returns:
+        NestedZipFile: The nested ZIP.
+    """
+    name = f"{archive.filename}/{member.filename}"
+    if member.compress_type == zipfile.ZIP_STORED:
+        infile = open(archive.filename, 'rb')
+        try:
+            # The data follows the local header, whose name and extra field
+            # can differ in length from the central directory's
+            infile.seek(member.header_offset)
+            header = infile.read(30)
+            if len(header) < 30 or header[:4] != b'PK\x03\x04':
+                raise zipfile.BadZipFile(f"Bad local header for {name}")
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+        except BaseException:
+            infile.close()
+            raise
+        offset = member.header_offset + 30 + name_length + extra_length
+    else:
+        infile = tempfile.TemporaryFile()
+        try:
+            with archive.open(member) as src:
+                shutil.copyfileobj(src, infile, READ_CHUNK_SIZE)
+        except BaseException:
+            infile.close()
+            raise
+        offset = 0
+    return NestedZipFile(FileSlice(infile, offset, member.file_size, name))
+
+
+def open_backup_zip(script_dir, version_name):
+    """
+    Open the backup ZIP of a version, whether its folder is live, archived
+    or packed. The backup ZIP of an archived version is read inside its
+    archive.
+
+    Parameters:
+        script_dir (str): The directory holding the version folders.
+        version_name (str): The version folder name.
+
+    Returns:
+        zipfile.ZipFile: The opened backup ZIP, or a PackedBackup reading the
+        same files from the packs.
+    """
+    version_folder = os.path.join(script_dir, version_name)
+    if os.path.isdir(version_folder):
+        for filename in os.listdir(version_folder):
+            if filename.startswith('backup_project_') and filename.endswith('.zip'):
+                return zipfile.ZipFile(os.path.join(version_folder, filename), 'r')
+
+    archive_file = os.path.join(script_dir, "Archived_Versions", version_name + '.zip')
+    if os.path.isfile(archive_file):
+        with zipfile.ZipFile(archive_file, 'r') as archive:
+            for member in archive.infolist():
+                if member.filename.startswith('backup_project_') and member.filename.endswith('.zip'):
+                    return open_nested_zip(archive, member)
+
+    packs = PackStore(script_dir)
+    manifest = packs.load_manifest(version_name)
+    if manifest is not None:
+        return PackedBackup(packs, manifest)
+    packs.close()
+    raise FileNotFoundError(f"No backup ZIP found for {version_name}")
+
+
+def zip_member_mtime_ns(member):
+    """
+    Return the modification time stored for a ZIP member, in nanoseconds.
+    """
+    return int(time.mktime(member.date_time + (0, 0, -1))) * 1000000000
+
+
+def zip_members(zip_ref):
+    """
+    List the files of a ZIP as extract_version sees them.
+
+    An incremental backup ZIP next to its manifest stands for the complete
+    project tree of its version, most of which is held by the backups of
+    earlier versions. Any other ZIP holds just its own members.
+
+    Parameters:
+        zip_ref (zipfile.ZipFile): The opened ZIP.
+
+    Returns:
+        list: ExtractMember entries, in ZIP or manifest order.
+    """
+    manifest = None
+    version_folder = os.path.dirname(os.path.abspath(zip_ref.filename))
+    if zip_ref.comment.decode('utf-8', 'ignore').startswith(PARENT_COMMENT_PREFIX):
+        manifest = load_manifest(version_folder)
+    if manifest is not None:
+        version_name = os.path.basename(version_folder)
+        return [
+            ExtractMember(
+                None if entry['zip'] == version_name else entry['zip'], entry['path'], entry['size'], entry['mtime_ns']
+            )
+            for entry in manifest['files'] if 'zip' in entry
+        ]
+    # Only the central directory is read here, never the member data
+    return [
+        ExtractMember(None, member.filename, member.file_size, zip_member_mtime_ns(member))
+        for member in zip_ref.infolist() if not member.is_dir()
+    ]
+
+
+def path_matches(path, patterns):
+    """
+    Check whether a '/'-separated relative path matches one of the glob
+    patterns, such as 'src/*.py' ('*' also matches '/'). A pattern ending
+    with '/' selects a whole folder.
+    """
+    return any(
+        path.startswith(pattern) if pattern.endswith('/') else fnmatch.fnmatchcase(path, pattern)
+        for pattern in patterns
+    )
+
+
+def select_members(members, patterns=None):
+    """
+    Keep the members whose path matches one of the glob patterns.
+
+    Parameters:
+        members (list): ExtractMember entries.
+        patterns (list, optional): Glob patterns (see path_matches). None
+            selects every member.
+
+    Returns:
+        list: The selected members.
+    """
+    if not patterns:
+        return list(members)
+    return [member for member in members if path_matches(member.name, patterns)]
+
+
+def run_parallel(function, items, workers, tracker=None, item_bytes=None, name='concatcode-worker'):
+    """
+    Call a function on every item on a pool of threads.
+
+    At most workers * 4 items are queued at a time, and progress is counted on
+    the calling thread as items complete, in order. If a call fails or the
+    operation is cancelled, the items not started yet are dropped.
+
+    Parameters:
+        function (callable): Called with each item, on a worker thread.
+        items (iterable): The items.
+        workers (int): The number of threads.
+        tracker (ProgressTracker, optional): Advanced by one file and
+            item_bytes(item) bytes per completed item.
+        item_bytes (callable, optional): The bytes an item accounts for.
+        name (str): The prefix of the thread names.
+
+    Yields:
+        tuple: (item, result of the call), in item order.
+    """
+    tracker = tracker or ProgressTracker()
+    pending = deque()
+
+    def complete():
+        item, future = pending.popleft()
+        result = future.result()
+        tracker.advance(files=1, nbytes=item_bytes(item) if item_bytes else 0)
+        return item, result
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) as executor:
+        try:
+            for item in items:
+                tracker.check_cancelled()
+                pending.append((item, executor.submit(function, item)))
+                if len(pending) >= workers * 4:
+                    yield complete()
+            while pending:
+                yield complete()
+        except BaseException:
+            for _, future in pending:
+                future.cancel()
+            raise
+
+
+def extract_members(script_dir, zip_ref, members, dest_dir, tracker=None, workers=None):
+    """
+    Stream the given members of a ZIP (or of its chain of backups) to a folder.
+
+    Only the members asked for are read. Members are extracted in parallel,
+    each one through a temporary file renamed into place, and keep their
+    saved modification time.
+
+    Parameters:
+        script_dir (str): The directory holding the version folders.
+        zip_ref (zipfile.ZipFile): The opened ZIP the members were listed from.
+        members (list): The ExtractMember entries to extract.
+        dest_dir (str): Where to write them, at their relative paths.
+        tracker (ProgressTracker, optional): Receives progress and carries
+            the cancellation request.
+        workers (int, optional): The number of extraction threads.
+    """
+    tracker = tracker or ProgressTracker()
+    tracker.set_totals(len(members), sum(member.size for member in members))
+    workers = workers or os.cpu_count() or 1
+    backups = {None: zip_ref}
+
+    def extract_one(member):
+        dest_file = project_file_path(dest_dir, member.name)
+        # ZipFile supports concurrent reads of different members
+        with backups[member.backup].open(member.name) as infile, atomic_output(dest_file, member.mtime_ns) as outfile:
+            while True:
+                chunk = infile.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                outfile.write(chunk)
+                tracker.check_cancelled()
+
+    try:
+        for backup_name in {member.backup for member in members} - {None}:
+            backups[backup_name] = open_backup_zip(script_dir, backup_name)
+
+        for _ in run_parallel(
+                extract_one, members, workers, tracker, lambda member: member.size, 'concatcode-extract'):
+            pass
+    finally:
+        for backup_name, backup_zip in backups.items():
+            if backup_name is not None:
+                backup_zip.close()
+
+
+def list_zip_members(zip_file, patterns=None):
+    """
+    Function to list the files a ZIP file can extract.
+
+    For an incremental backup ZIP this is the complete project tree of its
+    version, as extract_version rebuilds it.
+
+    Parameters:
+        zip_file (str): The path to the ZIP file.
+        patterns (list, optional): Glob patterns selecting the files to list.
+
+    Returns:
+        list: A dict with the path and size of each file.
+    """
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        members = select_members(zip_members(zip_ref), patterns)
+    return [{'path': member.name, 'size': member.size} for member in members]
+
+
+def source_entries(manifest):
+    """
+    Yield the manifest entries materialised in the flat Source folder.
+
+    Parameters:
+        manifest (dict): A version manifest.
+
+    Yields:
+        tuple: (file name in Source, manifest entry)
+    """
+    for entry in manifest['files']:
+        if entry.get('source'):
+            yield entry['path'].rsplit('/', 1)[-1], entry
+
+
+def remove_tree(path):
+    """
+    Delete a version folder, including the read-only links it holds to objects.
+
+    Parameters:
+        path (str): The folder to delete.
+    """
+    def make_writable(func, failed_path, exc_info):
+        # Windows refuses to delete read-only files
+        os.chmod(failed_path, stat.S_IWRITE)
+        func(failed_path)
+
+    shutil.rmtree(path, onerror=make_writable)
+
+
+class ConcatReader:
+    """
+    Random access to the files of a concat snapshot, through its index.
+
+    Each part of the snapshot is memory-mapped: reading one file is a
+    dictionary lookup and a slice, however large the snapshot. Compressed
+    parts are decompressed up to the file being read instead.
+
+    Usage:
+        with ConcatReader(concat_file) as reader:
+            text = reader.read_text('src/app.py')
+    """
+
+    def __init__(self, concat_file, index_file=None):
+        with open(index_file or concat_index_file(concat_file), 'r', encoding='utf-8') as infile:
+            self.index = json.load(infile)['files']
+        self.folder = os.path.dirname(concat_file)
+        self.concat_file = os.path.basename(concat_file)
+        self.parts = {}
+        # Fail early when the snapshot is missing
+        self._part(self.concat_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, path):
+        return path in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _part(self, name):
+        if name not in self.parts:
+            part_file = open_concat_part(os.path.join(self.folder, name))
+            data = None
+            if not name.endswith(CONCAT_GZIP_SUFFIX):
+                try:
+                    data = mmap.mmap(part_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except BaseException:
+                    part_file.close()
+                    raise
+            self.parts[name] = (part_file, data)
+        return self.parts[name]
+
+    def read(self, path):
+        """
+        Return the text of a file, as UTF-8 bytes.
+
+        Raises:
+            KeyError: If the snapshot has no such file.
+        """
+        entry = self.index[path]
+        part_file, data = self._part(entry.get('file', self.concat_file))
+        if data is not None:
+            return data[entry['offset']:entry['offset'] + entry['length']]
+        part_file.seek(entry['offset'])
+        return part_file.read(entry['length'])
+
+    def read_text(self, path):
+        return self.read(path).decode('utf-8')
+
+    def hash(self, path):
+        """
+        Return the hash of a file's text in the snapshot.
+        """
+        return self.index[path]['hash']
+
+    def compare(self, other):
+        """
+        Compare this snapshot with another one by hash, without reading them.
+
+        Parameters:
+            other (ConcatReader): The snapshot to compare with.
+
+        Returns:
+            dict: The sorted paths 'added' in other, 'removed' from it and 'changed'.
+        """
+        return {
+            'added': sorted(path for path in other.index if path not in self.index),
+            'removed': sorted(path for path in self.index if path not in other.index),
+            'changed': sorted(
+                path for path, entry in self.index.items()
+                if path in other.index and other.index[path]['hash'] != entry['hash']
+            )
+        }
+
+    def close(self):
+        for part_file, data in self.parts.values():
+            if data is not None:
+                data.close()
+            part_file.close()
+        self.parts = {}
+
+
+def build_concat_index(concat_file, manifest):
+    """
+    Write the index of a concat file saved before indexes existed, from the
+    section offsets its manifest records.
+
+    Parameters:
+        concat_file (str): The concat file.
+        manifest (dict): The manifest of its version.
+
+    Returns:
+        str: The path of the index file.
+    """
+    index = {}
+    folder = os.path.dirname(concat_file)
+    parts = {}
+    try:
+        for entry in manifest['files']:
+            if 'concat' not in entry:
+                continue
+            offset, length = entry['concat']
+            name = entry.get('concat_file', os.path.basename(concat_file))
+            if name not in parts:
+                parts[name] = open_concat_part(os.path.join(folder, name))
+            infile = parts[name]
+            header_length = len(concat_header(entry['path'].rsplit('/', 1)[-1]))
+            content_length = length - header_length - len(CONCAT_TRAILER)
+            infile.seek(offset + header_length)
+            digest = hashlib.new(HASH_NAME)
+            remaining = content_length
+            while remaining > 0:
+                chunk = infile.read(min(remaining, READ_CHUNK_SIZE))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            index[entry['path']] = {
+                'offset': offset + header_length,
+                'length': content_length,
+                'hash': digest.hexdigest()
+            }
+            if 'concat_file' in entry:
+                index[entry['path']]['file'] = name
+    finally:
+        for infile in parts.values():
+            infile.close()
+    index_file = concat_index_file(concat_file)
+    write_json_file(index_file, {
+        'concat_file': os.path.basename(concat_file),
+        'concat_files': manifest.get('concat_files', [os.path.basename(concat_file)]),
+        'files': index,
+        'skipped': {entry['path']: entry['concat_skipped'] for entry in manifest['files'] if 'concat_skipped' in entry}
+    })
+    return index_file
+
+
+def open_concat(version, script_dir=None):
+    """
+    Function to open the concat snapshot of a saved version for random access.
+
+    Versions saved before concat indexes existed get theirs built from the
+    manifest on first use.
+
+    Parameters:
+        version (str): The name of the version folder.
+        script_dir (str, optional): The directory holding the versions.
+
+    Returns:
+        ConcatReader: The snapshot; close it when done.
+    """
+    script_dir, _ = resolve_dirs(script_dir)
+    version_folder = os.path.join(script_dir, version)
+    manifest = load_manifest(version_folder)
+    if manifest is None:
+        raise FileNotFoundError(f"Version {version} not found in {script_dir}, or saved without a manifest")
+    concat_file = os.path.join(version_folder, manifest['concat_file'])
+    index_file = os.path.join(
+        version_folder, manifest.get('concat_index', os.path.basename(concat_index_file(concat_file)))
+    )
+    if not os.path.isfile(index_file):
+        index_file = build_concat_index(concat_file, manifest)
+    return ConcatReader(concat_file, index_file)
+
+
+def write_version_archive(version_folder, archive_file, objects_dir, tracker=None, workers=None, compresslevel=6):
+    """
+    Write a self-contained ZIP of a version folder.
+
+    The Source folder is written from the object store, so the archive holds
+    every source file even where the folder could not be hardlinked. Files
+    that are compressed already, such as the backup ZIP, are stored as they
+    are. The archive is written under a temporary name and only takes its
+    own once complete and checked: a cancelled or failed archiving leaves
+    nothing behind.
+
+    Parameters:
+        version_folder (str): The version folder to archive.
+        archive_file (str): The ZIP file to create.
+        objects_dir (str): The object store directory.
+        tracker (ProgressTracker, optional): Receives progress and carries
+            the cancellation request.
+        workers (int, optional): The number of compression workers.
+        compresslevel (int): The zlib compression level.
+
+    Returns:
+        float: The compressed size of the archived files, as a fraction of
+        their original size.
+    """
+    tracker = tracker or ProgressTracker()
+    manifest = load_manifest(version_folder)
+
+    members = []
+    for foldername, subfolders, filenames in os.walk(version_folder):
+        if manifest is not None and foldername == version_folder and "Source" in subfolders:
+            subfolders.remove("Source")
+        for filename in filenames:
+            file_path = os.path.join(foldername, filename)
+            members.append((file_path, os.path.relpath(file_path, version_folder)))
+    if manifest is not None:
+        for name, entry in source_entries(manifest):
+            members.append((object_path(objects_dir, entry['hash']), f"Source/{name}"))
+
+    tracker.set_totals(len(members), sum(os.path.getsize(file_path) for file_path, _ in members))
+    temp_file = temp_file_for(archive_file)
+    try:
+        archive = ParallelZipWriter(temp_file, workers, compresslevel)
+        try:
+            for file_path, arcname in members:
+                tracker.check_cancelled()
+                archive.write_file(file_path, arcname, zip_compress_type(arcname))
+                tracker.advance(files=1, nbytes=os.path.getsize(file_path))
+        except BaseException:
+            archive.abort()
+            raise
+        archive.close()
+        # The version folder is deleted once archived: its archive must read back
+        with zipfile.ZipFile(temp_file, 'r') as written:
+            bad_member = written.testzip()
+        if bad_member is not None:
+            raise zipfile.BadZipFile(f"Archive {archive_file} has a corrupt member {bad_member}")
+        os.replace(temp_file, archive_file)
+        temp_file = None
+    finally:
+        if temp_file is not None and os.path.exists(temp_file):
+            os.remove(temp_file)
+    return archive.compression_ratio()
+
+
+def write_version_pack(pack_file, manifests, reader, packs, tracker=None, workers=None, compresslevel=6):
+    """
+    Write a pack of versions: their manifests, and each file content they
+    need that no other pack holds yet, once.
+
+    The contents are the files the object store and the backup ZIPs hold,
+    so every file a packed version can restore, extract or compare stays
+    available. Contents that are compressed already are stored as they are.
+
+    Parameters:
+        pack_file (str): The ZIP file to create.
+        manifests (dict): The manifests of the versions to pack, by version name.
+        reader (VersionFileReader): Reads the contents from the store.
+        packs (PackStore): The existing packs.
+        tracker (ProgressTracker, optional): Receives progress and carries
+            the cancellation request.
+        workers (int, optional): The number of compression workers.
+        compresslevel (int): The zlib compression level.
+
+    Returns:
+        dict: The number of contents written, their size and their
+        compressed size as a fraction of it.
+    """
+    tracker = tracker or ProgressTracker()
+    contents = {}
+    for manifest in manifests.values():
+        for entry in manifest['files']:
+            if not (entry['path'].endswith(SOURCE_EXTENSIONS) or 'zip' in entry):
+                continue  # Neither stored nor backed up
+            if entry['hash'] not in contents and not packs.has_object(entry['hash']):
+                contents[entry['hash']] = entry
+    total_bytes = sum(entry['size'] for entry in contents.values())
+    tracker.set_totals(len(contents), total_bytes)
+
+    pack = ParallelZipWriter(pack_file, workers, compresslevel)
+    try:
+        for version, manifest in manifests.items():
+            data = json.dumps(manifest).encode('utf-8')
+            zinfo = zipfile.ZipInfo(f"{PACK_MANIFESTS_PREFIX}{version}.json")
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            pack.write_fileobj(io.BytesIO(data), zinfo, len(data))
+        for content_hash, entry in contents.items():
+            tracker.check_cancelled()
+            zinfo = zipfile.ZipInfo(PACK_OBJECTS_PREFIX + content_hash)
+            zinfo.compress_type = zip_compress_type(entry['path'])
+            with reader.open(entry) as infile:
+                pack.write_fileobj(infile, zinfo, entry['size'])
+            tracker.advance(files=1, nbytes=entry['size'])
+    except BaseException:
+        pack.abort()
+        raise
+    pack.close()
+    return {'objects': len(contents), 'bytes': total_bytes, 'compression_ratio': pack.compression_ratio()}
+
+
+def collect_garbage(script_dir=None):
+    """
+    Delete the objects no saved version references any more.
+
+    The store lock is taken exclusively first (see StoreLock), so the saves,
+    restores and archives running on the store, in this process or another
+    one, finish before: they may be using objects no manifest references yet.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the version folders.
+
+    Returns:
+        dict: The number of objects removed and the bytes freed.
+    """
+    script_dir, _ = resolve_dirs(script_dir)
+    with STORE_LOCK.exclusive(script_dir):
+        return _collect_garbage(script_dir)
+
+
+def _collect_garbage(script_dir):
+    objects_dir = os.path.join(script_dir, OBJECTS_DIR_NAME)
+    if not os.path.isdir(objects_dir):
+        return {'removed': 0, 'freed_bytes': 0}
+
+    # Any manifest that cannot be read aborts the collection: its objects would be lost
+    referenced = set()
+    for folder in os.listdir(script_dir):
+        if folder.startswith('version_'):
+            manifest = load_manifest(os.path.join(script_dir, folder))
+            if manifest is not None:
+                referenced.update(entry['hash'] for entry in manifest['files'])
+            # An interrupted save resumes from the objects its journal lists
+            _, journaled = load_journal(os.path.join(script_dir, folder, JOURNAL_NAME))
+            referenced.update(entry['hash'] for entry in journaled.values())
+
+    removed = 0
+    freed_bytes = 0
+    for prefix in os.listdir(objects_dir):
+        prefix_dir = os.path.join(objects_dir, prefix)
+        if prefix == 'tmp' or not os.path.isdir(prefix_dir):
+            continue
+        for name in os.listdir(prefix_dir):
+            if prefix + name in referenced:
+                continue
+            file_path = os.path.join(prefix_dir, name)
+            freed_bytes += os.path.getsize(file_path)
+            os.remove(file_path)
+            removed += 1
+        if not os.listdir(prefix_dir):
+            os.rmdir(prefix_dir)
+
+    return {'removed': removed, 'freed_bytes': freed_bytes}
+
+
+def load_version_manifest(script_dir, version):
+    """
+    Load the manifest of a saved version, from its folder or, once archived
+    or packed, from its archive in Archived_Versions or from its pack.
+
+    Parameters:
+        script_dir (str): The directory holding the versions.
+        version (str): The name of the version folder.
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        FileNotFoundError: If the version does not exist or has no manifest.
+    """
+    version_folder = os.path.join(script_dir, version)
+    archive_file = os.path.join(script_dir, "Archived_Versions", version + '.zip')
+    manifest = None
+    if os.path.isdir(version_folder):
+        manifest = load_manifest(version_folder)
+    elif os.path.isfile(archive_file):
+        with zipfile.ZipFile(archive_file, 'r') as archive:
+            if MANIFEST_NAME in archive.namelist():
+                manifest = json.loads(archive.read(MANIFEST_NAME).decode('utf-8'))
+    else:
+        with PackStore(script_dir) as packs:
+            manifest = packs.load_manifest(version)
+    if manifest is None:
+        raise FileNotFoundError(f"Version {version} not found in {script_dir}, or saved without a manifest")
+    return manifest
+
+
+class VersionFileReader:
+    """
+    Reads files of saved versions by manifest entry: from the object store
+    or the packs when they hold them, otherwise from the backup ZIP that
+    recorded them.
+    """
+
+    def __init__(self, script_dir):
+        self.script_dir = script_dir
+        self.objects_dir = os.path.join(script_dir, OBJECTS_DIR_NAME)
+        self.packs = PackStore(script_dir)
+        self.backups = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self, entry):
+        """
+        Open the content of a file.
+
+        Parameters:
+            entry (dict): The manifest entry of the file.
+
+        Returns:
+            file: The content, opened for binary reading.
+        """
+        try:
+            return open(object_path(self.objects_dir, entry['hash']), 'rb')
+        except FileNotFoundError:
+            pass
+        if self.packs.has_object(entry['hash']):
+            return self.packs.open_object(entry['hash'])
+        if 'zip' not in entry:
+            raise FileNotFoundError(f"No stored copy of {entry['path']}")
+        backup_zip = self.backups.get(entry['zip'])
+        if backup_zip is None:
+            backup_zip = open_backup_zip(self.script_dir, entry['zip'])
+            self.backups[entry['zip']] = backup_zip
+        return backup_zip.open(entry['path'])
+
+    def read(self, entry):
+        """
+        Return the content of a file.
+
+        Parameters:
+            entry (dict): The manifest entry of the file.
+
+        Returns:
+            bytes: The content.
+        """
+        with self.open(entry) as infile:
+            return infile.read()
+
+    def close(self):
+        for backup_zip in self.backups.values():
+            backup_zip.close()
+        self.backups = {}
+        self.packs.close()
+
+
+def compare_manifests(old_manifest, new_manifest, patterns=None):
+    """
+    Compare two manifests by path and hash, without reading any file.
+
+    Parameters:
+        old_manifest (dict): The manifest of the older version.
+        new_manifest (dict): The manifest of the newer version.
+        patterns (list, optional): Glob patterns restricting the paths compared.
+
+    Returns:
+        tuple: (old entries by path, new entries by path, comparison dict with
+        the sorted 'added', 'removed' and 'modified' paths and the
+        'unchanged_count').
+    """
+    old_files = {entry['path']: entry for entry in old_manifest['files']}
+    new_files = {entry['path']: entry for entry in new_manifest['files']}
+    if patterns:
+        old_files = {path: entry for path, entry in old_files.items() if path_matches(path, patterns)}
+        new_files = {path: entry for path, entry in new_files.items() if path_matches(path, patterns)}
+    common = old_files.keys() & new_files.keys()
+    modified = sorted(path for path in common if old_files[path]['hash'] != new_files[path]['hash'])
+    return old_files, new_files, {
+        'added': sorted(new_files.keys() - old_files.keys()),
+        'removed': sorted(old_files.keys() - new_files.keys()),
+        'modified': modified,
+        'unchanged_count': len(common) - len(modified)
+    }
+
+
+def resolve_dirs(script_dir=None, project_dir=None):
+    """
+    Fill in the default locations: versions are kept next to the script and
+    the project is the directory above it.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        project_dir (str, optional): The root of the project.
+
+    Returns:
+        tuple: (script_dir, project_dir) as absolute paths.
+    """
+    script_dir = os.path.abspath(script_dir or SCRIPT_DIR)
+    project_dir = os.path.abspath(project_dir or os.path.join(script_dir, '..'))
+    return script_dir, project_dir
+
+
+def list_versions(script_dir=None, offset=0, limit=None, newest_first=False, details=False, archived=False,
+                  states=None):
+    """
+    Function to get a list of available versions, sorted by version number.
+    Packed versions are listed with the others.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        offset (int): The number of versions to skip, for paging.
+        limit (int, optional): The maximum number of versions to return.
+        newest_first (bool): List the most recent versions first.
+        details (bool): Return the catalog records instead of the names.
+        archived (bool): Also list the versions moved to Archived_Versions.
+        states (tuple, optional): Only list the versions in these catalog
+            states, such as ('saved',); overrides archived.
+
+    Returns:
+        list: A list of version folder names, or of dicts with the name,
+        version, datetime, file_count, total_bytes, hash_root and state
+        ('saved', 'packed' or 'archived') of each.
+    """
+    script_dir, _ = resolve_dirs(script_dir)
+    order = "DESC" if newest_first else "ASC"
+    if states is None:
+        states = (SAVED, PACKED, ARCHIVED) if archived else (SAVED, PACKED)
+    states = tuple(states)
+    with open_catalog(script_dir) as catalog:
+        rows = catalog.execute(
+            "SELECT name, number, datetime, file_count, total_bytes, hash_root, state FROM versions "
+            f"WHERE state IN ({', '.join('?' * len(states))}) ORDER BY number {order}, datetime {order} "
+            "LIMIT ? OFFSET ?",
+            states + (-1 if limit is None else limit, offset)
+        ).fetchall()
+    if not details:
+        return [row['name'] for row in rows]
+    versions = []
+    for row in rows:
+        record = dict(row)
+        record['version'] = format_version_number(record.pop('number'))
+        versions.append(record)
+    return versions
+
+
+def count_versions(script_dir=None, states=None):
+    """
+    Function to count the available versions.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        states (tuple, optional): Only count the versions in these catalog
+            states, such as ('saved',).
+
+    Returns:
+        int: The number of versions list_versions can return with the same
+        states.
+    """
+    script_dir, _ = resolve_dirs(script_dir)
+    states = (SAVED, PACKED) if states is None else tuple(states)
+    with open_catalog(script_dir) as catalog:
+        return catalog.execute(
+            f"SELECT COUNT(*) FROM versions WHERE state IN ({', '.join('?' * len(states))})", states
+        ).fetchone()[0]
+
+
+def get_next_version(script_dir):
+    """
+    Function to get the next available version number.
+
+    Parameters:
+        script_dir (str): The directory where the script is located.
+
+    Returns:
+        str: The next version number as a string.
+    """
+    with open_catalog(script_dir) as catalog:
+        last = catalog.execute("SELECT MAX(number) FROM versions WHERE state != ?", (SAVING,)).fetchone()[0]
+        saving = catalog.execute("SELECT name, number FROM versions WHERE state = ?", (SAVING,)).fetchall()
+    for row in saving:
+        # A crashed save is resumed or removed by the next one: only running saves hold their number
+        if not save_interrupted(os.path.join(script_dir, row['name'])):
+            last = max(last or 0, row['number'])
+    return format_version_number((last or 0) + 1)
+
+
+def index_saved_version(script_dir, version_name):
+    """
+    Add a version to the search index right after it is saved. The version
+    is saved anyway if this fails: the next search indexes it.
+    """
+    try:
+        import concatcode_search  # Only loaded when the search index is used
+        concatcode_search.update_search_index(script_dir, [version_name])
+    except Exception:
+        logging.error(f"Failed to index {version_name} for search.", exc_info=True)
+
+
+def save_version(script_dir=None, project_dir=None, progress=None, cancel_event=None, changed_paths=None):
+    """
+    Function to save a new version of the project.
+    Concatenates code files into a single text file, stores them in the object
+    store and writes a backup ZIP of the project.
+
+    If the save fails or is cancelled, the version folder is removed. If the
+    process crashes instead, the journal it leaves lets the next save resume
+    it under the same version number: the files it had completed are copied
+    from its partial outputs rather than read and compressed again.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        project_dir (str, optional): The root of the project.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the save.
+        changed_paths (iterable, optional): The only paths, relative to the
+            project root, that changed since the latest version (see
+            walk_changed_paths); the tree is then not walked. A changed
+            ignore file, or no previous version, means a full walk anyway.
+
+    Returns:
+        dict: Information about the saved version.
+    """
+    version_folder = None
+    version_name = None
+    marker = None
+    journal = None
+    metrics = OperationMetrics('save')
+    try:
+        current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        script_dir, project_dir = resolve_dirs(script_dir, project_dir)
+        settings = load_settings(script_dir)
+
+        resume_folder = None
+        resumed_scan_ns, resumed = None, {}
+        with metrics.phase('allocate'), VERSION_LOCK:
+            version_name, marker = claim_interrupted_save(script_dir)
+            parent_name, parent_manifest = find_parent_version(script_dir)
+            if version_name is not None:
+                version_folder = os.path.join(script_dir, version_name)
+                number, current_datetime = parse_version_name(version_name)
+                version = format_version_number(number)
+                resumed_scan_ns, resumed = load_journal(os.path.join(version_folder, JOURNAL_NAME))
+                # The outputs of the interrupted attempt are moved aside, to be copied from
+                resume_folder = os.path.join(version_folder, RESUME_DIR_NAME)
+                if os.path.isdir(resume_folder):
+                    remove_tree(resume_folder)
+                os.makedirs(resume_folder)
+                for name in os.listdir(version_folder):
+                    if name not in (IN_PROGRESS_MARKER, JOURNAL_NAME, RESUME_DIR_NAME):
+                        os.replace(os.path.join(version_folder, name), os.path.join(resume_folder, name))
+                logging.info(f"Resuming the interrupted save of {version_name}, {len(resumed)} files done.")
+            else:
+                version, version_name = allocate_version(script_dir, current_datetime)
+                version_folder = os.path.join(script_dir, version_name)
+                os.makedirs(version_folder)
+                marker = lock_marker(version_folder)
+
+        source_copy_folder = os.path.join(version_folder, "Source")
+        os.makedirs(source_copy_folder, exist_ok=True)
+
+        output_file = os.path.join(version_folder, f"concat_files_v{version}_{current_datetime}.txt")
+
+        zip_file_name = os.path.join(version_folder, f"backup_project_v{version}_{current_datetime}.zip")
+
+        # Header information written at the top of each concat file
+        header = (f"// Version: {version}\n// Date: {current_datetime}\n" + SEPARATOR + "\n").encode('utf-8')
+
+        # Files unchanged since the parent version are taken from it
+        previous = {}
+        parent_folder = None
+        racy_after_ns = None
+        if parent_manifest is not None:
+            parent_folder = os.path.join(script_dir, parent_name)
+            previous = {entry['path']: entry for entry in parent_manifest['files']}
+            racy_after_ns = parent_manifest['scan_started_ns']
+        if resumed_scan_ns is not None:
+            # Each entry is only trusted if its file had not changed when its own scan started
+            if racy_after_ns is not None:
+                previous = {
+                    path: entry for path, entry in previous.items() if entry['mtime_ns'] < racy_after_ns
+                }
+            previous.update(
+                (path, entry) for path, entry in resumed.items() if entry['mtime_ns'] < resumed_scan_ns
+            )
+            racy_after_ns = resumed_scan_ns
+            # The walk must cover every file, not only those changed since the parent
+            changed_paths = None
+
+        if changed_paths is not None:
+            changed_paths = list(changed_paths)
+            if parent_manifest is None or any(
+                    path.replace(os.sep, '/').rsplit('/', 1)[-1] in (GITIGNORE_NAME, IGNORE_FILE_NAME)
+                    for path in changed_paths):
+                changed_paths = None
+
+        # A single walk of the project feeds the concat file, the Source copy
+        # and the ZIP backup, each file being read at most once.
+        scan_started_ns = time.time_ns()
+        tracker = ProgressTracker(progress, cancel_event, metrics)
+        # Prevent processing the tool itself, its catalog and metrics
+        skip_paths = TOOL_FILES + store_files(script_dir)
+        if changed_paths is None:
+            tracker.scan_stats = {}
+        else:
+            with metrics.phase('walk'):
+                project_files = walk_changed_paths(
+                    project_dir, previous, changed_paths, skip_paths, racy_after_ns
+                )
+            tracker.set_totals(len(project_files), sum(project_file.stat.st_size for project_file in project_files))
+            metrics.count('paths_changed', len(changed_paths))
+        sinks = []
+        with STORE_LOCK.shared(script_dir):
+            try:
+                concat_sink = ConcatSink(
+                    output_file,
+                    os.path.join(parent_folder, parent_manifest['concat_file']) if parent_folder else None,
+                    header, settings['concat_max_file_bytes'], settings['concat_shard_bytes'],
+                    settings['concat_gzip'], settings['zip_compresslevel'], resume_folder
+                )
+                sinks.append(concat_sink)
+                sinks.append(ObjectStoreSink(os.path.join(script_dir, OBJECTS_DIR_NAME), source_copy_folder))
+                zip_sink = ZipSink(
+                    zip_file_name, version_name, parent_name,
+                    settings['zip_workers'], settings['zip_compresslevel'],
+                    os.path.join(resume_folder, os.path.basename(zip_file_name)) if resume_folder else None,
+                    [path for path, entry in resumed.items() if entry.get('zip') == version_name]
+                )
+                sinks.append(zip_sink)
+                journal = SaveJournal(os.path.join(version_folder, JOURNAL_NAME), scan_started_ns, concat_sink.files[0])
+                if changed_paths is None:
+                    project_files = scan_project(project_dir, skip_paths=skip_paths, stats=tracker.scan_stats)
+                entries = run_snapshot_pipeline(project_files, sinks, previous, racy_after_ns, tracker, journal)
+            finally:
+                if journal is not None:
+                    journal.close()
+                for sink in sinks:
+                    # Closing waits for the last writes and compressions
+                    with metrics.phase(sink.phase):
+                        sink.close()
+        if tracker.scan_stats is not None:
+            metrics.add_time('walk', tracker.scan_stats['seconds'])
+
+        with metrics.phase('manifest'):
+            index_file = concat_index_file(output_file)
+            # A file that failed after a sink reused it is in no manifest entry
+            saved_paths = {entry['path'] for entry in entries}
+            write_json_file(index_file, {
+                'concat_file': concat_sink.files[0],
+                'concat_files': concat_sink.files,
+                'files': {path: section for path, section in concat_sink.index.items() if path in saved_paths},
+                'skipped': {path: reason for path, reason in concat_sink.skipped.items() if path in saved_paths}
+            })
+
+            # The manifest is written last: a version without one is incomplete
+            write_manifest(version_folder, {
+                'version': version,
+                'datetime': current_datetime,
+                'parent': parent_name,
+                'scan_started_ns': scan_started_ns,
+                'concat_file': concat_sink.files[0],
+                'concat_files': concat_sink.files,
+                'concat_index': os.path.basename(index_file),
+                'zip_file': os.path.basename(zip_file_name),
+                'files': entries
+            })
+            marker.close()
+            marker = None
+            remove_save_state(version_folder)
+        total_bytes = sum(entry['size'] for entry in entries)
+        with metrics.phase('catalog'), open_catalog(script_dir) as catalog:
+            catalog.execute(
+                "UPDATE versions SET file_count = ?, total_bytes = ?, hash_root = ?, state = ? WHERE name = ?",
+                (len(entries), total_bytes, compute_hash_root(entries), SAVED, version_name)
+            )
+        changed = sum(1 for entry in entries if entry.get('zip') == version_name)
+        failed = metrics.counters.get('files_failed', 0)
+
+        metrics.count('files', len(entries))
+        metrics.count('bytes', total_bytes)
+        metrics.count('files_changed', changed)
+        metrics.count('files_failed', 0)  # Recorded even when no file failed
+        metrics.count('concat_skipped', len(concat_sink.skipped))
+        metrics.count('files_resumed', len(resumed))
+        if settings['search_index']:
+            with metrics.phase('search_index'):
+                index_saved_version(script_dir, version_name)
+        record = metrics.record(
+            version=version_name,
+            compression_ratio=zip_sink.backup_zip.compression_ratio()
+        )
+        write_metrics(script_dir, record)
+
+        # Return version information for the success dialog
+        return {
+            'version': version,
+            'datetime': current_datetime,
+            'version_folder': version_folder,
+            'zip_file': zip_file_name,
+            'parent': parent_name,
+            'file_count': len(entries),
+            'changed_count': changed,
+            'failed_count': failed,
+            'concat_files': concat_sink.files,
+            'concat_skipped': concat_sink.skipped,
+            'resumed': resume_folder is not None,
+            'metrics': record
+        }
+
+    except BaseException as e:
+        if not isinstance(e, OperationCancelled):
+            logging.error("Failed to concatenate and backup files.", exc_info=True)
+        if marker is not None:
+            marker.close()
+        # Leave no partial version folder behind
+        if version_folder is not None and os.path.isdir(version_folder):
+            remove_tree(version_folder)
+        if version_name is not None:
+            with open_catalog(script_dir) as catalog:
+                catalog.execute("DELETE FROM versions WHERE name = ?", (version_name,))
+        raise e  # Re-raise the exception to be caught by the caller
+
+
+def file_matches(file_path, size, content_hash, mtime_ns=None, trusted_before_ns=None):
+    """
+    Check whether a file on disk already has the given content.
+
+    Files whose size and mtime match are trusted without being read, unless
+    they were modified after trusted_before_ns, like in save_version.
+
+    Parameters:
+        file_path (str): The file to check.
+        size (int): The expected size.
+        content_hash (str): The expected hash.
+        mtime_ns (int, optional): The mtime the content was saved with.
+        trusted_before_ns (int, optional): When the content was saved.
+
+    Returns:
+        bool: True if the file exists with that content.
+    """
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return False
+    if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size != size:
+        return False
+    if (mtime_ns is not None and file_stat.st_mtime_ns == mtime_ns
+            and (trusted_before_ns is None or mtime_ns < trusted_before_ns)):
+        return True
+    digest = hashlib.new(HASH_NAME)
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest() == content_hash
+
+
+def project_file_path(root, relpath):
+    """
+    Join a '/'-separated relative path to a folder, refusing paths that would
+    land outside of it.
+
+    Parameters:
+        root (str): The absolute folder.
+        relpath (str): The relative path, as in manifests and ZIPs.
+
+    Returns:
+        str: The absolute path of the file.
+
+    Raises:
+        ValueError: If the path escapes the folder.
+    """
+    dest_file = os.path.normpath(os.path.join(root, *relpath.split('/')))
+    if os.path.isabs(relpath) or os.path.commonpath([root, dest_file]) != root:
+        raise ValueError(f"Refusing to write {relpath} outside of {root}")
+    return dest_file
+
+
+def temp_file_for(dest_file):
+    """
+    Return a unique temporary name next to a file, for writing it atomically.
+    """
+    return os.path.join(os.path.dirname(dest_file), f".{os.path.basename(dest_file)}.{os.urandom(4).hex()}.tmp")
+
+
+def finish_temp_file(temp_file, dest_file, mtime_ns=None):
+    """
+    Move a completed temporary file over its destination, keeping the
+    permissions of the file it replaces.
+    """
+    if os.path.exists(dest_file):
+        shutil.copymode(dest_file, temp_file)
+    if mtime_ns is not None:
+        os.utime(temp_file, ns=(mtime_ns, mtime_ns))
+    os.replace(temp_file, dest_file)
+
+
+@contextmanager
+def atomic_output(dest_file, mtime_ns=None):
+    """
+    Open a temporary file that replaces dest_file once the with block
+    completes, and is removed if it fails.
+
+    Parameters:
+        dest_file (str): The file to create or replace.
+        mtime_ns (int, optional): The modification time to give it.
+
+    Yields:
+        file: The temporary file, opened for binary writing.
+    """
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    temp_file = temp_file_for(dest_file)
+    try:
+        with open(temp_file, 'xb') as outfile:
+            yield outfile
+        finish_temp_file(temp_file, dest_file, mtime_ns)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def reflink(infile, outfile):
+    """
+    Make outfile share the extents of infile (copy-on-write), where the
+    filesystem supports it (Btrfs, XFS, ...).
+
+    Parameters:
+        infile (file): The source, opened for reading.
+        outfile (file): The empty destination, opened for writing.
+
+    Returns:
+        bool: True if the file was cloned.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def clone_file(source_file, dest_file):
+    """
+    Create dest_file as a reflink of source_file, without copying any data.
+
+    Returns:
+        bool: True if the clone was made; otherwise dest_file does not exist.
+    """
+    with open(source_file, 'rb') as infile, open(dest_file, 'xb') as outfile:
+        cloned = reflink(infile, outfile)
+    if not cloned:
+        os.remove(dest_file)
+    return cloned
+
+
+def copy_file_data(source_file, dest_file):
+    """
+    Copy the content of a file, letting the kernel move the data where it can.
+
+    On Linux a reflink is tried first, then copy_file_range and sendfile, which
+    copy inside the kernel; other systems use shutil.copyfile, which has its
+    own fast paths. A buffered copy is the last resort.
+
+    Parameters:
+        source_file (str): The file to copy.
+        dest_file (str): The file to create or overwrite.
+    """
+    if not sys.platform.startswith('linux'):
+        shutil.copyfile(source_file, dest_file)
+        return
+    with open(source_file, 'rb') as infile, open(dest_file, 'wb') as outfile:
+        if reflink(infile, outfile):
+            return
+        in_fd, out_fd = infile.fileno(), outfile.fileno()
+        for kernel_copy in (getattr(os, 'copy_file_range', None), os.sendfile):
+            if kernel_copy is None:
+                continue
+            offset = 0
+            try:
+                while True:
+                    if kernel_copy is os.sendfile:
+                        copied = os.sendfile(out_fd, in_fd, offset, READ_CHUNK_SIZE * 8)
+                    else:
+                        copied = kernel_copy(in_fd, out_fd, READ_CHUNK_SIZE * 8, offset, offset)
+                    if not copied:
+                        return
+                    offset += copied
+            except OSError:
+                # Not supported for these files: start over with the next method
+                os.ftruncate(out_fd, 0)
+        infile.seek(0)
+        outfile.seek(0)
+        shutil.copyfileobj(infile, outfile, READ_CHUNK_SIZE)
+
+
+def replace_file(source_file, dest_file, mtime_ns=None):
+    """
+    Copy a file over another through a temporary file in the destination
+    folder and a rename, so the destination is never left half-written.
+
+    Parameters:
+        source_file (str): The file to copy.
+        dest_file (str): The file to create or replace.
+        mtime_ns (int, optional): The modification time to give the copy.
+    """
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+    temp_file = temp_file_for(dest_file)
+    try:
+        # Content only: objects are read-only, and the copy gets default permissions
+        copy_file_data(source_file, temp_file)
+        finish_temp_file(temp_file, dest_file, mtime_ns)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def restore_plan(script_dir, version_folder, manifest, packs=None):
+    """
+    List the files a restore writes, and where each one comes from.
+
+    Versions with a manifest are restored to their relative paths from the
+    object store, or from the packs once packed; older versions only have a
+    flat Source folder, whose files are restored to the project root.
+
+    Parameters:
+        script_dir (str): The directory holding the versions.
+        version_folder (str): The version folder to restore.
+        manifest (dict): The manifest of the version, or None.
+        packs (PackStore, optional): The packs, for a packed version.
+
+    Returns:
+        list: (source file, relative path, size, hash or None, mtime_ns or None) tuples.
+    """
+    plan = []
+    if manifest is not None:
+        objects_dir = os.path.join(script_dir, OBJECTS_DIR_NAME)
+        for entry in manifest['files']:
+            # Only source files are kept in the object store
+            if entry['path'].endswith(SOURCE_EXTENSIONS):
+                if packs is not None:
+                    source_file = packs.pack_file(entry['hash'])
+                else:
+                    source_file = object_path(objects_dir, entry['hash'])
+                plan.append((source_file, entry['path'], entry['size'], entry['hash'], entry['mtime_ns']))
+        return plan
+
+    for foldername, subfolders, filenames in os.walk(os.path.join(version_folder, "Source")):
+        for filename in filenames:
+            source_file = os.path.join(foldername, filename)
+            plan.append((source_file, filename, os.path.getsize(source_file), None, None))
+    return plan
+
+
+def plan_save(script_dir=None, project_dir=None):
+    """
+    Function to preview what a save would include, without saving.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        project_dir (str, optional): The root of the project.
+
+    Returns:
+        dict: The number of files and bytes a save would include, and for
+        each ignore rule that excluded something, its source, pattern and
+        the files and bytes it excluded (largest first).
+    """
+    try:
+        script_dir, project_dir = resolve_dirs(script_dir, project_dir)
+        report = {}
+        file_count = 0
+        total_bytes = 0
+        for project_file in walk_project(project_dir, TOOL_FILES + store_files(script_dir), report=report):
+            file_count += 1
+            total_bytes += project_file.stat.st_size
+        ignored = [
+            {'source': source, 'pattern': pattern, 'files': counts['files'], 'bytes': counts['bytes']}
+            for (source, pattern), counts in report.items()
+        ]
+        ignored.sort(key=lambda rule: rule['bytes'], reverse=True)
+        return {'project_dir': project_dir, 'file_count': file_count, 'bytes': total_bytes, 'ignored': ignored}
+    except Exception as e:
+        logging.error("Failed to preview the save.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+
+
+def restore_version(version, script_dir=None, project_dir=None, progress=None, cancel_event=None, dry_run=False):
+    """
+    Function to restore a version.
+
+    Only the files whose content differs from the version are written, each
+    one atomically; files already up to date are left untouched. Packed
+    versions are restored from their pack.
+
+    Parameters:
+        version (str): The name of the version folder to restore.
+        script_dir (str, optional): The directory holding the versions.
+        project_dir (str, optional): The root of the project.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the restore.
+        dry_run (bool): Only report which files the restore would write.
+
+    Returns:
+        dict: Information about the restore: the relative paths of the files
+        written (or to be written), their count and size, the number of files
+        already up to date or that failed, the copy throughput in bytes per
+        second and the metrics of the restore.
+    """
+    metrics = OperationMetrics('restore')
+    tracker = ProgressTracker(progress, cancel_event, metrics)
+    packs = None
+    try:
+        script_dir, project_dir = resolve_dirs(script_dir, project_dir)
+        version_folder = os.path.join(script_dir, version)
+        if os.path.isdir(version_folder):
+            manifest = load_manifest(version_folder)
+        else:
+            packs = PackStore(script_dir)
+            manifest = packs.load_manifest(version)
+            if manifest is None:
+                raise FileNotFoundError(f"Version {version} not found in {script_dir}")
+
+        trusted_before_ns = manifest['scan_started_ns'] if manifest is not None else None
+        settings = load_settings(script_dir)
+        workers = settings['copy_workers'] or min(32, (os.cpu_count() or 1) + 4)
+
+        def restore_file(item):
+            source_file, relpath, size, content_hash, mtime_ns = item
+            dest_file = project_file_path(project_dir, relpath)
+            try:
+                with metrics.phase('check'):
+                    if content_hash is not None:
+                        up_to_date = file_matches(dest_file, size, content_hash, mtime_ns, trusted_before_ns)
+                    else:
+                        up_to_date = (os.path.isfile(dest_file)
+                                      and filecmp.cmp(source_file, dest_file, shallow=False))
+                if up_to_date:
+                    return 'unchanged'
+                if not dry_run:
+                    with metrics.phase('copy'):
+                        if packs is not None:
+                            with packs.open_object(content_hash) as infile:
+                                with atomic_output(dest_file, mtime_ns) as outfile:
+                                    shutil.copyfileobj(infile, outfile, READ_CHUNK_SIZE)
+                        else:
+                            replace_file(source_file, dest_file, mtime_ns)
+                return 'copied'
+            except Exception as copy_e:
+                logging.error(f"Failed to copy file {source_file} to {dest_file}.", exc_info=True)
+                return 'failed'  # Skip copying this file
+
+        # Files are checked and copied on a pool of threads: with many small
+        # files, the time goes to per-file system calls rather than data
+        copied = []
+        copied_bytes = 0
+        unchanged = 0
+        failed = 0
+        with STORE_LOCK.shared(script_dir):
+            with metrics.phase('plan'):
+                plan = restore_plan(script_dir, version_folder, manifest, packs)
+            tracker.set_totals(len(plan), sum(item[2] for item in plan))
+            for item, outcome in run_parallel(
+                    restore_file, plan, workers, tracker, lambda item: item[2], 'concatcode-restore'):
+                if outcome == 'copied':
+                    copied.append(item[1])
+                    copied_bytes += item[2]
+                elif outcome == 'unchanged':
+                    unchanged += 1
+                else:
+                    failed += 1
+
+        tracker.report(force=True)
+        elapsed = time.monotonic() - tracker.started
+        metrics.count('files', len(plan))
+        metrics.count('files_copied', len(copied))
+        metrics.count('bytes_copied', copied_bytes)
+        metrics.count('files_unchanged', unchanged)
+        metrics.count('files_failed', failed)
+        record = metrics.record(version=version, dry_run=dry_run)
+        write_metrics(script_dir, record)
+        return {
+            'version': version,
+            'project_dir': project_dir,
+            'dry_run': dry_run,
+            'files': copied,
+            'file_count': len(copied),
+            'bytes': copied_bytes,
+            'unchanged_count': unchanged,
+            'failed_count': failed,
+            'throughput': copied_bytes / elapsed if elapsed > 0 else 0.0,
+            'metrics': record
+        }
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        logging.error("Failed to restore version.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+    finally:
+        if packs is not None:
+            packs.close()
+
+
+def archive_version(version, script_dir=None, progress=None, cancel_event=None):
+    """
+    Function to archive a version.
+
+    The version folder is only removed once its archive is complete.
+
+    Parameters:
+        version (str): The name of the version folder to archive.
+        script_dir (str, optional): The directory holding the versions.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the archiving.
+
+    Returns:
+        dict: Information about the archive, with its metrics.
+    """
+    metrics = OperationMetrics('archive')
+    try:
+        script_dir, _ = resolve_dirs(script_dir)
+        version_folder = os.path.join(script_dir, version)
+        if not os.path.isdir(version_folder):
+            with PackStore(script_dir) as packs:
+                if packs.load_manifest(version) is not None:
+                    raise ValueError(f"Version {version} is packed in {PACKS_DIR_NAME} and cannot be archived")
+            raise FileNotFoundError(f"Version {version} not found in {script_dir}")
+        archive_folder = os.path.join(script_dir, "Archived_Versions")
+        os.makedirs(archive_folder, exist_ok=True)
+        archive_file = os.path.join(archive_folder, version + '.zip')
+        settings = load_settings(script_dir)
+        tracker = ProgressTracker(progress, cancel_event, metrics)
+        with STORE_LOCK.shared(script_dir), metrics.phase('compress'):
+            ratio = write_version_archive(
+                version_folder, archive_file, os.path.join(script_dir, OBJECTS_DIR_NAME), tracker,
+                settings['zip_workers'], settings['zip_compresslevel']
+            )
+        tracker.report(force=True)
+        with metrics.phase('catalog'), open_catalog(script_dir) as catalog:
+            catalog.execute("UPDATE versions SET state = ? WHERE name = ?", (ARCHIVED, version))
+        with metrics.phase('cleanup'):
+            remove_tree(version_folder)
+        metrics.count('files', tracker.files_done)
+        metrics.count('bytes', tracker.bytes_done)
+        record = metrics.record(
+            version=version,
+            compression_ratio=ratio
+        )
+        write_metrics(script_dir, record)
+        return {'version': version, 'archive_file': archive_file, 'metrics': record}
+    except BaseException as e:
+        if not isinstance(e, OperationCancelled):
+            logging.error("Failed to archive version.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+
+
+def retained_versions(versions, keep_last, keep_daily=None, keep_weekly=None):
+    """
+    Apply the retention policy: keep the keep_last most recent versions, and
+    the most recent version of each of the last keep_daily days and of each
+    of the last keep_weekly weeks that have versions.
+
+    Parameters:
+        versions (list): (name, datetime) pairs, newest first, the datetimes
+            written as in version names.
+        keep_last (int): The number of most recent versions to keep; the
+            most recent one is always kept.
+        keep_daily (int, optional): The number of days to keep a version of.
+        keep_weekly (int, optional): The number of weeks to keep a version of.
+
+    Returns:
+        set: The names of the versions to keep.
+    """
+    kept = {name for name, _ in versions[:max(1, keep_last or 0)]}
+    periods = (
+        (keep_daily, lambda saved_at: saved_at.date()),
+        (keep_weekly, lambda saved_at: saved_at.isocalendar()[:2]),
+    )
+    for count, period_of in periods:
+        seen = set()
+        for name, saved_at in versions:
+            if len(seen) >= (count or 0):
+                break
+            period = period_of(datetime.strptime(saved_at, "%Y-%m-%d_%H-%M-%S"))
+            if period not in seen:
+                seen.add(period)
+                kept.add(name)
+    return kept
+
+
+def compact_versions(script_dir=None, progress=None, cancel_event=None, dry_run=False):
+    """
+    Function to compact the versions the retention policy does not keep.
+
+    The keep_last, keep_daily and keep_weekly settings choose the versions
+    that stay as they are (see retained_versions). The others are written to
+    a new pack in Version_Packs, which stores each file content once across
+    all packs, then their folders and the objects only they used are
+    removed. Packed versions are still listed, and can still be restored
+    and compared.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the compaction.
+        dry_run (bool): Only report which versions would be packed.
+
+    Returns:
+        dict: The versions packed (oldest first), the number of versions
+        kept, the pack file, the number and size of the contents it stores,
+        the objects removed from the store, the bytes freed and the metrics
+        of the compaction.
+    """
+    temp_file = None
+    ratio = None
+    metrics = OperationMetrics('compact')
+    tracker = ProgressTracker(progress, cancel_event, metrics)
+    try:
+        script_dir, _ = resolve_dirs(script_dir)
+        settings = load_settings(script_dir)
+        result = {
+            'dry_run': dry_run, 'packed': [], 'kept_count': 0, 'pack_file': None,
+            'objects': 0, 'bytes': 0, 'removed': 0, 'freed_bytes': 0
+        }
+        # Saves, restores and archives finish first: they may use the versions packed
+        with STORE_LOCK.exclusive(script_dir):
+            with metrics.phase('plan'):
+                with open_catalog(script_dir) as catalog:
+                    rows = catalog.execute(
+                        "SELECT name, datetime FROM versions WHERE state = ? AND hash_root IS NOT NULL "
+                        "ORDER BY number DESC, datetime DESC", (SAVED,)
+                    ).fetchall()
+                versions = [(row['name'], row['datetime']) for row in rows]
+                kept = retained_versions(
+                    versions, settings['keep_last'], settings['keep_daily'], settings['keep_weekly']
+                )
+                result['packed'] = [name for name, _ in reversed(versions) if name not in kept]
+                result['kept_count'] = len(kept)
+
+            if result['packed'] and not dry_run:
+                manifests = {name: load_version_manifest(script_dir, name) for name in result['packed']}
+                packs_dir = os.path.join(script_dir, PACKS_DIR_NAME)
+                os.makedirs(packs_dir, exist_ok=True)
+                pack_file = os.path.join(packs_dir, f"pack_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.zip")
+                base_file, suffix = pack_file[:-len('.zip')], 1
+                while os.path.exists(pack_file):
+                    suffix += 1
+                    pack_file = f"{base_file}_{suffix}.zip"
+
+                # The pack only appears once complete
+                temp_file = temp_file_for(pack_file)
+                with metrics.phase('pack'), PackStore(script_dir) as packs, VersionFileReader(script_dir) as reader:
+                    written = write_version_pack(
+                        temp_file, manifests, reader, packs, tracker,
+                        settings['zip_workers'], settings['zip_compresslevel']
+                    )
+                os.replace(temp_file, pack_file)
+                temp_file = None
+                tracker.report(force=True)
+                with metrics.phase('catalog'), open_catalog(script_dir) as catalog:
+                    catalog.executemany(
+                        "UPDATE versions SET state = ? WHERE name = ?", [(PACKED, name) for name in manifests]
+                    )
+                with metrics.phase('cleanup'):
+                    for name in manifests:
+                        if os.path.isdir(os.path.join(script_dir, name)):
+                            remove_tree(os.path.join(script_dir, name))
+                    garbage = _collect_garbage(script_dir)
+                result.update(
+                    pack_file=pack_file, objects=written['objects'], bytes=written['bytes'],
+                    removed=garbage['removed'], freed_bytes=garbage['freed_bytes']
+                )
+                ratio = written['compression_ratio']
+
+        metrics.count('versions_packed', 0 if dry_run else len(result['packed']))
+        metrics.count('versions_kept', result['kept_count'])
+        metrics.count('objects_packed', result['objects'])
+        metrics.count('bytes_packed', result['bytes'])
+        metrics.count('objects_removed', result['removed'])
+        metrics.count('bytes_freed', result['freed_bytes'])
+        record = metrics.record(dry_run=dry_run, compression_ratio=ratio)
+        write_metrics(script_dir, record)
+        result['metrics'] = record
+        return result
+    except BaseException as e:
+        if not isinstance(e, OperationCancelled):
+            logging.error("Failed to compact versions.", exc_info=True)
+        if temp_file is not None and os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise e  # Re-raise to be caught by the caller
+
+
+def _hash_copy(kind, path, location, opener, expected_hash=None):
+    """
+    Read one stored copy of a file to its end, in chunks. ZIP members are
+    checked against their CRC as they are read.
+
+    Returns:
+        tuple: (bytes read, list of VerifyResult failures).
+    """
+    digest = hashlib.new(HASH_NAME)
+    nbytes = 0
+    try:
+        with opener() as infile:
+            for chunk in iter(lambda: infile.read(READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                nbytes += len(chunk)
+    except Exception as e:  # BadZipFile, zlib.error, OSError...
+        return nbytes, [VerifyResult(kind, path, location, str(e) or type(e).__name__)]
+    if expected_hash is not None and digest.hexdigest() != expected_hash:
+        return nbytes, [
+            VerifyResult(kind, path, location, f"content hash {digest.hexdigest()}, expected {expected_hash}")
+        ]
+    return nbytes, []
+
+
+def _check_concat_part(reader, name, paths):
+    """
+    Check the sections of one part of a concat snapshot against the hashes
+    of its index, reading the part from start to end.
+
+    Returns:
+        tuple: (bytes read, list of VerifyResult failures).
+    """
+    nbytes = 0
+    failures = []
+    for path in sorted(paths, key=lambda path: reader.index[path]['offset']):
+        try:
+            text = reader.read(path)
+        except Exception as e:
+            failures.append(VerifyResult('concat', path, name, str(e) or type(e).__name__))
+            continue
+        nbytes += len(text)
+        content_hash = hashlib.new(HASH_NAME, text).hexdigest()
+        if content_hash != reader.hash(path):
+            failures.append(VerifyResult(
+                'concat', path, name, f"content hash {content_hash}, expected {reader.hash(path)}"
+            ))
+    return nbytes, failures
+
+
+def verify_version(version, script_dir=None, progress=None, cancel_event=None):
+    """
+    Function to check that a version, live, archived or packed, is intact.
+
+    Every stored copy of its files is read back and hashed, on a thread per
+    core: its objects in the store or the packs, the members of its backup
+    ZIP (or of the backup of the version that holds them) and the sections
+    of its concat snapshot. The hashes are compared with the manifest, and
+    the manifest with the hash root in the catalog. Each member of an
+    archive is also checked against its CRC, like the backup ZIP of a
+    version saved before manifests existed.
+
+    Parameters:
+        version (str): The name of the version folder.
+        script_dir (str, optional): The directory holding the versions.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the check.
+
+    Returns:
+        dict: The version, the number of files in its manifest, the number
+        of copies and bytes read, the failures found (the kind of copy,
+        path, location and error of each; none if the version is intact)
+        and the metrics of the check.
+    """
+    metrics = OperationMetrics('verify')
+    tracker = ProgressTracker(progress, cancel_event, metrics)
+    try:
+        script_dir, _ = resolve_dirs(script_dir)
+        version_folder = os.path.join(script_dir, version)
+        archive_file = os.path.join(script_dir, "Archived_Versions", version + '.zip')
+        objects_dir = os.path.join(script_dir, OBJECTS_DIR_NAME)
+        failures = []
+        # (bytes, check function, arguments)
+        checks = []
+        file_count = 0
+        with STORE_LOCK.shared(script_dir), VersionFileReader(script_dir) as reader, ExitStack() as stack:
+            with metrics.phase('plan'):
+                live = os.path.isdir(version_folder)
+                if not live and os.path.isfile(archive_file):
+                    archive = stack.enter_context(zipfile.ZipFile(archive_file, 'r'))
+                    for member in archive.infolist():
+                        if not member.is_dir():
+                            checks.append((member.file_size, _hash_copy, (
+                                'archive', member.filename, archive_file, partial(archive.open, member)
+                            )))
+                try:
+                    manifest = load_version_manifest(script_dir, version)
+                except FileNotFoundError:
+                    if not live and not checks:
+                        raise
+                    manifest = None
+
+                if manifest is None and live:
+                    # Only the CRCs of the backup ZIP can tell whether it is intact
+                    backup_zip = open_backup_zip(script_dir, version)
+                    reader.backups[version] = backup_zip
+                    for member in backup_zip.infolist():
+                        if not member.is_dir():
+                            checks.append((member.file_size, _hash_copy, (
+                                'zip', member.filename, backup_zip.filename, partial(backup_zip.open, member)
+                            )))
+
+                if manifest is not None:
+                    entries = manifest['files']
+                    file_count = len(entries)
+                    with open_catalog(script_dir) as catalog:
+                        row = catalog.execute("SELECT hash_root FROM versions WHERE name = ?", (version,)).fetchone()
+                    hash_root = compute_hash_root(entries)
+                    if row is not None and row['hash_root'] is not None and row['hash_root'] != hash_root:
+                        failures.append(VerifyResult(
+                            'catalog', MANIFEST_NAME, CATALOG_NAME,
+                            f"hash root {hash_root}, expected {row['hash_root']}"
+                        ))
+
+                    for entry in entries:
+                        stored = False
+                        object_file = object_path(objects_dir, entry['hash'])
+                        if os.path.isfile(object_file):
+                            checks.append((entry['size'], _hash_copy, (
+                                'object', entry['path'], object_file, partial(open, object_file, 'rb'), entry['hash']
+                            )))
+                            stored = True
+                        elif reader.packs.has_object(entry['hash']):
+                            checks.append((entry['size'], _hash_copy, (
+                                'pack', entry['path'], reader.packs.pack_file(entry['hash']),
+                                partial(reader.packs.open_object, entry['hash']), entry['hash']
+                            )))
+                            stored = True
+                        # The backup ZIPs of other versions are only read where no object holds the file
+                        if 'zip' not in entry or (stored and entry['zip'] != version):
+                            if not stored:
+                                failures.append(VerifyResult('object', entry['path'], None, "no stored copy"))
+                            continue
+                        # The backups are opened here, as the workers share them
+                        backup_zip = reader.backups.get(entry['zip'])
+                        if backup_zip is None:
+                            try:
+                                backup_zip = open_backup_zip(script_dir, entry['zip'])
+                            except (OSError, zipfile.BadZipFile) as e:
+                                failures.append(VerifyResult('zip', entry['path'], entry['zip'], str(e)))
+                                continue
+                            reader.backups[entry['zip']] = backup_zip
+                        if isinstance(backup_zip, PackedBackup) and stored:
+                            continue  # Its files are the objects of the packs
+                        checks.append((entry['size'], _hash_copy, (
+                            'zip', entry['path'], entry['zip'], partial(backup_zip.open, entry['path']), entry['hash']
+                        )))
+
+                    if live and 'concat_file' in manifest:
+                        try:
+                            concat = stack.enter_context(open_concat(version, script_dir))
+                            parts = {}
+                            for path, section in concat.index.items():
+                                parts.setdefault(section.get('file', concat.concat_file), []).append(path)
+                            for name, paths in parts.items():
+                                concat._part(name)  # Opened here, as the workers share the reader
+                                checks.append((
+                                    sum(concat.index[path]['length'] for path in paths),
+                                    _check_concat_part, (concat, name, paths)
+                                ))
+                        except (OSError, ValueError) as e:
+                            failures.append(VerifyResult('concat', None, manifest['concat_file'], str(e)))
+
+            tracker.set_totals(len(checks), sum(check[0] for check in checks))
+            total_bytes = 0
+            with metrics.phase('verify'):
+                for _, (nbytes, found) in run_parallel(
+                        lambda check: check[1](*check[2]), checks, os.cpu_count() or 1,
+                        tracker, lambda check: check[0], 'concatcode-verify'):
+                    total_bytes += nbytes
+                    failures.extend(found)
+            tracker.report(force=True)
+
+        for failure in failures:
+            logging.warning(f"{version}: {failure.kind} copy of {failure.path} in {failure.location}: {failure.error}")
+        metrics.count('files', file_count)
+        metrics.count('copies', len(checks))
+        metrics.count('bytes', total_bytes)
+        metrics.count('failures', len(failures))
+        record = metrics.record(version=version)
+        write_metrics(script_dir, record)
+        return {
+            'version': version,
+            'file_count': file_count,
+            'copies': len(checks),
+            'bytes': total_bytes,
+            'failures': [failure._asdict() for failure in failures],
+            'metrics': record
+        }
+    except BaseException as e:
+        if not isinstance(e, OperationCancelled):
+            logging.error("Failed to verify version.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+
+
+def extract_version(zip_file, script_dir=None, progress=None, cancel_event=None, patterns=None,
+                    into_project=False, project_dir=None):
+    """
+    Function to extract a version from a ZIP file.
+
+    Only the selected members are read from the ZIP, and they are extracted
+    in parallel.
+
+    Parameters:
+        zip_file (str): The path to the ZIP file to extract.
+        script_dir (str, optional): The directory holding the versions.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the extraction.
+        patterns (list, optional): Glob patterns selecting the files to
+            extract (see select_members); None extracts everything.
+        into_project (bool): Write the files straight into the project tree
+            instead of a new folder under extracted_version.
+        project_dir (str, optional): The root of the project.
+
+    Returns:
+        dict: Information about the extraction, with its metrics.
+    """
+    extract_folder = None
+    created = False
+    metrics = OperationMetrics('extract')
+    tracker = ProgressTracker(progress, cancel_event, metrics)
+    try:
+        script_dir, project_dir = resolve_dirs(script_dir, project_dir)
+        settings = load_settings(script_dir)
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            with metrics.phase('list'):
+                members = select_members(zip_members(zip_ref), patterns)
+            if patterns and not members:
+                raise FileNotFoundError(f"No file in {zip_file} matches {', '.join(patterns)}")
+            if into_project:
+                extract_folder = project_dir
+            else:
+                extract_folder = os.path.join(
+                    script_dir, "extracted_version", datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                )
+                # Extractions started within the same second each get their own folder
+                base_folder, suffix = extract_folder, 1
+                while True:
+                    try:
+                        os.makedirs(extract_folder)
+                        break
+                    except FileExistsError:
+                        suffix += 1
+                        extract_folder = f"{base_folder}_{suffix}"
+                created = True
+            # An incremental backup only holds the changed files: the others
+            # are read from the backups of earlier versions
+            with metrics.phase('extract'):
+                extract_members(script_dir, zip_ref, members, extract_folder, tracker, settings['zip_workers'])
+        tracker.report(force=True)
+        elapsed = time.monotonic() - tracker.started
+        metrics.count('files', len(members))
+        metrics.count('bytes', tracker.bytes_done)
+        record = metrics.record(zip_file=os.path.basename(zip_file))
+        write_metrics(script_dir, record)
+        return {
+            'zip_file': zip_file,
+            'extract_folder': extract_folder,
+            'file_count': len(members),
+            'bytes': tracker.bytes_done,
+            'throughput': tracker.bytes_done / elapsed if elapsed > 0 else 0.0,
+            'metrics': record
+        }
+    except OperationCancelled:
+        if created:
+            shutil.rmtree(extract_folder, ignore_errors=True)
+        raise
+    except Exception as e:
+        logging.error("Failed to extract version from ZIP.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+
+
+def diff_versions(old_version, new_version, script_dir=None, patterns=None):
+    """
+    Function to list the files that differ between two versions.
+
+    Only the manifests are read, so this is fast even for archived versions.
+
+    Parameters:
+        old_version (str): The name of the older version folder.
+        new_version (str): The name of the newer version folder.
+        script_dir (str, optional): The directory holding the versions.
+        patterns (list, optional): Glob patterns restricting the paths compared.
+
+    Returns:
+        dict: The versions compared, the sorted 'added', 'removed' and
+        'modified' paths and the 'unchanged_count'.
+    """
+    try:
+        script_dir, _ = resolve_dirs(script_dir)
+        _, _, comparison = compare_manifests(
+            load_version_manifest(script_dir, old_version), load_version_manifest(script_dir, new_version), patterns
+        )
+        return dict({'old': old_version, 'new': new_version}, **comparison)
+    except Exception as e:
+        logging.error("Failed to compare versions.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+
+
+def iter_version_diff(old_version, new_version, script_dir=None, patterns=None, cancel_event=None, context=3):
+    """
+    Function to produce a unified diff between two versions, as a stream of lines.
+
+    Added and removed files are named; line diffs are computed for modified
+    text files only, one file at a time, so memory use stays bounded by the
+    largest file compared. Files above DIFF_MAX_BYTES and binary files are
+    reported as differing without a line diff: only the first
+    BINARY_SNIFF_SIZE bytes of a binary file are read.
+
+    Parameters:
+        old_version (str): The name of the older version folder.
+        new_version (str): The name of the newer version folder.
+        script_dir (str, optional): The directory holding the versions.
+        patterns (list, optional): Glob patterns restricting the paths compared.
+        cancel_event (threading.Event, optional): Set to stop the diff.
+        context (int): The number of context lines around each change.
+
+    Yields:
+        str: Lines of the diff, each ending with a newline.
+    """
+    tracker = ProgressTracker(cancel_event=cancel_event)
+    script_dir, _ = resolve_dirs(script_dir)
+    old_files, new_files, comparison = compare_manifests(
+        load_version_manifest(script_dir, old_version), load_version_manifest(script_dir, new_version), patterns
+    )
+    for path in comparison['removed']:
+        yield f"Only in {old_version}: {path}\n"
+    for path in comparison['added']:
+        yield f"Only in {new_version}: {path}\n"
+
+    with STORE_LOCK.shared(script_dir), VersionFileReader(script_dir) as reader:
+        for path in comparison['modified']:
+            tracker.check_cancelled()
+            old_entry, new_entry = old_files[path], new_files[path]
+            old_name, new_name = f"{old_version}/{path}", f"{new_version}/{path}"
+            if max(old_entry['size'], new_entry['size']) > DIFF_MAX_BYTES:
+                yield f"Files {old_name} and {new_name} differ (too large to compare)\n"
+                continue
+            with reader.open(old_entry) as old_file, reader.open(new_entry) as new_file:
+                # The rest of a file is only read once its start shows it is text
+                old_data, new_data = old_file.read(BINARY_SNIFF_SIZE), new_file.read(BINARY_SNIFF_SIZE)
+                if is_binary_chunk(old_data) or is_binary_chunk(new_data):
+                    yield f"Binary files {old_name} and {new_name} differ\n"
+                    continue
+                old_data += old_file.read()
+                new_data += new_file.read()
+            old_lines = old_data.decode('utf-8', errors='replace').splitlines(keepends=True)
+            new_lines = new_data.decode('utf-8', errors='replace').splitlines(keepends=True)
+            del old_data, new_data
+            for line in difflib.unified_diff(old_lines, new_lines, old_name, new_name, n=context):
+                yield line if line.endswith('\n') else line + "\n\\ No newline at end of file\n"
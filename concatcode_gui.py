@@ -0,0 +1,777 @@
+"""
+Qt user interface of the Project Version Manager.
+
+PyQt5 is only imported here, so the core operations and the command line
+interface stay usable on machines without a display or without PyQt5.
+"""
+import sys
+import os
+import logging
+import threading
+
+from functools import partial
+
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QPushButton, QLabel, QComboBox,
+    QMessageBox, QFileDialog, QWidget, QVBoxLayout, QDialog,
+    QDialogButtonBox, QHBoxLayout, QProgressBar, QInputDialog
+)
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+
+from concatcode_core import (
+    SCRIPT_DIR, OperationCancelled, archive_version, collect_garbage, compact_versions, count_versions,
+    diff_versions, extract_version, format_metrics, iter_version_diff, list_versions, restore_version, save_version,
+    verify_version
+)
+from concatcode_search import search_versions
+from concatcode_watch import watch_project
+
+
+class VersionSelectionDialog(QDialog):
+    """
+    A custom dialog for selecting a version from a list.
+
+    Versions are shown newest first, one page at a time, so the dialog stays
+    quick however many versions the catalog holds.
+    """
+    PAGE_SIZE = 50
+
+    def __init__(self, load_page, version_count, action_name, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"{action_name} a Version")
+        self.setModal(True)
+        self.load_page = load_page
+        self.page_count = max(1, -(-version_count // self.PAGE_SIZE))
+        self.page = 0
+        self.init_ui(action_name)
+        self.show_page(0)
+
+    def init_ui(self, action_name):
+        layout = QVBoxLayout()
+
+        label = QLabel(f"Please select a version to {action_name.lower()}:")
+        layout.addWidget(label)
+
+        self.combo = QComboBox()
+        layout.addWidget(self.combo)
+
+        paging_layout = QHBoxLayout()
+        self.newer_button = QPushButton('< Newer')
+        self.newer_button.clicked.connect(lambda: self.show_page(self.page - 1))
+        paging_layout.addWidget(self.newer_button)
+        self.page_label = QLabel()
+        self.page_label.setAlignment(Qt.AlignCenter)
+        paging_layout.addWidget(self.page_label)
+        self.older_button = QPushButton('Older >')
+        self.older_button.clicked.connect(lambda: self.show_page(self.page + 1))
+        paging_layout.addWidget(self.older_button)
+        layout.addLayout(paging_layout)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        self.setLayout(layout)
+
+    def show_page(self, page):
+        """
+        Fill the list with one page of versions.
+
+        Parameters:
+            page (int): The page to show, 0 being the newest versions.
+        """
+        self.page = page
+        self.combo.clear()
+        for record in self.load_page(page * self.PAGE_SIZE, self.PAGE_SIZE):
+            packed = ", packed" if record['state'] == 'packed' else ""
+            self.combo.addItem(f"{record['name']}  ({record['file_count']} files{packed})", record['name'])
+        self.page_label.setText(f"Page {page + 1} of {self.page_count}")
+        self.newer_button.setEnabled(page > 0)
+        self.older_button.setEnabled(page + 1 < self.page_count)
+
+    def get_selected_version(self):
+        if self.exec_() == QDialog.Accepted:
+            return self.combo.currentData()
+        return None
+
+
+# Lines of a version diff shown in the details of the compare dialog
+DIFF_PREVIEW_LINES = 2000
+
+# Matches of a search shown in the details of the search dialog
+SEARCH_RESULT_LIMIT = 200
+
+
+def run_garbage_collection(progress=None, cancel_event=None):
+    """
+    Run collect_garbage as a job; it reports no progress and cannot be cancelled.
+    """
+    return collect_garbage()
+
+
+def run_version_diff(old_version, new_version, progress=None, cancel_event=None):
+    """
+    Compare two versions as a job, keeping the first DIFF_PREVIEW_LINES lines
+    of their unified diff for display.
+    """
+    summary = diff_versions(old_version, new_version)
+    lines = []
+    for line in iter_version_diff(old_version, new_version, cancel_event=cancel_event):
+        if len(lines) == DIFF_PREVIEW_LINES:
+            lines.append("... (diff truncated, run 'concatcode diff' for the full output)\n")
+            break
+        lines.append(line)
+    summary['diff'] = ''.join(lines)
+    return summary
+
+
+class WorkerSignals(QObject):
+    """
+    Signals an OperationWorker emits back to the GUI thread.
+    """
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class OperationWorker(QRunnable):
+    """
+    Runs one operation on the thread pool.
+
+    The operation is called with progress and cancel_event keyword arguments.
+    """
+
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.cancel_event = threading.Event()
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, progress=self.signals.progress.emit, cancel_event=self.cancel_event)
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+class JobWidget(QWidget):
+    """
+    Shows the progress of a running operation, with a button to cancel it.
+    """
+
+    def __init__(self, title, on_cancel, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("QLabel { font-size: 12px; padding: 0px; }")
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.title_label = QLabel(title)
+        layout.addWidget(self.title_label)
+
+        row = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)  # Busy until the first report
+        row.addWidget(self.progress_bar)
+        self.cancel_btn = QPushButton('Cancel')
+        self.cancel_btn.clicked.connect(self.cancel)
+        row.addWidget(self.cancel_btn)
+        layout.addLayout(row)
+
+        self.status_label = QLabel('Starting...')
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+        self.on_cancel = on_cancel
+
+    def cancel(self):
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText('Cancelling...')
+        self.on_cancel()
+
+    def update_progress(self, progress):
+        if not self.cancel_btn.isEnabled():
+            return
+        bytes_total = progress['bytes_total']
+        if progress['totals_final'] and bytes_total:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(int(1000 * min(progress['bytes_done'] / bytes_total, 1.0)))
+
+        files_total = progress['files_total'] if progress['totals_final'] else f"{progress['files_total'] or 0}+"
+        status = (
+            f"{progress['files_done']}/{files_total} files, "
+            f"{progress['bytes_done'] / 1048576:.1f} MB at {progress['throughput'] / 1048576:.1f} MB/s"
+        )
+        if progress['eta'] is not None:
+            status += f", {int(progress['eta'])} s left"
+        self.status_label.setText(status)
+
+
+class VersionManagerApp(QMainWindow):
+    """
+    A GUI application for managing project versions.
+    Allows users to save, restore, archive, and extract versions of their project.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Operations run on this pool so the window stays responsive, and
+        # independent ones (e.g. archiving while saving) run side by side
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max(4, QThread.idealThreadCount()))
+        self.jobs = {}
+        self.busy_versions = set()
+        self.init_ui()
+
+    def init_ui(self):
+        """
+        Initialize the user interface components.
+        """
+        # Set the window title and size
+        self.setWindowTitle('Project Version Manager')
+        self.setGeometry(200, 200, 500, 400)
+
+        # General style using QSS (similar to CSS)
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #1b2a38;
+            }
+            QPushButton {
+                background-color: #517fa4;
+                color: white;
+                padding: 10px;
+                border-radius: 5px;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background-color: #243949;
+            }
+            QLabel {
+                color: white;
+                font-size: 18px;
+                padding: 5px;
+            }
+            QComboBox {
+                background-color: #ffffff;
+                color: #000000;
+                padding: 5px;
+                font-size: 14px;
+            }
+        """)
+
+        # Create a vertical layout for the interface elements
+        self.main_widget = QWidget()
+        self.setCentralWidget(self.main_widget)
+        self.layout = QVBoxLayout()
+        self.main_widget.setLayout(self.layout)
+
+        # Add a title label
+        self.title_label = QLabel('Project Version Manager', self)
+        self.title_label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(self.title_label)
+
+        # Add buttons for different actions
+        self.save_btn = QPushButton('Save Version', self)
+        self.save_btn.clicked.connect(self.save_version)
+        self.layout.addWidget(self.save_btn)
+
+        self.restore_btn = QPushButton('Restore Version', self)
+        self.restore_btn.clicked.connect(self.restore_version)
+        self.layout.addWidget(self.restore_btn)
+
+        self.archive_btn = QPushButton('Archive Version', self)
+        self.archive_btn.clicked.connect(self.archive_version)
+        self.layout.addWidget(self.archive_btn)
+
+        self.extract_btn = QPushButton('Extract Version from ZIP', self)
+        self.extract_btn.clicked.connect(self.extract_version)
+        self.layout.addWidget(self.extract_btn)
+
+        self.compare_btn = QPushButton('Compare Versions', self)
+        self.compare_btn.clicked.connect(self.compare_versions)
+        self.layout.addWidget(self.compare_btn)
+
+        self.gc_btn = QPushButton('Clean Up Storage', self)
+        self.gc_btn.clicked.connect(self.clean_up_storage)
+        self.layout.addWidget(self.gc_btn)
+
+        self.compact_btn = QPushButton('Compact Old Versions', self)
+        self.compact_btn.clicked.connect(self.compact_versions)
+        self.layout.addWidget(self.compact_btn)
+
+        self.verify_btn = QPushButton('Verify Version', self)
+        self.verify_btn.clicked.connect(self.verify_version)
+        self.layout.addWidget(self.verify_btn)
+
+        self.search_btn = QPushButton('Search Versions', self)
+        self.search_btn.clicked.connect(self.search_versions)
+        self.layout.addWidget(self.search_btn)
+
+        self.watch_btn = QPushButton('Watch Project', self)
+        self.watch_btn.clicked.connect(self.watch_project)
+        self.layout.addWidget(self.watch_btn)
+
+        # Running operations show up here
+        self.jobs_layout = QVBoxLayout()
+        self.layout.addLayout(self.jobs_layout)
+
+    def show_error_dialog(self, title, message):
+        """
+        Utility method to show an error dialog with options to open the log file.
+
+        Parameters:
+            title (str): The title of the error dialog.
+            message (str): The main error message.
+        """
+        # Log the detailed error with traceback
+        logging.error(message)
+
+        # Get absolute path to error.log
+        log_file_path = os.path.join(SCRIPT_DIR, 'error.log')
+
+        # Create a critical message box
+        msg_box = QMessageBox(self)
+        msg_box.setIcon(QMessageBox.Critical)
+        msg_box.setWindowTitle(title)
+        msg_box.setText(message)
+        msg_box.setInformativeText(f"Please check the error log here:\n{log_file_path}")
+
+        # Add buttons
+        open_log_btn = msg_box.addButton('Open Log', QMessageBox.AcceptRole)
+        close_btn = msg_box.addButton('Close', QMessageBox.RejectRole)
+
+        # Execute the message box
+        msg_box.exec_()
+
+        # Handle button clicks
+        if msg_box.clickedButton() == open_log_btn:
+            try:
+                if sys.platform.startswith('darwin'):
+                    os.system(f'open "{log_file_path}"')
+                elif os.name == 'nt':
+                    os.startfile(log_file_path)
+                elif os.name == 'posix':
+                    os.system(f'xdg-open "{log_file_path}"')
+            except Exception as open_e:
+                logging.error("Failed to open error log.", exc_info=True)
+                QMessageBox.critical(
+                    self,
+                    'Log Open Error',
+                    f'Failed to open the error log file:\n{str(open_e)}'
+                )
+
+    def show_success_dialog(self, title, message, details=None):
+        """
+        Utility method to show a success dialog with optional details.
+
+        Parameters:
+            title (str): The title of the success dialog.
+            message (str): The main success message.
+            details (str, optional): Additional details to display.
+        """
+        # Create an information message box
+        msg_box = QMessageBox(self)
+        msg_box.setIcon(QMessageBox.Information)
+        msg_box.setWindowTitle(title)
+        msg_box.setText(message)
+
+        if details:
+            msg_box.setDetailedText(details)
+
+        msg_box.addButton('OK', QMessageBox.AcceptRole)
+        msg_box.exec_()
+
+    def start_job(self, title, fn, args, on_finished, error_title, error_message, version=None, on_ended=None):
+        """
+        Run an operation on the thread pool and show its progress.
+
+        Parameters:
+            title (str): The label of the job.
+            fn (callable): The operation; it receives progress and cancel_event keyword arguments.
+            args (tuple): The positional arguments of the operation.
+            on_finished (callable): Called on the GUI thread with the result.
+            error_title (str): The title of the error dialog if the operation fails.
+            error_message (str): The start of the error message if the operation fails.
+            version (str, optional): The version the job works on, hidden from other jobs meanwhile.
+            on_ended (callable, optional): Called on the GUI thread when the job ends, however it ends.
+        """
+        worker = OperationWorker(fn, *args)
+        job_widget = JobWidget(title, worker.cancel_event.set, self)
+        self.jobs_layout.addWidget(job_widget)
+        self.jobs[worker] = job_widget
+        if version:
+            self.busy_versions.add(version)
+
+        def finish_job():
+            self.jobs.pop(worker, None)
+            self.busy_versions.discard(version)
+            job_widget.deleteLater()
+            if on_ended is not None:
+                on_ended()
+
+        def on_success(result):
+            finish_job()
+            on_finished(result)
+
+        def on_failure(error):
+            finish_job()
+            self.show_error_dialog(title=error_title, message=f'{error_message}:\n{error}')
+
+        worker.signals.progress.connect(job_widget.update_progress)
+        worker.signals.finished.connect(on_success)
+        worker.signals.failed.connect(on_failure)
+        worker.signals.cancelled.connect(finish_job)
+        self.thread_pool.start(worker)
+
+    def save_version(self):
+        """
+        Function to save a new version of the project.
+        """
+        self.start_job(
+            'Saving a new version', save_version, (), self.on_version_saved,
+            'Save Error', 'An error occurred while saving the version'
+        )
+
+    def on_version_saved(self, version_info):
+        success_message = 'New version saved successfully.'
+        details = (
+            f"Version: {version_info['version']}\n"
+            f"Date: {version_info['datetime']}\n"
+            f"Version Folder: {version_info['version_folder']}\n"
+            f"Backup ZIP: {version_info['zip_file']}\n"
+            f"Files: {version_info['file_count']} ({version_info['changed_count']} changed)\n"
+            f"Failed: {version_info['failed_count']} (could not be read, see the error log)\n"
+            f"Concat files: {', '.join(version_info['concat_files'])}\n"
+            f"Left out of the concat files: {len(version_info['concat_skipped'])} (binary or too large)\n"
+            f"Based on: {version_info['parent'] or 'nothing (full backup)'}\n"
+            f"{format_metrics(version_info['metrics'])}"
+        )
+        self.show_success_dialog('Success', success_message, details)
+
+    def select_version(self, action_name, states=None):
+        """
+        Ask the user to pick one of the versions no running job is using.
+
+        Parameters:
+            action_name (str): The action, as shown in the dialog title.
+            states (tuple, optional): Only offer the versions in these
+                catalog states, such as ('saved',).
+
+        Returns:
+            str: The selected version, or None.
+        """
+        version_count = count_versions(states=states)
+        if not version_count:
+            QMessageBox.warning(self, 'No Versions', f'No versions available for {action_name.lower()}.')
+            return None
+
+        def load_page(offset, limit):
+            records = list_versions(offset=offset, limit=limit, newest_first=True, details=True, states=states)
+            return [record for record in records if record['name'] not in self.busy_versions]
+
+        dialog = VersionSelectionDialog(load_page, version_count, action_name, self)
+        return dialog.get_selected_version()
+
+    def restore_version(self):
+        """
+        Function to restore a previously saved version.
+
+        A dry run first finds the files that differ from the version, and the
+        user confirms before they are overwritten.
+        """
+        try:
+            selected_version = self.select_version("Restore")
+            if selected_version:
+                def on_restored(result):
+                    success_message = f'Version {selected_version} restored successfully.'
+                    details = (
+                        f"Version: {selected_version}\n"
+                        f"Restored to: {result['project_dir']}\n"
+                        f"Files written: {result['file_count']} ({result['bytes']} bytes, "
+                        f"{result['throughput'] / 1048576:.1f} MB/s)\n"
+                        f"Already up to date: {result['unchanged_count']}\n"
+                        f"Failed: {result['failed_count']}\n"
+                        f"{format_metrics(result['metrics'])}"
+                    )
+                    self.show_success_dialog('Success', success_message, details)
+
+                def on_planned(plan):
+                    if not plan['file_count']:
+                        self.show_success_dialog(
+                            'Nothing to Restore',
+                            f'The project already matches version {selected_version}.'
+                        )
+                        return
+                    answer = QMessageBox.question(
+                        self, 'Restore Version',
+                        f"Restoring {selected_version} will write {plan['file_count']} files "
+                        f"({plan['bytes']} bytes) in {plan['project_dir']}.\n"
+                        f"{plan['unchanged_count']} files are already up to date.\n\nContinue?"
+                    )
+                    if answer == QMessageBox.Yes:
+                        self.start_job(
+                            f'Restoring {selected_version}', restore_version, (selected_version,), on_restored,
+                            'Restore Error', 'An error occurred while restoring the version', selected_version
+                        )
+
+                self.start_job(
+                    f'Checking {selected_version}', partial(restore_version, dry_run=True), (selected_version,),
+                    on_planned, 'Restore Error', 'An error occurred while restoring the version', selected_version
+                )
+        except Exception as e:
+            self.show_error_dialog(
+                title='Restore Error',
+                message=f'An error occurred while restoring the version:\n{str(e)}'
+            )
+
+    def archive_version(self):
+        """
+        Function to archive a saved version.
+        """
+        try:
+            # A packed version has no folder left to archive
+            selected_version = self.select_version("Archive", ('saved',))
+            if selected_version:
+                def on_archived(archive_info):
+                    success_message = f'Version {selected_version} archived successfully.'
+                    details = (
+                        f"Version: {selected_version}\nArchived to 'Archived_Versions' folder.\n"
+                        f"{format_metrics(archive_info['metrics'])}"
+                    )
+                    self.show_success_dialog('Success', success_message, details)
+
+                self.start_job(
+                    f'Archiving {selected_version}', archive_version, (selected_version,), on_archived,
+                    'Archive Error', 'An error occurred while archiving the version', selected_version
+                )
+        except Exception as e:
+            self.show_error_dialog(
+                title='Archive Error',
+                message=f'An error occurred while archiving the version:\n{str(e)}'
+            )
+
+    def extract_version(self):
+        """
+        Function to extract a version from a ZIP file.
+        """
+        try:
+            zip_file, _ = QFileDialog.getOpenFileName(self, 'Choose a ZIP file', '', 'ZIP Files (*.zip)')
+            if zip_file:
+                patterns, accepted = QInputDialog.getText(
+                    self, 'Files to Extract',
+                    'Glob patterns of the files to extract, separated by spaces\n'
+                    '(for example src/*.py docs/), or leave empty to extract everything:'
+                )
+                if not accepted:
+                    return
+
+                def on_extracted(extract_info):
+                    success_message = 'Files extracted successfully.'
+                    details = (
+                        f"ZIP File: {zip_file}\n"
+                        f"Extracted to: {extract_info['extract_folder']}\n"
+                        f"Files: {extract_info['file_count']} ({extract_info['bytes']} bytes)\n"
+                        f"{format_metrics(extract_info['metrics'])}"
+                    )
+                    self.show_success_dialog('Success', success_message, details)
+
+                self.start_job(
+                    f'Extracting {os.path.basename(zip_file)}',
+                    partial(extract_version, patterns=patterns.split() or None), (zip_file,), on_extracted,
+                    'Extract Error', 'An error occurred while extracting the version from ZIP'
+                )
+        except Exception as e:
+            self.show_error_dialog(
+                title='Extract Error',
+                message=f'An error occurred while extracting the version from ZIP:\n{str(e)}'
+            )
+
+    def compare_versions(self):
+        """
+        Function to show what changed between two saved versions.
+        """
+        try:
+            old_version = self.select_version("Compare")
+            if not old_version:
+                return
+            new_version = self.select_version("Compare with")
+            if not new_version:
+                return
+
+            def on_compared(diff_info):
+                success_message = (
+                    f"{len(diff_info['added'])} added, {len(diff_info['removed'])} removed, "
+                    f"{len(diff_info['modified'])} modified, {diff_info['unchanged_count']} unchanged."
+                )
+                details = (
+                    f"From: {old_version}\nTo: {new_version}\n\n"
+                    + ''.join(f"A {path}\n" for path in diff_info['added'])
+                    + ''.join(f"D {path}\n" for path in diff_info['removed'])
+                    + ''.join(f"M {path}\n" for path in diff_info['modified'])
+                    + "\n" + diff_info['diff']
+                )
+                self.show_success_dialog('Version Comparison', success_message, details)
+
+            self.start_job(
+                f'Comparing {old_version} and {new_version}', run_version_diff, (old_version, new_version),
+                on_compared, 'Compare Error', 'An error occurred while comparing the versions'
+            )
+        except Exception as e:
+            self.show_error_dialog(
+                title='Compare Error',
+                message=f'An error occurred while comparing the versions:\n{str(e)}'
+            )
+
+    def compact_versions(self):
+        """
+        Function to pack the versions the retention policy does not keep.
+
+        A dry run first lists the versions to pack, and the user confirms
+        before their folders are replaced by a pack.
+        """
+        def on_compacted(result):
+            success_message = f"{len(result['packed'])} versions packed successfully."
+            details = (
+                f"Pack: {result['pack_file']}\n"
+                f"New contents stored: {result['objects']} ({result['bytes']} bytes)\n"
+                f"Objects removed: {result['removed']}\n"
+                f"Space freed: {result['freed_bytes']} bytes\n"
+                f"Versions kept as they are: {result['kept_count']}\n"
+                f"{format_metrics(result['metrics'])}"
+            )
+            self.show_success_dialog('Success', success_message, details)
+
+        def on_planned(plan):
+            if not plan['packed']:
+                self.show_success_dialog(
+                    'Nothing to Compact', f"The retention policy keeps all {plan['kept_count']} versions."
+                )
+                return
+            answer = QMessageBox.question(
+                self, 'Compact Old Versions',
+                f"{len(plan['packed'])} versions will be packed, from {plan['packed'][0]} "
+                f"to {plan['packed'][-1]}.\n{plan['kept_count']} versions are kept as they are.\n\nContinue?"
+            )
+            if answer == QMessageBox.Yes:
+                self.start_job(
+                    'Compacting old versions', compact_versions, (), on_compacted,
+                    'Compact Error', 'An error occurred while compacting the versions'
+                )
+
+        self.start_job(
+            'Checking the retention policy', partial(compact_versions, dry_run=True), (), on_planned,
+            'Compact Error', 'An error occurred while compacting the versions'
+        )
+
+    def verify_version(self):
+        """
+        Function to read back every stored copy of a version and check it.
+        """
+        try:
+            selected_version = self.select_version("Verify")
+            if selected_version:
+                def on_verified(result):
+                    details = (
+                        f"Files: {result['file_count']}\n"
+                        f"Copies read: {result['copies']} ({result['bytes']} bytes)\n"
+                        f"{format_metrics(result['metrics'])}"
+                    )
+                    if not result['failures']:
+                        self.show_success_dialog('Success', f'Version {selected_version} is intact.', details)
+                        return
+                    damaged = "\n".join(
+                        f"{failure['kind']} copy of {failure['path']} in {failure['location']}: {failure['error']}"
+                        for failure in result['failures'][:20]  # The log lists them all
+                    )
+                    self.show_error_dialog(
+                        title='Verify Error',
+                        message=f"Version {selected_version} has {len(result['failures'])} damaged copies:\n{damaged}"
+                    )
+
+                self.start_job(
+                    f'Verifying {selected_version}', verify_version, (selected_version,), on_verified,
+                    'Verify Error', 'An error occurred while verifying the version', selected_version
+                )
+        except Exception as e:
+            self.show_error_dialog(
+                title='Verify Error',
+                message=f'An error occurred while verifying the version:\n{str(e)}'
+            )
+
+    def search_versions(self):
+        """
+        Function to find the lines containing a text in every saved version.
+        """
+        query, accepted = QInputDialog.getText(self, 'Search Versions', 'Text to find in every version:')
+        if not accepted or not query:
+            return
+
+        def on_searched(matches):
+            if not matches:
+                self.show_success_dialog('Search', f'No version contains "{query}".')
+                return
+            success_message = f'"{query}" was found in {len(matches)} files.'
+            details = "\n".join(
+                f"{match['path']} in {match['versions'][0]}"
+                + (f" and {len(match['versions']) - 1} older versions" if len(match['versions']) > 1 else "")
+                + "".join(f"\n  {number}: {text}" for number, text in match['lines'])
+                for match in matches
+            )
+            self.show_success_dialog('Search', success_message, details)
+
+        self.start_job(
+            f'Searching for "{query}"', partial(search_versions, limit=SEARCH_RESULT_LIMIT), (query,), on_searched,
+            'Search Error', 'An error occurred while searching the versions'
+        )
+
+    def watch_project(self):
+        """
+        Function to save versions automatically while the project changes,
+        until the job is cancelled.
+        """
+        def on_stopped(watch_info):
+            success_message = 'Stopped watching the project.'
+            details = f"Versions saved automatically: {watch_info['saves']}\n" + "\n".join(watch_info['versions'])
+            self.show_success_dialog('Watch Stopped', success_message, details)
+
+        self.watch_btn.setEnabled(False)
+        self.start_job(
+            'Watching the project (cancel to stop)', watch_project, (), on_stopped,
+            'Watch Error', 'An error occurred while watching the project',
+            on_ended=lambda: self.watch_btn.setEnabled(True)
+        )
+
+    def clean_up_storage(self):
+        """
+        Function to delete stored objects no version uses any more.
+        """
+        def on_cleaned(gc_info):
+            success_message = 'Storage cleaned up successfully.'
+            details = (
+                f"Objects removed: {gc_info['removed']}\n"
+                f"Space freed: {gc_info['freed_bytes']} bytes"
+            )
+            self.show_success_dialog('Success', success_message, details)
+
+        self.start_job(
+            'Cleaning up storage', run_garbage_collection, (), on_cleaned,
+            'Clean Up Error', 'An error occurred while cleaning up the storage'
+        )
+
+
+def main():
+    """
+    Launch the GUI.
+
+    Returns:
+        int: The exit code of the Qt event loop.
+    """
+    app = QApplication(sys.argv)
+    window = VersionManagerApp()
+    window.show()
+    return app.exec_()
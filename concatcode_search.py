@@ -0,0 +1,409 @@
+"""
+Search index of the Project Version Manager: finds text across every saved
+version without extracting their backups.
+
+The index is a SQLite database next to the catalog (search_index.sqlite).
+Each distinct file content, identified by its hash in the manifests, is
+stored once: its text compressed, and the trigrams of its lowercased text
+in an inverted index. Each version then only adds a row per file, pointing
+to its content, so indexing a new version only reads and indexes the files
+whose hash changed. A query looks up the contents that have all of its
+trigrams, checks them line by line, and lists the versions holding them.
+
+Versions are indexed from their concat snapshot, or from their stored
+files once packed or archived, either as they are saved (search_index
+setting) or by the first search that finds them missing.
+"""
+import os
+import io
+import codecs
+import sqlite3
+import logging
+import zlib
+
+from contextlib import contextmanager
+
+import concatcode_core as core
+
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    number INTEGER NOT NULL,
+    datetime TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contents (
+    id INTEGER PRIMARY KEY,
+    hash TEXT UNIQUE NOT NULL,
+    text BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trigrams (
+    trigram INTEGER NOT NULL,
+    content_id INTEGER NOT NULL,
+    PRIMARY KEY (trigram, content_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    version_id INTEGER NOT NULL,
+    path_id INTEGER NOT NULL,
+    content_id INTEGER NOT NULL,
+    PRIMARY KEY (version_id, path_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_by_content ON files (content_id);
+"""
+
+# Texts are stored compressed, at a level that keeps indexing fast
+TEXT_COMPRESSLEVEL = 6
+
+# SQLite limits the number of parameters of a statement
+QUERY_BATCH_SIZE = 500
+
+
+@contextmanager
+def open_search_index(script_dir):
+    """
+    Open the search index of a store, creating it when it does not exist.
+
+    Parameters:
+        script_dir (str): The directory holding the versions.
+
+    Yields:
+        sqlite3.Connection: The index; the with block runs as a single transaction.
+    """
+    connection = sqlite3.connect(os.path.join(script_dir, core.SEARCH_INDEX_NAME), timeout=30)
+    try:
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SEARCH_SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def decode_text(data):
+    """
+    Decode a file like the concat snapshot does: undecodable bytes dropped,
+    newlines translated.
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(errors='ignore'), translate=True)
+    return decoder.decode(data, final=True)
+
+
+def text_trigrams(text):
+    """
+    Return the trigrams of a text, as integers: every run of three bytes of
+    its lowercased UTF-8 encoding.
+    """
+    data = text.lower().encode('utf-8')
+    return {int.from_bytes(gram, 'big') for gram in {data[i:i + 3] for i in range(len(data) - 2)}}
+
+
+def find_lines(text, query, ignore_case=False):
+    """
+    Find the lines of a text that contain a query.
+
+    Parameters:
+        text (str): The text.
+        query (str): The text to find.
+        ignore_case (bool): Match regardless of case.
+
+    Returns:
+        list: [line number, line] pairs, the lines numbered from 1.
+    """
+    if ignore_case:
+        query = query.lower()
+    if query not in (text.lower() if ignore_case else text):
+        return []
+    return [
+        [number, line] for number, line in enumerate(text.split('\n'), 1)
+        if query in (line.lower() if ignore_case else line)
+    ]
+
+
+def _index_contents(connection, texts, metrics):
+    """
+    Store the contents not indexed yet, with their trigrams.
+
+    Parameters:
+        connection (sqlite3.Connection): The index.
+        texts (iterable): (hash, text) pairs.
+        metrics (OperationMetrics): Gets the counts and time spent.
+
+    Returns:
+        dict: Content ids by hash.
+    """
+    content_ids = {}
+    for content_hash, text in texts:
+        with metrics.phase('trigrams'):
+            grams = text_trigrams(text)
+            compressed = zlib.compress(text.encode('utf-8'), TEXT_COMPRESSLEVEL)
+        with metrics.phase('write'):
+            content_id = connection.execute(
+                "INSERT INTO contents (hash, text) VALUES (?, ?)", (content_hash, compressed)
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO trigrams (trigram, content_id) VALUES (?, ?)", ((gram, content_id) for gram in grams)
+            )
+        content_ids[content_hash] = content_id
+        metrics.count('contents')
+        metrics.count('bytes', len(text))
+        metrics.count('trigrams', len(grams))
+    return content_ids
+
+
+def _version_texts(script_dir, version, entries, reader):
+    """
+    Yield the (hash, text) of the given manifest entries of a version: from
+    its concat snapshot while its folder exists, otherwise from its stored
+    files.
+    """
+    concat = None
+    if os.path.isdir(os.path.join(script_dir, version)):
+        try:
+            concat = core.open_concat(version, script_dir)
+        except (OSError, ValueError):
+            logging.warning(f"No readable concat snapshot for {version}, reading its stored files.")
+    try:
+        if concat is not None:
+            # Compressed parts are read from start to end
+            entries = sorted(
+                entries, key=lambda entry: (
+                    concat.index[entry['path']].get('file', '') if entry['path'] in concat else '',
+                    concat.index[entry['path']]['offset'] if entry['path'] in concat else 0
+                )
+            )
+        for entry in entries:
+            if concat is not None and entry['path'] in concat:
+                text = concat.read_text(entry['path'])
+            else:
+                text = decode_text(reader.read(entry))
+            yield entry['hash'], text
+    finally:
+        if concat is not None:
+            concat.close()
+
+
+def update_search_index(script_dir=None, versions=None, progress=None, cancel_event=None):
+    """
+    Function to bring the search index up to date with the saved versions.
+
+    The versions not indexed yet are added, reading only the files whose
+    content is not in the index; the versions that no longer exist are
+    removed, with the contents no other version has.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        versions (list, optional): Only index these versions, and remove
+            none. None indexes every saved, packed and archived version.
+        progress (callable, optional): Receives progress reports.
+        cancel_event (threading.Event, optional): Set to cancel the update;
+            the versions indexed so far stay indexed.
+
+    Returns:
+        dict: The versions indexed, the number of contents and bytes of
+        text added, the number of versions removed and the metrics of the
+        update (None if there was nothing to do).
+    """
+    metrics = core.OperationMetrics('index')
+    tracker = core.ProgressTracker(progress, cancel_event, metrics)
+    try:
+        script_dir, _ = core.resolve_dirs(script_dir)
+        saved = core.list_versions(script_dir, archived=True) if versions is None else list(versions)
+        with open_search_index(script_dir) as index:
+            indexed = {row['name'] for row in index.execute("SELECT name FROM versions")}
+            removed = []
+            if versions is None:
+                removed = sorted(indexed - set(saved))
+                if removed:
+                    with metrics.phase('write'):
+                        _remove_versions(index, removed)
+        missing = [name for name in saved if name not in indexed]
+
+        tracker.set_totals(len(missing), 0)
+        with core.STORE_LOCK.shared(script_dir), core.VersionFileReader(script_dir) as reader:
+            for name in missing:
+                tracker.check_cancelled()
+                # Each version is committed on its own, so a cancelled update keeps them
+                with open_search_index(script_dir) as index:
+                    _index_version(index, script_dir, name, reader, metrics)
+                metrics.count('versions')
+                tracker.advance(files=1)
+        tracker.report(force=True)
+
+        record = None
+        if missing or removed:
+            metrics.count('versions_removed', len(removed))
+            record = metrics.record()
+            core.write_metrics(script_dir, record)
+        return {
+            'indexed': missing,
+            'contents': metrics.counters.get('contents', 0),
+            'bytes': metrics.counters.get('bytes', 0),
+            'removed': len(removed),
+            'metrics': record
+        }
+    except BaseException as e:
+        if not isinstance(e, core.OperationCancelled):
+            logging.error("Failed to update the search index.", exc_info=True)
+        raise e  # Re-raise to be caught by the caller
+
+
+def _index_version(index, script_dir, name, reader, metrics):
+    """
+    Add one version to the index: a row per file of its concat snapshot,
+    and the contents the index does not have yet.
+    """
+    parsed = core.parse_version_name(name)
+    if parsed is None:
+        return
+    with metrics.phase('read'):
+        try:
+            manifest = core.load_version_manifest(script_dir, name)
+        except FileNotFoundError:
+            # Versions saved before manifests existed are recorded without files
+            manifest = {'files': []}
+    # Only the text files, the ones the concat snapshot holds, are indexed
+    entries = [entry for entry in manifest['files'] if 'concat' in entry]
+
+    content_ids = {}
+    hashes = sorted({entry['hash'] for entry in entries})
+    for start in range(0, len(hashes), QUERY_BATCH_SIZE):
+        batch = hashes[start:start + QUERY_BATCH_SIZE]
+        content_ids.update(
+            (row['hash'], row['id']) for row in index.execute(
+                f"SELECT hash, id FROM contents WHERE hash IN ({', '.join('?' * len(batch))})", batch
+            )
+        )
+    new_entries = list({
+        entry['hash']: entry for entry in entries if entry['hash'] not in content_ids
+    }.values())
+
+    def read_texts():
+        texts = _version_texts(script_dir, name, new_entries, reader)
+        while True:
+            with metrics.phase('read'):
+                item = next(texts, None)
+            if item is None:
+                return
+            yield item
+
+    content_ids.update(_index_contents(index, read_texts(), metrics))
+
+    with metrics.phase('write'):
+        version_id = index.execute(
+            "INSERT INTO versions (name, number, datetime) VALUES (?, ?, ?)", (name,) + parsed
+        ).lastrowid
+        for entry in entries:
+            index.execute("INSERT OR IGNORE INTO paths (path) VALUES (?)", (entry['path'],))
+        path_ids = {}
+        paths = [entry['path'] for entry in entries]
+        for start in range(0, len(paths), QUERY_BATCH_SIZE):
+            batch = paths[start:start + QUERY_BATCH_SIZE]
+            path_ids.update(
+                (row['path'], row['id']) for row in index.execute(
+                    f"SELECT path, id FROM paths WHERE path IN ({', '.join('?' * len(batch))})", batch
+                )
+            )
+        index.executemany(
+            "INSERT INTO files (version_id, path_id, content_id) VALUES (?, ?, ?)",
+            ((version_id, path_ids[entry['path']], content_ids[entry['hash']]) for entry in entries)
+        )
+    metrics.count('files', len(entries))
+
+
+def _remove_versions(index, names):
+    """
+    Remove versions from the index, and the contents no other version has.
+    """
+    for name in names:
+        index.execute(
+            "DELETE FROM files WHERE version_id = (SELECT id FROM versions WHERE name = ?)", (name,)
+        )
+        index.execute("DELETE FROM versions WHERE name = ?", (name,))
+    orphans = [row['id'] for row in index.execute(
+        "SELECT id FROM contents WHERE id NOT IN (SELECT content_id FROM files)"
+    )]
+    for start in range(0, len(orphans), QUERY_BATCH_SIZE):
+        batch = orphans[start:start + QUERY_BATCH_SIZE]
+        placeholders = ', '.join('?' * len(batch))
+        index.execute(f"DELETE FROM trigrams WHERE content_id IN ({placeholders})", batch)
+        index.execute(f"DELETE FROM contents WHERE id IN ({placeholders})", batch)
+
+
+def search_versions(query, script_dir=None, ignore_case=False, patterns=None, limit=None, progress=None,
+                    cancel_event=None):
+    """
+    Function to find the lines containing a text in every saved version.
+
+    The index is first brought up to date (see update_search_index); the
+    backups are never read by the search itself.
+
+    Parameters:
+        query (str): The text to find.
+        script_dir (str, optional): The directory holding the versions.
+        ignore_case (bool): Match regardless of case.
+        patterns (list, optional): Glob patterns restricting the paths searched.
+        limit (int, optional): The maximum number of matches to return.
+        progress (callable, optional): Receives progress reports while the
+            index is updated.
+        cancel_event (threading.Event, optional): Set to cancel the update.
+
+    Returns:
+        list: The matches, one per file content found at a path, holding in
+        the most recent first: its 'path', the 'versions' that have it there
+        (newest first) and its matching 'lines' as [line number, text]
+        pairs. Matches are sorted by their most recent version, newest first.
+    """
+    if not query:
+        raise ValueError("The search query is empty")
+    script_dir, _ = core.resolve_dirs(script_dir)
+    update_search_index(script_dir, progress=progress, cancel_event=cancel_event)
+
+    grams = sorted(text_trigrams(query))
+    with open_search_index(script_dir) as index:
+        if grams:
+            candidates = [row['content_id'] for row in index.execute(
+                f"SELECT content_id FROM trigrams WHERE trigram IN ({', '.join('?' * len(grams))}) "
+                "GROUP BY content_id HAVING COUNT(*) = ?", grams + [len(grams)]
+            )]
+        else:
+            # Shorter than a trigram: every content is a candidate
+            candidates = [row['id'] for row in index.execute("SELECT id FROM contents")]
+
+        # Candidates can have the trigrams without the text: their lines are checked
+        found = {}
+        for start in range(0, len(candidates), QUERY_BATCH_SIZE):
+            batch = candidates[start:start + QUERY_BATCH_SIZE]
+            for row in index.execute(
+                    f"SELECT id, text FROM contents WHERE id IN ({', '.join('?' * len(batch))})", batch):
+                text = zlib.decompress(row['text']).decode('utf-8')
+                lines = find_lines(text, query, ignore_case)
+                if lines:
+                    found[row['id']] = lines
+
+        index.execute("CREATE TEMP TABLE IF NOT EXISTS found (content_id INTEGER PRIMARY KEY)")
+        index.execute("DELETE FROM found")
+        index.executemany("INSERT INTO found VALUES (?)", ((content_id,) for content_id in found))
+        rows = index.execute(
+            "SELECT versions.name, paths.path, files.content_id FROM found "
+            "JOIN files ON files.content_id = found.content_id "
+            "JOIN versions ON versions.id = files.version_id "
+            "JOIN paths ON paths.id = files.path_id "
+            "ORDER BY versions.number DESC, versions.datetime DESC, paths.path"
+        ).fetchall()
+
+    matches = {}
+    for row in rows:
+        if patterns and not core.path_matches(row['path'], patterns):
+            continue
+        key = (row['path'], row['content_id'])
+        match = matches.get(key)
+        if match is None:
+            if limit is not None and len(matches) >= limit:
+                continue
+            match = matches[key] = {'path': row['path'], 'versions': [], 'lines': found[row['content_id']]}
+        match['versions'].append(row['name'])
+    return list(matches.values())
@@ -0,0 +1,376 @@
+"""
+Watch mode of the Project Version Manager: saves versions automatically
+while the project changes.
+
+Changes are detected with inotify on Linux, and by polling the tree
+elsewhere or when inotify is unavailable. Bursts of changes are coalesced:
+a save starts once the project has been quiet for the debounce delay, and
+never sooner than the minimum interval after the previous one, so a
+`git checkout` produces one version rather than hundreds. Each save only
+processes the paths reported as changed, instead of walking the tree.
+"""
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+import time
+
+try:
+    import ctypes  # inotify, on Linux
+except ImportError:
+    ctypes = None
+
+import concatcode_core as core
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+# Longest a watcher blocks while nothing is pending, so a stop request is
+# noticed without waking up more than once a second when idle
+IDLE_TIMEOUT = 1.0
+
+# Files whose change alters which files are saved
+IGNORE_FILES = (core.GITIGNORE_NAME, core.IGNORE_FILE_NAME)
+
+
+def load_libc():
+    """
+    Return the C library with the inotify functions, or None where inotify
+    is not available.
+    """
+    if ctypes is None or not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """
+    Reports the paths changed in the project from Linux inotify events.
+
+    Every folder a save would walk gets a watch, new folders included; a
+    change to an ignore file sets the watches again, as it may add or remove
+    folders. Waiting for events uses no CPU.
+    """
+
+    def __init__(self, project_dir, skip_paths=(), libc=None):
+        self.project_dir = project_dir
+        self.skip_paths = skip_paths
+        self.libc = libc or load_libc()
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {}  # Watch descriptor -> folder relative path
+        self.watches = {}  # Folder relative path -> watch descriptor
+        try:
+            self.add_tree('')
+        except BaseException:
+            self.close()
+            raise
+
+    def add_tree(self, folder):
+        """
+        Watch a folder and the subfolders a save would walk into.
+
+        Raises:
+            OSError: If a watch cannot be added, e.g. past the user's limit
+                (fs.inotify.max_user_watches).
+        """
+        matchers = {}
+        pending = [folder]
+        while pending:
+            folder = pending.pop()
+            if core.ignore_matcher_for(self.project_dir, folder, matchers) is None:
+                continue
+            path = os.path.join(self.project_dir, *folder.split('/')) if folder else self.project_dir
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # Gone already: its parent reports the deletion
+                raise OSError(error, f"Failed to watch {path}: {os.strerror(error)}")
+            self.folders[wd] = folder
+            self.watches[folder] = wd
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(f"{folder}/{entry.name}" if folder else entry.name)
+            except OSError:
+                continue
+
+    def remove_tree(self, folder):
+        """
+        Stop watching a folder moved away, and its subfolders.
+        """
+        prefix = folder + '/'
+        for path in [path for path in self.watches if path == folder or path.startswith(prefix)]:
+            wd = self.watches.pop(path)
+            self.folders.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def reset(self):
+        """
+        Watch the tree again from scratch, after the ignore rules changed.
+        """
+        for wd in list(self.folders):
+            self.libc.inotify_rm_watch(self.fd, wd)
+        self.folders = {}
+        self.watches = {}
+        self.add_tree('')
+
+    def read_changes(self, timeout):
+        """
+        Wait up to timeout seconds for changes.
+
+        Returns:
+            tuple: (set of '/'-separated paths changed, relative to the
+            project root; whether events were lost and the whole tree must
+            be considered changed).
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set(), False
+        changed = set()
+        overflow = False
+        rules_changed = False
+        while True:
+            try:
+                data = os.read(self.fd, EVENT_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0'))
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                folder = self.folders.get(wd)
+                if folder is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # The folder was deleted: its parent reported it
+                    self.folders.pop(wd, None)
+                    self.watches.pop(folder, None)
+                    continue
+                if not name:
+                    # The folder itself was deleted or moved
+                    if folder:
+                        changed.add(folder)
+                    else:
+                        overflow = True
+                    continue
+                path = f"{folder}/{name}" if folder else name
+                changed.add(path)
+                if name in IGNORE_FILES:
+                    rules_changed = True
+                if mask & IN_ISDIR:
+                    if mask & IN_MOVED_FROM:
+                        self.remove_tree(path)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_tree(path)
+        if rules_changed:
+            self.reset()
+        return changed, overflow
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """
+    Reports the paths changed in the project by comparing the size and mtime
+    of every file between two walks, every interval seconds.
+    """
+
+    def __init__(self, project_dir, skip_paths=(), interval=10.0):
+        self.project_dir = project_dir
+        self.skip_paths = skip_paths
+        self.interval = interval
+        self.files = self.snapshot()
+        self.next_poll = time.monotonic() + interval
+
+    def snapshot(self):
+        return {
+            core.manifest_path(project_file): (project_file.stat.st_size, project_file.stat.st_mtime_ns)
+            for project_file in core.walk_project(self.project_dir, self.skip_paths)
+        }
+
+    def read_changes(self, timeout):
+        """
+        Wait up to timeout seconds for changes; see InotifyWatcher.read_changes.
+        """
+        wait = self.next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set(), False
+        time.sleep(max(wait, 0))
+        files = self.snapshot()
+        self.next_poll = time.monotonic() + self.interval
+        changed = {path for path in files.keys() | self.files.keys() if files.get(path) != self.files.get(path)}
+        self.files = files
+        return changed, False
+
+    def close(self):
+        pass
+
+
+def open_watcher(project_dir, skip_paths, poll_interval, use_inotify=True):
+    """
+    Return an InotifyWatcher where possible, else a PollingWatcher.
+    """
+    if use_inotify:
+        try:
+            return InotifyWatcher(project_dir, skip_paths)
+        except OSError:
+            logging.error("Failed to watch the project with inotify, polling it instead.", exc_info=True)
+    return PollingWatcher(project_dir, skip_paths, poll_interval)
+
+
+def relevant_changes(project_dir, paths, skip_paths):
+    """
+    Keep the changed paths a save could be affected by: not in an excluded
+    or ignored folder, not ignored themselves and not one of the tool's files.
+    """
+    skip_paths = {os.path.normcase(os.path.abspath(path)) for path in skip_paths}
+    matchers = {}
+    relevant = set()
+    for path in paths:
+        parent, _, name = path.rpartition('/')
+        matcher = core.ignore_matcher_for(project_dir, parent, matchers)
+        if matcher is None or core.is_excluded_dir(name):
+            continue
+        full_path = os.path.join(project_dir, *path.split('/'))
+        if os.path.normcase(os.path.abspath(full_path)) in skip_paths:
+            continue
+        rule = matcher.match(path, os.path.isdir(full_path))
+        if rule is not None and not rule.negated:
+            continue
+        relevant.add(path)
+    return relevant
+
+
+def watch_project(script_dir=None, project_dir=None, progress=None, cancel_event=None, on_save=None,
+                  use_inotify=True):
+    """
+    Function to save versions automatically whenever the project changes,
+    until cancel_event is set.
+
+    The first save walks the whole project, as changes made before the watch
+    started are unknown; the next ones only process the changed paths. A
+    save failing is logged and the watch goes on.
+
+    Parameters:
+        script_dir (str, optional): The directory holding the versions.
+        project_dir (str, optional): The root of the project.
+        progress (callable, optional): Receives the progress reports of each save.
+        cancel_event (threading.Event, optional): Set to stop watching; a
+            save in progress is cancelled.
+        on_save (callable, optional): Called with the result of each save.
+        use_inotify (bool): Use inotify where available, rather than polling.
+
+    Returns:
+        dict: The 'saves' made and the names of the 'versions' saved.
+    """
+    script_dir, project_dir = core.resolve_dirs(script_dir, project_dir)
+    settings = core.load_settings(script_dir)
+    debounce = settings['watch_debounce']
+    min_interval = settings['watch_min_interval']
+    # The longest a steady stream of changes can postpone a save
+    max_delay = max(min_interval, debounce * 10)
+    cancel_event = cancel_event or threading.Event()
+    skip_paths = core.TOOL_FILES + core.store_files(script_dir)
+
+    watcher = open_watcher(project_dir, skip_paths, settings['watch_poll_interval'], use_inotify)
+    versions = []
+    pending = set()
+    dirty = False  # A save is due once the changes settle
+    full_walk = True
+    first_change = last_change = last_save = None
+    try:
+        while not cancel_event.is_set():
+            timeout = IDLE_TIMEOUT
+            if dirty:
+                due = min(last_change + debounce, first_change + max_delay)
+                if last_save is not None:
+                    due = max(due, last_save + min_interval)
+                now = time.monotonic()
+                if due <= now:
+                    try:
+                        result = core.save_version(
+                            script_dir, project_dir, progress, cancel_event, None if full_walk else pending
+                        )
+                    except core.OperationCancelled:
+                        break
+                    except Exception:
+                        logging.error("Failed to save a version automatically.", exc_info=True)
+                        # The changes it missed are only caught by a full walk
+                        full_walk = True
+                    else:
+                        versions.append(os.path.basename(result['version_folder']))
+                        full_walk = False
+                        if on_save is not None:
+                            on_save(result)
+                    pending = set()
+                    dirty = False
+                    last_save = time.monotonic()
+                    continue
+                timeout = min(due - now, IDLE_TIMEOUT)
+
+            try:
+                changed, overflow = watcher.read_changes(timeout)
+            except OSError:
+                # Typically out of inotify watches: poll from now on
+                logging.error("Failed to watch the project, polling it instead.", exc_info=True)
+                watcher.close()
+                watcher = PollingWatcher(project_dir, skip_paths, settings['watch_poll_interval'])
+                changed, overflow = set(), True
+            if overflow:
+                # Events were lost: the next save walks the whole tree
+                full_walk = True
+            changed = relevant_changes(project_dir, changed, skip_paths)
+            if changed or overflow:
+                now = time.monotonic()
+                if not dirty:
+                    first_change = now
+                last_change = now
+                pending |= changed
+                dirty = True
+    finally:
+        watcher.close()
+    return {'saves': len(versions), 'versions': versions}
@@ -0,0 +1,105 @@
+"""
+Shared fixtures of the tests: a small project and an empty store beside it.
+"""
+import os
+import sys
+import random
+
+import pytest
+
+# The modules of the tool sit at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import concatcode_core as core
+
+
+def write_file(root, path, data):
+    """
+    Write a file of a project, creating its folders.
+
+    Parameters:
+        root (str): The root of the project.
+        path (str): The '/'-separated path of the file, relative to the root.
+        data (bytes or str): The content.
+    """
+    file_path = os.path.join(root, *path.split('/'))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with open(file_path, 'wb') as outfile:
+        outfile.write(data)
+    return file_path
+
+
+def read_tree(root, skip=()):
+    """
+    Read every file under a folder.
+
+    Returns:
+        dict: The content of each file, by '/'-separated relative path.
+    """
+    contents = {}
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [name for name in dirs if name not in skip]
+        for name in files:
+            file_path = os.path.join(folder, name)
+            with open(file_path, 'rb') as infile:
+                contents[os.path.relpath(file_path, root).replace(os.sep, '/')] = infile.read()
+    return contents
+
+
+def read_concat(concat_file):
+    with open(concat_file, 'r', encoding='utf-8') as infile:
+        return infile.read()
+
+
+def snapshot(project_dir, version_folder, parent_folder=None, previous=None, racy_after_ns=None, tracker=None):
+    """
+    Run the pipeline over a project, as a save does, into a version folder
+    of the store.
+
+    Returns:
+        dict: The 'concat_file', 'source' folder and 'zip_file' written, and
+        the manifest 'entries'.
+    """
+    source_copy_folder = os.path.join(version_folder, 'Source')
+    os.makedirs(source_copy_folder)
+    concat_file = os.path.join(version_folder, 'concat.txt')
+    zip_file = os.path.join(version_folder, 'backup.zip')
+    parent_name = os.path.basename(parent_folder) if parent_folder else None
+    sinks = [
+        core.ConcatSink(concat_file, os.path.join(parent_folder, 'concat.txt') if parent_folder else None),
+        core.ObjectStoreSink(os.path.join(os.path.dirname(version_folder), core.OBJECTS_DIR_NAME), source_copy_folder),
+        core.ZipSink(zip_file, os.path.basename(version_folder), parent_name)
+    ]
+    try:
+        entries = core.run_snapshot_pipeline(core.scan_project(project_dir), sinks, previous, racy_after_ns, tracker)
+    finally:
+        for sink in sinks:
+            sink.close()
+    return {'concat_file': concat_file, 'source': source_copy_folder, 'zip_file': zip_file, 'entries': entries}
+
+
+@pytest.fixture
+def project(tmp_path):
+    """
+    A project of source and binary files, in nested folders, with its
+    versions kept in a store folder outside of it.
+
+    Returns:
+        tuple: (store directory, project directory).
+    """
+    rng = random.Random(0)
+    project_dir = str(tmp_path / 'project')
+    script_dir = str(tmp_path / 'store')
+    os.makedirs(script_dir)
+    for number in range(30):
+        folder = ('src', 'src/util', 'web', 'assets')[number % 4]
+        if folder == 'assets':
+            write_file(project_dir, f"{folder}/image_{number}.bin", rng.randbytes(rng.randrange(100, 5000)))
+        else:
+            extension = '.js' if folder == 'web' else '.py'
+            write_file(project_dir, f"{folder}/module_{number}{extension}", f"# module {number}\n" * (number + 1))
+    write_file(project_dir, 'README.md', "# Project\n")
+    write_file(project_dir, 'empty.py', b'')
+    return script_dir, project_dir
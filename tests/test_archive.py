@@ -0,0 +1,73 @@
+"""
+Tests of archiving a version into a self-contained ZIP.
+"""
+import os
+import zipfile
+import threading
+
+import pytest
+
+import concatcode_core as core
+from conftest import read_tree
+from test_restore import version_name
+
+
+def archive_folder_files(script_dir):
+    archive_folder = os.path.join(script_dir, 'Archived_Versions')
+    return os.listdir(archive_folder) if os.path.isdir(archive_folder) else []
+
+
+def test_archive_replaces_the_version_folder(project):
+    script_dir, project_dir = project
+    saved = core.save_version(script_dir, project_dir)
+    version = version_name(saved)
+    folder = read_tree(saved['version_folder'])
+
+    result = core.archive_version(version, script_dir)
+
+    assert archive_folder_files(script_dir) == [version + '.zip']
+    assert not os.path.exists(saved['version_folder'])
+    with zipfile.ZipFile(result['archive_file']) as archive:
+        assert archive.testzip() is None
+        # The Source copy is written from the object store
+        assert {name: archive.read(name) for name in archive.namelist()} == folder
+
+
+def test_cancelled_archive_leaves_nothing(project):
+    script_dir, project_dir = project
+    saved = core.save_version(script_dir, project_dir)
+    cancel_event = threading.Event()
+
+    with pytest.raises(core.OperationCancelled):
+        core.archive_version(version_name(saved), script_dir, lambda progress: cancel_event.set(), cancel_event)
+
+    assert archive_folder_files(script_dir) == []
+    assert os.path.isdir(saved['version_folder'])
+
+
+def test_corrupt_archive_is_not_kept(project, monkeypatch):
+    script_dir, project_dir = project
+    saved = core.save_version(script_dir, project_dir)
+    monkeypatch.setattr(zipfile.ZipFile, 'testzip', lambda archive: 'Source/module_0.py')
+
+    with pytest.raises(zipfile.BadZipFile):
+        core.archive_version(version_name(saved), script_dir)
+
+    assert archive_folder_files(script_dir) == []
+    assert os.path.isdir(saved['version_folder'])
+
+
+def test_archived_backup_is_read_in_place(project, monkeypatch):
+    script_dir, project_dir = project
+    saved = core.save_version(script_dir, project_dir)
+    version = version_name(saved)
+    with zipfile.ZipFile(saved['zip_file']) as backup:
+        contents = {name: backup.read(name) for name in backup.namelist()}
+    core.archive_version(version, script_dir)
+    # The nested backup ZIP is not unpacked anywhere
+    monkeypatch.setattr(core.tempfile, 'TemporaryFile', None)
+    monkeypatch.setattr(core.tempfile, 'mkstemp', None)
+
+    with core.open_backup_zip(script_dir, version) as backup:
+        assert backup.testzip() is None
+        assert {name: backup.read(name) for name in backup.namelist()} == contents
@@ -0,0 +1,42 @@
+"""
+Tests of the benchmark harness: its synthetic scenarios and the comparison
+with a baseline.
+"""
+import concatcode_bench as bench
+
+
+def test_scenario_reports_every_operation(tmp_path, monkeypatch):
+    monkeypatch.setitem(bench.SCENARIOS, 'tiny', {'files': 20, 'depth': 2, 'large_every': 10})
+    reports = []
+
+    results = bench.run_scenario('tiny', str(tmp_path), reports.append, repeat=2)
+
+    assert list(results) == list(bench.OPERATIONS)
+    assert len(reports) == len(bench.OPERATIONS)
+    assert results['save']['files_per_s'] > 0
+    assert results['save']['mb_per_s'] > 0
+    # Each repetition works on its own copy of the same project
+    assert (tmp_path / 'tiny-1').is_dir() and (tmp_path / 'tiny-2').is_dir()
+
+
+def test_regressions_exceed_tolerance_and_floor():
+    baseline = {'flat-1k': {
+        'save': {'seconds': 2.0, 'peak_rss': 100 * 1024 * 1024},
+        'restore': {'seconds': 0.01, 'peak_rss': 10 * 1024 * 1024},
+    }}
+    results = {'flat-1k': {
+        'save': {'seconds': 3.0, 'peak_rss': 101 * 1024 * 1024},
+        # Twice as slow, but by less than the floor: noise
+        'restore': {'seconds': 0.02, 'peak_rss': 20 * 1024 * 1024},
+        'extract': {'seconds': 9.0, 'peak_rss': None},
+    }}
+
+    regressions = bench.compare_with_baseline(results, baseline)
+
+    assert regressions == [
+        "flat-1k save: seconds 3.0 s, baseline 2.0 s",
+        f"flat-1k restore: peak_rss {20 * 1024 * 1024} bytes, baseline {10 * 1024 * 1024} bytes",
+    ]
+    assert bench.compare_with_baseline(results, baseline, tolerance=0.5) == [
+        f"flat-1k restore: peak_rss {20 * 1024 * 1024} bytes, baseline {10 * 1024 * 1024} bytes",
+    ]
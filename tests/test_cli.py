@@ -0,0 +1,103 @@
+"""
+Tests of the command line interface, run as the user would: the tool copied
+into a folder of the project, versions kept beside it.
+"""
+import os
+import sys
+import json
+import glob
+import shutil
+import subprocess
+
+import pytest
+
+import concatcode_core as core
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def tool_dir(project):
+    """
+    The tool installed in its default place: a folder of the project.
+    """
+    _, project_dir = project
+    tool_dir = os.path.join(project_dir, 'ConcatCode')
+    os.makedirs(tool_dir)
+    for file_path in glob.glob(os.path.join(REPO_DIR, 'concatcode*')) + [os.path.join(REPO_DIR, 'Concatcode.py')]:
+        shutil.copy(file_path, tool_dir)
+    return tool_dir
+
+
+def run_cli(tool_dir, *args):
+    return subprocess.run(
+        [sys.executable, os.path.join(tool_dir, 'concatcode')] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, cwd=tool_dir, check=False
+    )
+
+
+def test_save_and_list_as_json(tool_dir):
+    tool_files = {'ConcatCode/' + name for name in os.listdir(tool_dir)}
+    saved = run_cli(tool_dir, '--json', '-q', 'save')
+
+    assert saved.returncode == 0, saved.stderr
+    result = json.loads(saved.stdout)['result']
+    assert result['version'] == '0.01'
+    # The tool is not saved with the project
+    paths = [entry['path'] for entry in core.load_manifest(result['version_folder'])['files']]
+    assert 'src/module_0.py' in paths
+    assert not tool_files.intersection(paths)
+
+    listed = run_cli(tool_dir, '--json', 'list')
+    assert listed.returncode == 0
+    assert os.path.basename(result['version_folder']) in json.dumps(json.loads(listed.stdout)['result'])
+
+
+def test_failed_operation_exits_with_error(tool_dir):
+    restored = run_cli(tool_dir, '--json', 'restore', 'version_9.99_2024-01-01_00-00-00')
+
+    assert restored.returncode == 1
+    assert json.loads(restored.stdout)['command'] == 'restore'
+    assert json.loads(restored.stdout)['error']
+
+    restored = run_cli(tool_dir, 'restore', 'version_9.99_2024-01-01_00-00-00')
+    assert restored.returncode == 1
+    assert restored.stderr.startswith("concatcode restore: ")
+
+
+def test_invalid_usage_exits_with_usage_code(tool_dir):
+    assert run_cli(tool_dir).returncode == 2
+    assert run_cli(tool_dir, 'restore').returncode == 2
+    assert run_cli(tool_dir, '--help').returncode == 0
+
+
+def test_library_import_does_not_load_qt(tool_dir):
+    imported = subprocess.run(
+        [sys.executable, '-c', "import sys, Concatcode, concatcode_cli; sys.exit('PyQt5' in sys.modules)"],
+        cwd=tool_dir, check=False
+    )
+    assert imported.returncode == 0
+
+
+def test_closed_output_exits_quietly(tool_dir):
+    for _ in range(3):
+        assert run_cli(tool_dir, '-q', 'save').returncode == 0
+    # The reader goes away before the listing is written
+    listed = subprocess.Popen(
+        [sys.executable, os.path.join(tool_dir, 'concatcode'), 'list'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=tool_dir
+    )
+    listed.stdout.close()
+    _, stderr = listed.communicate(timeout=60)
+
+    assert listed.returncode == 0
+    assert stderr == b''
+
+
+def test_library_names_are_exported(tool_dir):
+    imported = subprocess.run(
+        [sys.executable, '-c', "import json, Concatcode; print(json.dumps(Concatcode.__all__))"],
+        stdout=subprocess.PIPE, universal_newlines=True, cwd=tool_dir, check=True
+    )
+    names = json.loads(imported.stdout)
+    assert {'save_version', 'restore_version', 'search_versions', 'main'} <= set(names)
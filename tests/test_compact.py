@@ -0,0 +1,48 @@
+"""
+Tests of the retention policy compacting old versions into packs.
+"""
+import os
+import json
+import shutil
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file
+from test_restore import version_name, read_sources
+
+
+def test_restore_packed_version(project):
+    script_dir, project_dir = project
+    with open(os.path.join(script_dir, core.SETTINGS_FILE_NAME), 'w', encoding='utf-8') as outfile:
+        json.dump({'keep_last': 1, 'keep_daily': 0, 'keep_weekly': 0}, outfile)
+    states, versions = [], []
+    for number in range(3):
+        write_file(project_dir, 'src/module_0.py', f"# state {number}\n")
+        write_file(project_dir, f"src/added_{number}.py", f"# added {number}\n")
+        states.append(read_sources(project_dir))
+        versions.append(version_name(core.save_version(script_dir, project_dir)))
+
+    result = core.compact_versions(script_dir)
+
+    assert result['packed'] == versions[:2]
+    assert result['kept_count'] == 1
+    assert os.path.isfile(result['pack_file'])
+    for version in versions[:2]:
+        assert not os.path.exists(os.path.join(script_dir, version))
+    records = {record['name']: record['state'] for record in core.list_versions(script_dir, details=True)}
+    assert records[versions[0]] == core.PACKED
+    # Only the versions left in their folders can be archived
+    assert core.list_versions(script_dir, states=(core.SAVED,)) == versions[2:]
+    assert core.count_versions(script_dir, states=(core.SAVED,)) == 1
+    # Nothing is left to compact
+    assert core.compact_versions(script_dir)['packed'] == []
+    with pytest.raises(ValueError):
+        core.archive_version(versions[0], script_dir)
+
+    shutil.rmtree(project_dir)
+    core.restore_version(versions[0], script_dir, project_dir)
+    assert read_sources(project_dir) == states[0]
+    # The kept version still restores on top of the packed one
+    core.restore_version(versions[2], script_dir, project_dir)
+    assert read_sources(project_dir) == states[2]
@@ -0,0 +1,70 @@
+"""
+Tests of the concat snapshot of a version and of its byte-offset index.
+"""
+import os
+import json
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file, read_tree
+
+
+def test_index_reads_each_file_of_the_snapshot(project):
+    script_dir, project_dir = project
+    write_file(project_dir, 'src/windows.py', b"# crlf\r\nline\r\n")
+    first = core.save_version(script_dir, project_dir)
+    write_file(project_dir, 'src/module_0.py', "# changed\n")
+    second = core.save_version(script_dir, project_dir)
+    sources = {path: data for path, data in read_tree(project_dir).items() if path.endswith(core.SOURCE_EXTENSIONS)}
+
+    # Reused sections of the incremental save are indexed like rebuilt ones
+    with core.open_concat(os.path.basename(second['version_folder']), script_dir) as reader:
+        assert sorted(reader) == sorted(sources)
+        for path, data in sources.items():
+            assert reader.read_text(path) == data.decode('utf-8').replace('\r\n', '\n')
+        with core.open_concat(os.path.basename(first['version_folder']), script_dir) as parent:
+            assert parent.compare(reader) == {'added': [], 'removed': [], 'changed': ['src/module_0.py']}
+
+
+def test_index_is_built_for_older_versions(project):
+    script_dir, project_dir = project
+    saved = core.save_version(script_dir, project_dir)
+    version = os.path.basename(saved['version_folder'])
+    with core.open_concat(version, script_dir) as reader:
+        saved_index = dict(reader.index)
+    manifest = core.load_manifest(saved['version_folder'])
+    # A version saved before indexes existed has none
+    os.remove(core.concat_index_file(os.path.join(saved['version_folder'], manifest['concat_file'])))
+
+    with core.open_concat(version, script_dir) as reader:
+        assert reader.index == saved_index
+
+
+@pytest.mark.parametrize('gzip', [False, True])
+def test_sharded_snapshot_skips_binary_and_large_files(project, gzip):
+    script_dir, project_dir = project
+    write_file(script_dir, core.SETTINGS_FILE_NAME, json.dumps({
+        'concat_max_file_bytes': 300, 'concat_shard_bytes': 1000, 'concat_gzip': gzip
+    }))
+    write_file(project_dir, 'src/blob.py', b"#" * 100 + b"\0" + b"#" * 100)
+    sources = {path: data for path, data in read_tree(project_dir).items() if path.endswith(core.SOURCE_EXTENSIONS)}
+    large = {path for path, data in sources.items() if len(data) > 300}
+    assert large
+
+    saved = core.save_version(script_dir, project_dir)
+
+    manifest = core.load_manifest(saved['version_folder'])
+    with open(core.concat_index_file(os.path.join(saved['version_folder'], manifest['concat_file'])), 'r') as infile:
+        index = json.load(infile)
+    assert len(index['concat_files']) > 1
+    assert all(name.endswith(core.CONCAT_GZIP_SUFFIX) == gzip for name in index['concat_files'])
+    assert index['skipped'] == dict({'src/blob.py': 'binary'}, **{path: 'size' for path in large})
+    with core.open_concat(os.path.basename(saved['version_folder']), script_dir) as reader:
+        assert sorted(reader) == sorted(set(sources) - large - {'src/blob.py'})
+        for path in reader:
+            assert reader.read_text(path) == sources[path].decode('utf-8')
+    # Sections are never split across parts
+    for name in index['concat_files']:
+        with core.open_concat_part(os.path.join(saved['version_folder'], name)) as part:
+            assert part.read().endswith(core.CONCAT_TRAILER)
@@ -0,0 +1,50 @@
+"""
+Tests of comparing two versions: by manifest, and as a unified diff.
+"""
+import os
+
+import concatcode_core as core
+from conftest import write_file
+
+
+def test_diff_between_versions(project):
+    script_dir, project_dir = project
+    old = os.path.basename(core.save_version(script_dir, project_dir)['version_folder'])
+    write_file(project_dir, 'src/module_0.py', "# module 0\n# added line\n")
+    write_file(project_dir, 'assets/image_3.bin', b"\0\1\2")
+    write_file(project_dir, 'src/new.py', "# new\n")
+    os.remove(os.path.join(project_dir, 'web', 'module_2.js'))
+    new = os.path.basename(core.save_version(script_dir, project_dir)['version_folder'])
+
+    result = core.diff_versions(old, new, script_dir)
+
+    assert result['added'] == ['src/new.py']
+    assert result['removed'] == ['web/module_2.js']
+    assert result['modified'] == ['assets/image_3.bin', 'src/module_0.py']
+    assert core.diff_versions(old, new, script_dir, patterns=['src/*'])['modified'] == ['src/module_0.py']
+
+    lines = list(core.iter_version_diff(old, new, script_dir))
+
+    assert f"Only in {old}: web/module_2.js\n" in lines
+    assert f"Only in {new}: src/new.py\n" in lines
+    assert f"Binary files {old}/assets/image_3.bin and {new}/assets/image_3.bin differ\n" in lines
+    assert f"--- {old}/src/module_0.py\n" in lines
+    assert "+# added line\n" in lines
+    assert " # module 0\n" in lines
+
+
+def test_diff_reads_archived_versions_in_place(project, monkeypatch):
+    script_dir, project_dir = project
+    old = os.path.basename(core.save_version(script_dir, project_dir)['version_folder'])
+    write_file(project_dir, 'src/module_0.py', "# module 0\n# added line\n")
+    # Binary past the first bytes only, so it is compared as text
+    write_file(project_dir, 'src/module_4.py', "#\n" * core.BINARY_SNIFF_SIZE + "\0\n")
+    new = os.path.basename(core.save_version(script_dir, project_dir)['version_folder'])
+    core.archive_version(old, script_dir)
+    monkeypatch.setattr(core.tempfile, 'TemporaryFile', None)
+
+    lines = list(core.iter_version_diff(old, new, script_dir))
+
+    assert "+# added line\n" in lines
+    assert f"--- {old}/src/module_4.py\n" in lines
+    assert "+\0\n" in lines
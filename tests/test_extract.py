@@ -0,0 +1,43 @@
+"""
+Tests of extracting a backup ZIP, including incremental backups whose
+unchanged files live in the backups of earlier, possibly archived, versions.
+"""
+import os
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file, read_tree
+
+
+def test_extract_incremental_backup_from_its_chain(project):
+    script_dir, project_dir = project
+    first = core.save_version(script_dir, project_dir)
+    write_file(project_dir, 'src/module_0.py', "# changed\n")
+    second = core.save_version(script_dir, project_dir)
+    contents = read_tree(project_dir)
+    # The unchanged files are only in the backup of the archived first version
+    core.archive_version(os.path.basename(first['version_folder']), script_dir)
+
+    result = core.extract_version(second['zip_file'], script_dir, project_dir=project_dir)
+
+    assert read_tree(result['extract_folder']) == contents
+    assert result['file_count'] == len(contents)
+    mtime_ns = os.stat(os.path.join(project_dir, 'web', 'module_6.js')).st_mtime_ns
+    extracted_ns = os.stat(os.path.join(result['extract_folder'], 'web', 'module_6.js')).st_mtime_ns
+    # ZIP times are kept to the two seconds
+    assert abs(extracted_ns - mtime_ns) < 2 * 10**9
+
+
+def test_extract_selected_members(project):
+    script_dir, project_dir = project
+    saved = core.save_version(script_dir, project_dir)
+    contents = read_tree(project_dir)
+
+    result = core.extract_version(saved['zip_file'], script_dir, patterns=['src/util/', '*.js'], project_dir=project_dir)
+
+    assert read_tree(result['extract_folder']) == {
+        path: data for path, data in contents.items() if path.startswith('src/util/') or path.endswith('.js')
+    }
+    with pytest.raises(FileNotFoundError):
+        core.extract_version(saved['zip_file'], script_dir, patterns=['*.rs'], project_dir=project_dir)
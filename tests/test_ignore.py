@@ -0,0 +1,72 @@
+"""
+Tests of the ignore rules applied when walking the project.
+"""
+import shutil
+import subprocess
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file
+
+IGNORED_PROJECT = {
+    '.gitignore': "*.log\n!keep.log\nbuild/\n/top.txt\ndocs/**/*.tmp\na?c.txt\n[xy]*.cfg\n**/cache\n# comment\n\\#hash.txt\n",
+    'main.py': "",
+    'debug.log': "",
+    'keep.log': "",
+    'top.txt': "",
+    'abc.txt': "",
+    'abbc.txt': "",
+    'x1.cfg': "",
+    'z1.cfg': "",
+    '#hash.txt': "",
+    'build/out.py': "",
+    'src/build/out.py': "",
+    'src/top.txt': "",
+    'src/cache/data.py': "",
+    'src/cache.py': "",
+    'src/trace.log': "",
+    'docs/a.tmp': "",
+    'docs/guide/b.tmp': "",
+    'docs/guide/c.md': "",
+    'sub/.gitignore': "*.dat\n!important.dat\n/local.txt\nkeep.log\n",
+    'sub/data.dat': "",
+    'sub/important.dat': "",
+    'sub/local.txt': "",
+    'sub/deeper/local.txt': "",
+    'sub/deeper/more.dat': "",
+    'sub/keep.log': "",
+}
+
+
+def walked_paths(project_dir):
+    return {core.manifest_path(project_file) for project_file in core.walk_project(project_dir)}
+
+
+def test_ignore_rules_match_git(tmp_path):
+    if shutil.which('git') is None:
+        pytest.skip("git is not installed")
+    project_dir = str(tmp_path / 'project')
+    for path, data in IGNORED_PROJECT.items():
+        write_file(project_dir, path, data)
+    subprocess.run(['git', 'init', '-q', project_dir], check=True)
+
+    checked = subprocess.run(
+        ['git', 'check-ignore', '--stdin'], cwd=project_dir, input='\n'.join(IGNORED_PROJECT),
+        stdout=subprocess.PIPE, universal_newlines=True, check=False
+    )
+    ignored_by_git = set(checked.stdout.split())
+
+    assert walked_paths(project_dir) == set(IGNORED_PROJECT) - ignored_by_git
+
+
+def test_tool_ignore_file_and_default_rules(project):
+    _, project_dir = project
+    write_file(project_dir, core.IGNORE_FILE_NAME, "*.md\nassets/\n")
+    write_file(project_dir, '.git/HEAD', "ref: refs/heads/main\n")
+
+    walked = walked_paths(project_dir)
+
+    assert 'src/module_0.py' in walked
+    assert 'README.md' not in walked
+    assert not any(path.startswith(('assets/', '.git/')) for path in walked)
@@ -0,0 +1,63 @@
+"""
+Tests of the metrics recorded for each operation.
+"""
+import os
+import json
+import pstats
+
+import concatcode_core as core
+from conftest import write_file
+
+
+def read_metrics(script_dir):
+    with open(os.path.join(script_dir, core.METRICS_FILE_NAME), 'r', encoding='utf-8') as infile:
+        return [json.loads(line) for line in infile]
+
+
+def test_operations_append_their_metrics(project):
+    script_dir, project_dir = project
+    first = core.save_version(script_dir, project_dir)
+    write_file(project_dir, 'src/module_0.py', "# changed\n")
+    write_file(project_dir, 'src/new.py', "# new\n")
+
+    second = core.save_version(script_dir, project_dir)
+    core.restore_version(os.path.basename(first['version_folder']), script_dir, project_dir)
+
+    counters = second['metrics']['counters']
+    assert counters['files_read'] == 2
+    assert counters['files_reused'] == second['file_count'] - 2
+    records = read_metrics(script_dir)
+    assert [record['operation'] for record in records] == ['save', 'save', 'restore']
+    assert records[1] == second['metrics']
+    assert {'walk', 'read', 'manifest'} <= set(records[0]['phases'])
+    assert records[0]['counters']['files_read'] == first['file_count']
+    assert 0 < records[0]['compression_ratio'] < 1
+
+
+def test_profiling_writes_stats(tmp_path):
+    profile_file = str(tmp_path / 'save.prof')
+    with core.profiling(profile_file):
+        sum(range(1000))
+    assert pstats.Stats(profile_file).total_calls > 0
+    with core.profiling(None):
+        pass
+
+
+def test_save_counts_unreadable_files(project, monkeypatch):
+    script_dir, project_dir = project
+    unreadable = os.path.join(project_dir, 'src', 'module_4.py')
+    real_open = open
+
+    def failing_open(file, *args, **kwargs):
+        if file == unreadable:
+            raise PermissionError(f"Permission denied: {file}")
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', failing_open)
+    result = core.save_version(script_dir, project_dir)
+    monkeypatch.undo()
+
+    assert result['failed_count'] == 1
+    assert result['metrics']['counters']['files_failed'] == 1
+    assert 'src/module_4.py' not in {entry['path'] for entry in core.load_manifest(result['version_folder'])['files']}
+    assert core.save_version(script_dir, project_dir)['failed_count'] == 0
@@ -0,0 +1,96 @@
+"""
+Tests of restoring a version into the project.
+"""
+import os
+import random
+import shutil
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file, read_tree
+
+
+def version_name(result):
+    return os.path.basename(result['version_folder'])
+
+
+def read_sources(project_dir):
+    """Read the files a restore brings back: the source files."""
+    return {path: data for path, data in read_tree(project_dir).items() if path.endswith(core.SOURCE_EXTENSIONS)}
+
+
+def test_restore_writes_only_changed_files(project):
+    script_dir, project_dir = project
+    saved = read_sources(project_dir)
+    version = version_name(core.save_version(script_dir, project_dir))
+    write_file(project_dir, 'src/module_0.py', "# changed\n")
+    os.remove(os.path.join(project_dir, 'web', 'module_2.js'))
+    untouched = os.stat(os.path.join(project_dir, 'src', 'util', 'module_1.py'))
+
+    dry_run = core.restore_version(version, script_dir, project_dir, dry_run=True)
+
+    assert sorted(dry_run['files']) == ['src/module_0.py', 'web/module_2.js']
+    assert dry_run['unchanged_count'] == len(saved) - 2
+    # A dry run writes nothing
+    assert read_tree(project_dir)['src/module_0.py'] == b"# changed\n"
+    assert not os.path.exists(os.path.join(project_dir, 'web', 'module_2.js'))
+
+    result = core.restore_version(version, script_dir, project_dir)
+
+    assert sorted(result['files']) == ['src/module_0.py', 'web/module_2.js']
+    assert result['bytes'] == len(saved['src/module_0.py']) + len(saved['web/module_2.js'])
+    assert read_sources(project_dir) == saved
+    # Files already up to date are not rewritten
+    assert os.stat(os.path.join(project_dir, 'src', 'util', 'module_1.py')).st_ino == untouched.st_ino
+    assert core.restore_version(version, script_dir, project_dir)['files'] == []
+
+
+def test_restore_recreates_tree_with_saved_times(project):
+    script_dir, project_dir = project
+    saved = read_sources(project_dir)
+    mtime_ns = os.stat(os.path.join(project_dir, 'src', 'util', 'module_5.py')).st_mtime_ns
+    version = version_name(core.save_version(script_dir, project_dir))
+    shutil.rmtree(project_dir)
+
+    core.restore_version(version, script_dir, project_dir)
+
+    assert read_sources(project_dir) == saved
+    assert os.stat(os.path.join(project_dir, 'src', 'util', 'module_5.py')).st_mtime_ns == mtime_ns
+
+
+@pytest.mark.parametrize('kernel_copies', [True, False])
+def test_copy_file_data_copies_exactly(tmp_path, monkeypatch, kernel_copies):
+    data = random.Random(1).randbytes(3 * 1024 * 1024 + 17)
+    source_file = write_file(str(tmp_path), 'source.bin', data)
+    dest_file = write_file(str(tmp_path), 'dest.bin', b"longer previous content" * 1000000)
+    if not kernel_copies:
+        def unsupported(*args):
+            raise OSError("Operation not supported")
+        monkeypatch.setattr(core, 'reflink', lambda infile, outfile: False)
+        monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+        monkeypatch.setattr(os, 'sendfile', unsupported)
+
+    core.copy_file_data(source_file, dest_file)
+
+    with open(dest_file, 'rb') as infile:
+        assert infile.read() == data
+
+
+def test_run_parallel_keeps_order_and_stops_on_failure():
+    reports = []
+    tracker = core.ProgressTracker(reports.append)
+    results = list(core.run_parallel(lambda item: item * 2, range(50), 4, tracker, item_bytes=lambda item: 1))
+
+    assert results == [(item, item * 2) for item in range(50)]
+    tracker.report(force=True)
+    assert reports[-1]['files_done'] == 50
+    assert reports[-1]['bytes_done'] == 50
+
+    def failing(item):
+        if item == 3:
+            raise ValueError(item)
+        return item
+
+    with pytest.raises(ValueError):
+        list(core.run_parallel(failing, range(50), 4))
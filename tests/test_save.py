@@ -0,0 +1,139 @@
+"""
+Tests of saving a version: the single scan feeding the concat file, the
+Source copy and the ZIP backup, incremental saves against the parent, and
+progress and cancellation.
+"""
+import os
+import time
+import hashlib
+import zipfile
+import threading
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file, read_tree, read_concat, snapshot
+
+
+def test_single_scan_feeds_every_sink(project):
+    script_dir, project_dir = project
+    contents = read_tree(project_dir)
+    sources = {path: data for path, data in contents.items() if path.endswith(core.SOURCE_EXTENSIONS)}
+
+    saved = snapshot(project_dir, os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00'))
+
+    concat = read_concat(saved['concat_file'])
+    for path, data in sources.items():
+        assert f"// File: {os.path.basename(path)}\n{data.decode('utf-8')}\n{core.SEPARATOR}\n" in concat
+    assert "// File: README.md" not in concat
+    assert read_tree(saved['source']) == {os.path.basename(path): data for path, data in sources.items()}
+    with zipfile.ZipFile(saved['zip_file']) as backup:
+        assert backup.testzip() is None
+        assert {name: backup.read(name) for name in backup.namelist()} == contents
+    assert sorted(entry['path'] for entry in saved['entries']) == sorted(contents)
+    for entry in saved['entries']:
+        assert entry['hash'] == hashlib.sha256(contents[entry['path']]).hexdigest()
+
+
+def test_unreadable_file_is_left_out(project, monkeypatch):
+    script_dir, project_dir = project
+    unreadable = os.path.join(project_dir, 'src', 'module_4.py')
+    real_open = open
+    logged = []
+
+    def failing_open(file, *args, **kwargs):
+        if file == unreadable:
+            raise PermissionError(f"Permission denied: {file}")
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr('builtins.open', failing_open)
+    monkeypatch.setattr(core.logging, 'error', lambda message, **kwargs: logged.append(message))
+    saved = snapshot(project_dir, os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00'))
+    monkeypatch.undo()
+
+    assert logged == [f"Failed to process file {unreadable}."]
+    concat = read_concat(saved['concat_file'])
+    assert "// File: module_4.py" not in concat
+    assert "// File: module_8.py" in concat
+    assert not os.path.exists(os.path.join(saved['source'], 'module_4.py'))
+    assert 'src/module_4.py' not in {entry['path'] for entry in saved['entries']}
+    with zipfile.ZipFile(saved['zip_file']) as backup:
+        assert backup.testzip() is None
+        assert 'src/module_4.py' not in backup.namelist()
+        assert 'src/module_8.py' in backup.namelist()
+
+
+def test_incremental_snapshot_reuses_parent(project):
+    script_dir, project_dir = project
+    first_folder = os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00')
+    scan_started_ns = time.time_ns()
+    first = snapshot(project_dir, first_folder)
+    core.write_manifest(first_folder, {'scan_started_ns': scan_started_ns, 'files': first['entries']})
+    write_file(project_dir, 'src/module_0.py', "# changed\n")
+    write_file(project_dir, 'src/new.py', "# new\n")
+
+    parent_name, parent_manifest = core.find_parent_version(script_dir)
+    assert parent_name == os.path.basename(first_folder)
+    second_folder = os.path.join(script_dir, 'version_0.02_2024-01-01_11-00-00')
+    second = snapshot(
+        project_dir, second_folder, first_folder,
+        {entry['path']: entry for entry in parent_manifest['files']}, parent_manifest['scan_started_ns']
+    )
+
+    # Only the changed files are in the ZIP of the incremental save
+    with zipfile.ZipFile(second['zip_file']) as backup:
+        assert sorted(backup.namelist()) == ['src/module_0.py', 'src/new.py']
+        assert backup.comment == (core.PARENT_COMMENT_PREFIX + parent_name).encode('utf-8')
+    first_entries = {entry['path']: entry for entry in first['entries']}
+    for entry in second['entries']:
+        if entry['path'] in ('src/module_0.py', 'src/new.py'):
+            assert entry['zip'] == os.path.basename(second_folder)
+        else:
+            assert entry['zip'] == parent_name
+            assert entry['hash'] == first_entries[entry['path']]['hash']
+    # Reused concat sections and Source copies match the project as it is now
+    concat = read_concat(second['concat_file'])
+    assert "// File: module_0.py\n# changed\n" in concat
+    assert "// File: module_1.py\n# module 1\n" in concat
+    sources = read_tree(project_dir)
+    assert read_tree(second['source']) == {
+        os.path.basename(path): data for path, data in sources.items() if path.endswith(core.SOURCE_EXTENSIONS)
+    }
+
+
+def test_progress_reports_every_file(project):
+    script_dir, project_dir = project
+    reports = []
+    tracker = core.ProgressTracker(reports.append)
+
+    saved = snapshot(project_dir, os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00'), tracker=tracker)
+
+    total = sum(len(data) for data in read_tree(project_dir).values())
+    assert reports[-1]['files_done'] == len(saved['entries'])
+    assert reports[-1]['bytes_done'] == total
+
+
+def test_cancelled_snapshot_stops(project):
+    script_dir, project_dir = project
+    cancel_event = threading.Event()
+    # Cancelled as soon as the first progress report comes
+    tracker = core.ProgressTracker(lambda progress: cancel_event.set(), cancel_event)
+    with pytest.raises(core.OperationCancelled):
+        snapshot(project_dir, os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00'), tracker=tracker)
+    # No partial object is left behind
+    assert os.listdir(os.path.join(script_dir, core.OBJECTS_DIR_NAME, 'tmp')) == []
+
+
+def test_store_files_are_not_saved(project):
+    _, project_dir = project
+    # The default layout: versions kept beside the tool, inside the project
+    script_dir = os.path.join(project_dir, 'ConcatCode')
+    write_file(script_dir, core.SETTINGS_FILE_NAME, "{}")
+    write_file(script_dir, core.BENCH_BASELINE_NAME, "{}")
+    core.save_version(script_dir, project_dir)
+
+    result = core.save_version(script_dir, project_dir)
+
+    paths = {entry['path'] for entry in core.load_manifest(result['version_folder'])['files']}
+    assert 'src/module_0.py' in paths
+    assert not any(path.startswith('ConcatCode/') for path in paths)
@@ -0,0 +1,37 @@
+"""
+Tests of searching the text of every saved version.
+"""
+import pytest
+
+import concatcode_core as core
+import concatcode_search as search
+from conftest import write_file
+from test_restore import version_name
+
+
+def test_search_finds_lines_across_versions(project):
+    script_dir, project_dir = project
+    write_file(project_dir, 'src/config.py', "name = 'alpha'\nTIMEOUT = 30\n")
+    first = version_name(core.save_version(script_dir, project_dir))
+    write_file(project_dir, 'src/config.py', "name = 'alpha'\ntimeout = 60\n")
+    second = version_name(core.save_version(script_dir, project_dir))
+    # An archived version is still searched
+    core.archive_version(first, script_dir)
+
+    matches = search.search_versions('timeout', script_dir)
+
+    assert [(match['path'], match['versions'], match['lines']) for match in matches] == [
+        ('src/config.py', [second], [[2, "timeout = 60"]])
+    ]
+    matches = search.search_versions('timeout', script_dir, ignore_case=True)
+    assert [(match['versions'], match['lines']) for match in matches] == [
+        ([second], [[2, "timeout = 60"]]), ([first], [[2, "TIMEOUT = 30"]])
+    ]
+    # The same content in both versions is one match
+    matches = search.search_versions("# module 13", script_dir)
+    assert [(match['path'], match['versions']) for match in matches] == [('src/util/module_13.py', [second, first])]
+    assert matches[0]['lines'] == [[number, "# module 13"] for number in range(1, 15)]
+    assert search.search_versions('# module 6', script_dir, patterns=['src/*']) == []
+    assert search.search_versions('# module 6', script_dir, patterns=['web/*'])[0]['path'] == 'web/module_6.js'
+    with pytest.raises(ValueError):
+        search.search_versions('', script_dir)
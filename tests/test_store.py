@@ -0,0 +1,126 @@
+"""
+Tests of the store: the object store shared by the versions and the catalog
+of their numbers.
+"""
+import os
+import sys
+import threading
+import subprocess
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file, snapshot
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def stored_objects(script_dir):
+    objects_dir = os.path.join(script_dir, core.OBJECTS_DIR_NAME)
+    return {
+        prefix + name
+        for prefix in os.listdir(objects_dir)
+        if prefix != 'tmp' and os.path.isdir(os.path.join(objects_dir, prefix))
+        for name in os.listdir(os.path.join(objects_dir, prefix))
+    }
+
+
+def test_identical_contents_are_stored_once(project):
+    script_dir, project_dir = project
+    write_file(project_dir, 'copy/module_1.py', "# module 1\n" * 2)
+    write_file(project_dir, 'copy/same.py', "# module 1\n" * 2)
+
+    saved = snapshot(project_dir, os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00'))
+
+    sources = [entry for entry in saved['entries'] if entry['path'].endswith(core.SOURCE_EXTENSIONS)]
+    assert stored_objects(script_dir) == {entry['hash'] for entry in sources}
+    assert len(stored_objects(script_dir)) == len(sources) - 2
+    # Objects are shared between versions, so they are read-only
+    stored = core.object_path(os.path.join(script_dir, core.OBJECTS_DIR_NAME), sources[0]['hash'])
+    assert os.stat(stored).st_mode & 0o222 == 0
+
+
+def test_collect_garbage_keeps_referenced_objects(project):
+    script_dir, project_dir = project
+    first_folder = os.path.join(script_dir, 'version_0.01_2024-01-01_10-00-00')
+    first = snapshot(project_dir, first_folder)
+    core.write_manifest(first_folder, {'files': first['entries']})
+    write_file(project_dir, 'src/module_0.py', "# changed\n")
+    second_folder = os.path.join(script_dir, 'version_0.02_2024-01-01_11-00-00')
+    second = snapshot(project_dir, second_folder)
+    core.write_manifest(second_folder, {'files': second['entries']})
+    old_hash = next(entry['hash'] for entry in first['entries'] if entry['path'] == 'src/module_0.py')
+
+    assert core.collect_garbage(script_dir)['removed'] == 0
+    core.remove_tree(first_folder)
+    result = core.collect_garbage(script_dir)
+
+    assert result == {'removed': 1, 'freed_bytes': len("# module 0\n")}
+    assert stored_objects(script_dir) == {
+        entry['hash'] for entry in second['entries'] if entry['path'].endswith(core.SOURCE_EXTENSIONS)
+    }
+    assert old_hash not in stored_objects(script_dir)
+
+
+def test_collect_garbage_waits_for_other_processes(project):
+    if core.fcntl is None:
+        pytest.skip("Sharing the store between processes needs shared file locks")
+    script_dir, project_dir = project
+    core.save_version(script_dir, project_dir)
+    # Another process using the store, until told to stop
+    user = subprocess.Popen(
+        [sys.executable, '-c', (
+            "import sys, concatcode_core as core\n"
+            f"with core.STORE_LOCK.shared({script_dir!r}):\n"
+            "    print('locked', flush=True)\n"
+            "    sys.stdin.readline()\n"
+        )],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, cwd=REPO_DIR
+    )
+    try:
+        assert user.stdout.readline() == "locked\n"
+        collected = threading.Event()
+        collector = threading.Thread(target=lambda: (core.collect_garbage(script_dir), collected.set()))
+        collector.start()
+        assert not collected.wait(0.5)
+    finally:
+        user.communicate("\n", timeout=10)
+    assert collected.wait(10)
+    collector.join()
+
+
+def test_version_numbers_are_exact_hundredths():
+    assert core.parse_version_number('0.99') == 99
+    assert core.parse_version_number('1.5') == 150
+    assert core.format_version_number(99 + 1) == '1.00'
+    assert core.format_version_number(core.parse_version_number('12.07')) == '12.07'
+
+
+def test_catalog_numbers_after_older_versions(project):
+    script_dir, project_dir = project
+    # Versions saved before the catalog: folders with a Source copy only
+    for version in ('0.09', '0.10', '0.99'):
+        write_file(script_dir, f"version_{version}_2024-01-01_10-00-00/Source/main.py", "# old\n")
+
+    result = core.save_version(script_dir, project_dir)
+
+    assert result['version'] == '1.00'
+    assert core.list_versions(script_dir) == [
+        'version_0.09_2024-01-01_10-00-00', 'version_0.10_2024-01-01_10-00-00',
+        'version_0.99_2024-01-01_10-00-00', os.path.basename(result['version_folder'])
+    ]
+
+
+def test_archived_version_number_is_not_reused(project):
+    script_dir, project_dir = project
+    core.save_version(script_dir, project_dir)
+    second = core.save_version(script_dir, project_dir)
+    core.archive_version(os.path.basename(second['version_folder']), script_dir)
+
+    third = core.save_version(script_dir, project_dir)
+
+    assert third['version'] == '0.03'
+    assert os.path.basename(second['version_folder']) not in core.list_versions(script_dir)
+    # The catalog is rebuilt the same from the folders and archives
+    os.remove(os.path.join(script_dir, core.CATALOG_NAME))
+    assert core.get_next_version(script_dir) == '0.04'
@@ -0,0 +1,83 @@
+"""
+Tests of verifying the stored copies of a version, and of resuming a save
+interrupted by a crash.
+"""
+import os
+import shutil
+import zipfile
+import multiprocessing
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file, read_tree
+from test_restore import version_name, read_sources
+
+
+def test_verify_finds_corrupted_copy(project):
+    script_dir, project_dir = project
+    result = core.save_version(script_dir, project_dir)
+    version = version_name(result)
+
+    verified = core.verify_version(version, script_dir)
+    assert verified['failures'] == []
+    assert verified['file_count'] == result['file_count']
+
+    entry = next(entry for entry in core.load_manifest(result['version_folder'])['files']
+                 if entry['path'] == 'src/module_0.py')
+    object_file = core.object_path(os.path.join(script_dir, core.OBJECTS_DIR_NAME), entry['hash'])
+    os.chmod(object_file, 0o644)
+    write_file(script_dir, os.path.relpath(object_file, script_dir).replace(os.sep, '/'), "# corrupted\n")
+
+    failures = core.verify_version(version, script_dir)['failures']
+    assert [(failure['kind'], failure['path']) for failure in failures] == [('object', 'src/module_0.py')]
+
+
+def test_save_resumes_after_crash(project):
+    if core.fcntl is None or 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("Resuming needs file locks and fork")
+    script_dir, project_dir = project
+    saved = read_tree(project_dir)
+    sources = read_sources(project_dir)
+
+    def crash_during_save():
+        # Journal every file, and stop the process after a few checkpoints
+        core.JOURNAL_INTERVAL = 0
+        checkpoint = core.SaveJournal.checkpoint
+        calls = []
+
+        def crashing_checkpoint(journal, sinks):
+            checkpoint(journal, sinks)
+            calls.append(None)
+            if len(calls) == 10:
+                os._exit(1)
+
+        core.SaveJournal.checkpoint = crashing_checkpoint
+        core.save_version(script_dir, project_dir)
+
+    child = multiprocessing.get_context('fork').Process(target=crash_during_save)
+    child.start()
+    child.join()
+    assert child.exitcode == 1
+    interrupted = [name for name in os.listdir(script_dir) if core.parse_version_name(name)]
+    assert len(interrupted) == 1
+    _, journaled = core.load_journal(os.path.join(script_dir, interrupted[0], core.JOURNAL_NAME))
+    assert len(journaled) == 10
+
+    result = core.save_version(script_dir, project_dir)
+
+    assert result['resumed']
+    assert version_name(result) == interrupted[0]
+    assert result['metrics']['counters']['files_resumed'] == 10
+    assert result['metrics']['counters']['files_read'] == len(saved) - 10
+    assert result['file_count'] == len(saved)
+    for name in (core.IN_PROGRESS_MARKER, core.JOURNAL_NAME, core.RESUME_DIR_NAME):
+        assert not os.path.exists(os.path.join(result['version_folder'], name))
+    with zipfile.ZipFile(result['zip_file']) as backup:
+        assert backup.testzip() is None
+        assert {name: backup.read(name) for name in backup.namelist()} == saved
+    assert core.verify_version(version_name(result), script_dir)['failures'] == []
+
+    shutil.rmtree(project_dir)
+    core.restore_version(version_name(result), script_dir, project_dir)
+    assert read_sources(project_dir) == sources
@@ -0,0 +1,88 @@
+"""
+Tests of the watch mode: changes are coalesced into one save once the
+project is quiet, and later saves only process the changed paths.
+"""
+import os
+import json
+import time
+import threading
+
+import pytest
+
+import concatcode_core as core
+import concatcode_watch as watch
+from conftest import write_file, read_tree
+
+DEBOUNCE = 0.4
+
+
+@pytest.fixture(params=[True, False], ids=['inotify', 'polling'])
+def watched(request, project, monkeypatch):
+    """
+    A watch running on the project in a thread, once it watches the project.
+
+    Returns:
+        tuple: (store directory, project directory, list of the save results).
+    """
+    script_dir, project_dir = project
+    write_file(script_dir, core.SETTINGS_FILE_NAME, json.dumps({
+        'watch_debounce': DEBOUNCE, 'watch_min_interval': 0, 'watch_poll_interval': 0.05
+    }))
+    ready = threading.Event()
+    real_open_watcher = watch.open_watcher
+
+    def open_watcher(*args):
+        watcher = real_open_watcher(*args)
+        ready.set()
+        return watcher
+
+    monkeypatch.setattr(watch, 'open_watcher', open_watcher)
+    cancel_event = threading.Event()
+    saves = []
+    thread = threading.Thread(
+        target=watch.watch_project,
+        args=(script_dir, project_dir, None, cancel_event, saves.append, request.param)
+    )
+    thread.start()
+    assert ready.wait(10)
+    yield script_dir, project_dir, saves
+    cancel_event.set()
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def wait_for_saves(saves, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(saves) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return len(saves)
+
+
+def test_burst_of_changes_gives_one_save(watched):
+    script_dir, project_dir, saves = watched
+    for number in range(5):
+        write_file(project_dir, f"src/module_{number * 4}.py", f"# burst {number}\n")
+        time.sleep(DEBOUNCE / 8)
+
+    assert wait_for_saves(saves, 1) == 1
+    time.sleep(DEBOUNCE * 2)
+    assert len(saves) == 1
+
+    # Ignored files and the tool's own files do not trigger saves
+    write_file(project_dir, '.gitignore', "*.log\n")
+    assert wait_for_saves(saves, 2) == 2
+    write_file(project_dir, 'debug.log', "ignored\n")
+    time.sleep(DEBOUNCE * 3)
+    assert len(saves) == 2
+
+    # A save of the changed paths only holds the same files as a full walk
+    write_file(project_dir, 'src/util/module_1.py', "# changed\n")
+    os.remove(os.path.join(project_dir, 'web', 'module_2.js'))
+    write_file(project_dir, 'new/module.py', "# new\n")
+    assert wait_for_saves(saves, 3) == 3
+    manifest = core.load_manifest(saves[-1]['version_folder'])
+    contents = read_tree(project_dir)
+    del contents['debug.log']
+    assert {entry['path']: entry['size'] for entry in manifest['files']} == {
+        path: len(data) for path, data in contents.items()
+    }
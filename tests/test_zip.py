@@ -0,0 +1,40 @@
+"""
+Tests of the ZIP files the tool writes.
+"""
+import os
+import random
+import zipfile
+
+import pytest
+
+import concatcode_core as core
+from conftest import write_file
+
+
+@pytest.mark.parametrize('compress_type', [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+def test_parallel_zip_writer_output_is_readable(tmp_path, compress_type):
+    rng = random.Random(1)
+    members = {
+        'empty.txt': b'',
+        'small.py': b"print('hello')\n" * 10,
+        'random.bin': rng.randbytes(300 * 1024),
+        # Several blocks, compressed on different workers
+        'large.txt': b"".join(b"line %d\n" % number for number in range(400000)),
+        'folder/nested/name with spaces.txt': "unicode éè\n".encode('utf-8'),
+    }
+    source_dir = str(tmp_path / 'source')
+    for name, data in members.items():
+        write_file(source_dir, name, data)
+
+    zip_file = str(tmp_path / 'archive.zip')
+    writer = core.ParallelZipWriter(zip_file, workers=4)
+    for name in members:
+        writer.write_file(os.path.join(source_dir, *name.split('/')), name, compress_type)
+    writer.close()
+
+    with zipfile.ZipFile(zip_file) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == sorted(members)
+        for name, data in members.items():
+            assert archive.read(name) == data
+            assert archive.getinfo(name).compress_type == compress_type